@@ -0,0 +1,139 @@
+"""
+Pre-aggregated sales cube behind /api/analytics/rollup.
+
+The cube holds Sales, Quantity, Profit and the order count per (year, quarter, month,
+category, sub-category, region, city): every combination that has orders, a few
+thousand rows whatever the number of orders. A rollup query filters and groups
+those rows, so it never touches the orders frame. ServingState builds the cube at
+load time and merges new orders into it on ingestion.
+"""
+import numpy as np
+import pandas as pd
+
+from data_loader import concat_orders
+
+
+# API dimension name -> cube column
+DIMENSIONS = {
+    "year": "Order_Year",
+    "quarter": "Order_Quarter",
+    "month": "Order_Month",
+    "category": "Category",
+    "sub_category": "Sub-Category",
+    "region": "Region",
+    "city": "City",
+}
+INT_DIMENSIONS = {"year", "quarter", "month"}
+CUBE_MEASURES = ["Sales", "Quantity", "Profit"]
+ORDERS_COL = "Orders"
+MAX_ROLLUP_ROWS = 10000
+
+
+def build_sales_cube(orders: pd.DataFrame) -> pd.DataFrame:
+    dims = [col for col in DIMENSIONS.values() if col in orders.columns]
+    measures = [col for col in CUBE_MEASURES if col in orders.columns]
+    grouped = orders.groupby(dims, observed=True, sort=True)
+    cube = grouped[measures].sum()
+    cube[ORDERS_COL] = grouped.size()
+    return cube.reset_index()
+
+
+def merge_sales_cube(cube: pd.DataFrame, extra: pd.DataFrame) -> pd.DataFrame:
+    """
+    cube with the cells of extra (a cube of new orders) added in.
+    """
+    dims = [col for col in DIMENSIONS.values() if col in cube.columns]
+    measures = [col for col in cube.columns if col not in dims]
+    merged = concat_orders([cube, extra])
+    return merged.groupby(dims, observed=True, sort=True)[measures].sum().reset_index()
+
+
+def _kpis(sales: float, quantity: float, profit: float, orders: int) -> dict:
+    return {
+        "sales": round(float(sales), 2),
+        "quantity": int(quantity),
+        "profit": round(float(profit), 2),
+        "orders": int(orders),
+        "avg_order_value": round(float(sales) / orders, 2) if orders else None,
+        "profit_margin": round(float(profit) / float(sales), 4) if sales else None,
+    }
+
+
+def _period(value, name: str) -> int:
+    """
+    "YYYY-MM" -> months since year 0 (comparable with year * 12 + month - 1).
+    """
+    try:
+        year, month = (int(part) for part in str(value).split("-"))
+    except ValueError:
+        raise ValueError(f"{name} must look like YYYY-MM")
+    if not 1 <= month <= 12:
+        raise ValueError(f"{name} must look like YYYY-MM")
+    return year * 12 + month - 1
+
+
+def rollup(cube: pd.DataFrame, group_by=(), filters=None, period_from=None, period_to=None,
+           sort_by=None, descending: bool = True, limit=None):
+    """
+    Totals + KPIs of the cube cells that pass filters ({dimension: value or [values]})
+    and the inclusive YYYY-MM period range, one row per group_by combination.
+    Raises ValueError on unknown dimensions/measures or malformed values.
+    """
+    group_by = list(group_by or [])
+    filters = dict(filters or {})
+    unknown = [dim for dim in group_by + list(filters) if dim not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions {unknown}; use {sorted(DIMENSIONS)}")
+    if len(set(group_by)) != len(group_by):
+        raise ValueError("group_by lists a dimension twice")
+    limit = MAX_ROLLUP_ROWS if limit is None else int(limit)
+    if limit < 0:
+        raise ValueError("limit must be 0 or more")
+    limit = min(limit, MAX_ROLLUP_ROWS)
+
+    mask = np.ones(len(cube), dtype=bool)
+    for dim, values in filters.items():
+        values = values if isinstance(values, list) else [values]
+        if dim in INT_DIMENSIONS:
+            values = [int(v) for v in values]
+        else:
+            values = [str(v) for v in values]
+        mask &= cube[DIMENSIONS[dim]].isin(values).to_numpy()
+    if period_from is not None or period_to is not None:
+        period = cube["Order_Year"].to_numpy(dtype=np.int64) * 12 + cube["Order_Month"].to_numpy(dtype=np.int64) - 1
+        if period_from is not None:
+            mask &= period >= _period(period_from, "from")
+        if period_to is not None:
+            mask &= period <= _period(period_to, "to")
+    cells = cube[mask]
+
+    measures = CUBE_MEASURES + [ORDERS_COL]
+    totals = _kpis(*(cells[col].sum() for col in measures))
+
+    rows = []
+    if group_by:
+        cols = [DIMENSIONS[dim] for dim in group_by]
+        grouped = cells.groupby(cols, observed=True, sort=True)[measures].sum()
+        for key, sales, quantity, profit, orders in zip(
+            grouped.index, grouped["Sales"], grouped["Quantity"], grouped["Profit"], grouped[ORDERS_COL]
+        ):
+            key = key if isinstance(key, tuple) else (key,)
+            row = {dim: (int(value) if dim in INT_DIMENSIONS else str(value)) for dim, value in zip(group_by, key)}
+            row.update(_kpis(sales, quantity, profit, orders))
+            rows.append(row)
+
+        if sort_by is not None:
+            if sort_by not in totals and sort_by not in group_by:
+                raise ValueError(f"Cannot sort by {sort_by!r}")
+            # Groups with no value for a ratio KPI (e.g. zero sales) go last
+            present = [row for row in rows if row[sort_by] is not None]
+            missing = [row for row in rows if row[sort_by] is None]
+            rows = sorted(present, key=lambda row: row[sort_by], reverse=descending) + missing
+
+    return {
+        "group_by": group_by,
+        "filters": filters,
+        "groups": len(rows),
+        "rows": rows[:limit],
+        "totals": totals,
+    }
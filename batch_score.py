@@ -0,0 +1,337 @@
+"""
+Offline batch scoring with the same feature derivation as the API (features.py).
+
+    python batch_score.py sales orders.csv -o predictions.csv
+    python batch_score.py demand segments.parquet -o demand.ndjson --workers 4
+    python batch_score.py demand --grid-years 2026 -o plan_2026.csv
+
+The input (.csv, .parquet or .ndjson/.jsonl) is read chunk_rows rows at a time;
+columns may use the API field names (category, sub_category, unit_price, ...) or
+the dataset's (Category, Sub-Category, Unit Price, ...). --grid-years scores
+every known segment x month of the given years instead of reading a file.
+
+Chunks are scored in worker processes (features + model predict) and written in
+input order as they finish, with at most 2 chunks per worker in flight, so memory
+stays flat however large the input is. Workers get only the segment stats and time
+defaults, and predict through the compiled fast path (fast_inference.py) when it
+matches the pipeline on a sample (BA_FAST_INFERENCE=0 turns it off). Each output
+row is the input row plus:
+  sales:  predicted_sales
+  demand: predicted_total_quantity, stats_mode
+  error:  empty, or why the row could not be scored (the prediction columns are empty)
+
+Demand rows get the segment stats enrichment of the API (exact month, segment
+fallback, global fallback), from the same dataset/snapshot main.py serves.
+Sales rows get Year/Month/Quarter from the latest order date, like the API, or
+from each row's Order Date with --order-dates.
+
+Parquet input/output needs pyarrow. For medium-sized jobs against a running
+server, see POST /api/predict/{demand,sales}/stream.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import joblib
+import pandas as pd
+
+from data_loader import load_serving_data, format_timings
+from fast_inference import compile_pipeline
+from features import (DEMAND_FEATURES, SALES_FEATURES, INPUT_ALIASES, demand_features, demand_response,
+                      sales_features)
+from serving_state import FeatureContext, ServingState
+
+
+APP_DIR = Path(__file__).parent
+DEFAULT_DATA_PATH = Path(os.environ.get("BA_DATA_PATH", str(APP_DIR / "Ecommerce_Sales_Data_Expanded.csv")))
+DEFAULT_SNAPSHOT_DIR = Path(os.environ.get("BA_SNAPSHOT_DIR", str(APP_DIR / "data_snapshot")))
+MODEL_PATHS = {"demand": APP_DIR / "best_quantity_model.pkl", "sales": APP_DIR / "best_sales_model.pkl"}
+OUTPUT_COLS = {"demand": ["predicted_total_quantity", "stats_mode"], "sales": ["predicted_sales"]}
+DEFAULT_CHUNK_ROWS = 50_000
+FAST_INFERENCE = os.environ.get("BA_FAST_INFERENCE", "1") != "0"
+# Rows the compiled fast path is checked against (in each worker), as in main.py
+FAST_PATH_CHECK_ROWS = 256
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+
+def _need_pyarrow():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet input/output needs pyarrow (pip install pyarrow)")
+    return pq
+
+
+# =============================
+# Input
+# =============================
+def iter_file_chunks(path: Path, chunk_rows: int):
+    if path.suffix == ".parquet":
+        pq = _need_pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif path.suffix in NDJSON_SUFFIXES:
+        with pd.read_json(path, lines=True, chunksize=chunk_rows) as reader:
+            yield from reader
+    else:
+        with pd.read_csv(path, chunksize=chunk_rows) as reader:
+            yield from reader
+
+
+def iter_demand_grid(state: ServingState, years, chunk_rows: int):
+    """
+    Every (category, sub_category, region) with orders x every month of years.
+    """
+    segments = sorted(state.segment_stats)
+    cells = ((*segment, year, month) for year in years for month in range(1, 13) for segment in segments)
+    columns = ["category", "sub_category", "region", "year", "month"]
+    chunk = []
+    for cell in cells:
+        chunk.append(cell)
+        if len(chunk) >= chunk_rows:
+            yield pd.DataFrame(chunk, columns=columns)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=columns)
+
+
+# =============================
+# Scoring (runs in the worker processes)
+# =============================
+_worker = {}
+
+
+def fast_path_sample(kind: str, state: ServingState):
+    """
+    Training-layout rows the compiled fast path is checked against (None: fast path off).
+    """
+    if not FAST_INFERENCE:
+        return None
+    sample = state.qty_agg[DEMAND_FEATURES] if kind == "demand" else state.orders[SALES_FEATURES]
+    if len(sample) > FAST_PATH_CHECK_ROWS:
+        sample = sample.sample(FAST_PATH_CHECK_ROWS, random_state=0)
+    return sample.reset_index(drop=True)
+
+
+def init_worker(kind: str, model_path: str, context: FeatureContext, sample, order_dates: bool,
+                single_threaded: bool):
+    model = joblib.load(model_path)
+    if single_threaded:
+        # One process per CPU already: a model that predicts with n_jobs=-1 would oversubscribe
+        estimator = model.steps[-1][1] if hasattr(model, "steps") else model
+        if hasattr(estimator, "n_jobs"):
+            estimator.set_params(n_jobs=1)
+    compiled = compile_pipeline(model, sample) if sample is not None else None
+    _worker.clear()
+    _worker.update({"kind": kind, "model": model, "compiled": compiled, "context": context,
+                    "order_dates": order_dates})
+
+
+def _payloads(chunk: pd.DataFrame):
+    """
+    One payload dict per row, with API field names. Missing values are left out,
+    so a row without a required field fails like an API record without it.
+    """
+    records = chunk.rename(columns=INPUT_ALIASES).to_dict("records")
+    return [{key: value for key, value in record.items() if value == value} for record in records]
+
+
+def _order_time_parts(chunk: pd.DataFrame):
+    column = "Order Date" if "Order Date" in chunk.columns else "order_date"
+    if column not in chunk.columns:
+        return [None] * len(chunk)
+    dates = pd.to_datetime(chunk[column], errors="coerce")
+    parts = zip(dates.dt.year, dates.dt.month, dates.dt.quarter)
+    return [
+        None if year != year else {"Order_Year": int(year), "Order_Month": int(month), "Order_Quarter": int(quarter)}
+        for year, month, quarter in parts
+    ]
+
+
+def score_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    chunk + the prediction columns + error, for the worker's model.
+    """
+    kind, context = _worker["kind"], _worker["context"]
+    payloads = _payloads(chunk)
+    times = _order_time_parts(chunk) if kind == "sales" and _worker["order_dates"] else None
+
+    outputs = {col: [None] * len(chunk) for col in OUTPUT_COLS[kind]}
+    errors = [""] * len(chunk)
+    rows, modes, positions = [], [], []
+    for i, payload in enumerate(payloads):
+        try:
+            if kind == "demand":
+                row, mode = demand_features(payload, context)
+            else:
+                if times is not None and times[i] is None:
+                    raise ValueError("bad order date")
+                row, mode = sales_features(payload, context, times[i] if times else None), None
+        except Exception:
+            errors[i] = f"Invalid payload for {kind} prediction."
+            continue
+        rows.append(row)
+        modes.append(mode)
+        positions.append(i)
+
+    if rows:
+        if _worker["compiled"] is not None:
+            preds = _worker["compiled"].predict(rows)
+        else:
+            columns = DEMAND_FEATURES if kind == "demand" else SALES_FEATURES
+            preds = _worker["model"].predict(pd.DataFrame(rows, columns=columns))
+        for i, row, mode, pred in zip(positions, rows, modes, preds):
+            if kind == "demand":
+                response = demand_response(float(pred), row, mode)
+                outputs["predicted_total_quantity"][i] = response["predicted_total_quantity"]
+                outputs["stats_mode"][i] = mode
+            else:
+                outputs["predicted_sales"][i] = round(float(pred), 2)
+
+    result = chunk.reset_index(drop=True)
+    for col, values in outputs.items():
+        result[col] = values
+    result["error"] = errors
+    return result
+
+
+# =============================
+# Output
+# =============================
+class ChunkWriter:
+    """
+    Appends result chunks to a .csv, .ndjson/.jsonl or .parquet file ("-" = CSV on stdout).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.suffix = "" if path == "-" else Path(path).suffix
+        self.rows = 0
+        self._file = None
+        self._parquet = None
+
+    def write(self, frame: pd.DataFrame):
+        if self.suffix == ".parquet":
+            self._write_parquet(frame)
+        else:
+            if self._file is None:
+                self._file = sys.stdout if self.path == "-" else open(self.path, "w", encoding="utf-8", newline="")
+            if self.suffix in NDJSON_SUFFIXES:
+                frame.to_json(self._file, orient="records", lines=True)
+            else:
+                frame.to_csv(self._file, index=False, header=self.rows == 0)
+        self.rows += len(frame)
+
+    def _write_parquet(self, frame: pd.DataFrame):
+        pq = _need_pyarrow()
+        import pyarrow as pa
+
+        if self._parquet is None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            self._parquet = pq.ParquetWriter(self.path, table.schema)
+        else:
+            # Later chunks take the first chunk's types (an all-empty column would infer another)
+            table = pa.Table.from_pandas(frame, schema=self._parquet.schema, preserve_index=False)
+        self._parquet.write_table(table)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+        elif self._file is sys.stdout:
+            sys.stdout.flush()
+
+
+def _log(message: str):
+    # stderr: the results may be going to stdout
+    print(f"[batch] {message}", file=sys.stderr, flush=True)
+
+
+def score_chunks(chunks, writer: ChunkWriter, kind: str, model_path: Path, state: ServingState,
+                 workers: int, order_dates: bool = False):
+    """
+    Scores every chunk and writes the results in input order. Returns (rows, error rows).
+    """
+    start = time.perf_counter()
+    errors = 0
+    # Workers get what building rows needs and a fast-path check sample, not the whole state
+    context, sample = state.feature_context(), fast_path_sample(kind, state)
+
+    def _write(result: pd.DataFrame):
+        nonlocal errors
+        writer.write(result)
+        errors += int((result["error"] != "").sum())
+        elapsed = time.perf_counter() - start
+        _log(f"{writer.rows} rows scored ({writer.rows / elapsed:,.0f} rows/s)")
+
+    if workers <= 1:
+        init_worker(kind, str(model_path), context, sample, order_dates, single_threaded=False)
+        for chunk in chunks:
+            _write(score_chunk(chunk))
+        return writer.rows, errors
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(kind, str(model_path), context, sample, order_dates, True),
+    ) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                _write(pending.popleft().result())
+        while pending:
+            _write(pending.popleft().result())
+    return writer.rows, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a whole file (or segment x month grid) with the demand or sales model.")
+    parser.add_argument("kind", choices=["demand", "sales"])
+    parser.add_argument("input", nargs="?", type=Path, help=".csv, .parquet or .ndjson/.jsonl file")
+    parser.add_argument("-o", "--output", required=True, help=".csv, .parquet or .ndjson/.jsonl file, or - for CSV on stdout")
+    parser.add_argument("--grid-years", type=int, nargs="+", help="demand: score every segment x month of these years (no input file)")
+    parser.add_argument("--order-dates", action="store_true", help="sales: Year/Month/Quarter from each row's Order Date")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model", type=Path, help="model file (default: the one the API serves)")
+    parser.add_argument("--data", type=Path, default=DEFAULT_DATA_PATH, help="dataset for the segment stats / latest date")
+    parser.add_argument("--snapshot-dir", type=Path, default=DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument("--no-snapshot", action="store_true", help="always parse the dataset CSV")
+    args = parser.parse_args()
+
+    if args.grid_years and args.kind != "demand":
+        parser.error("--grid-years only applies to demand")
+    if (args.input is None) == (not args.grid_years):
+        parser.error("give either an input file or --grid-years")
+    if args.input is not None and not args.input.is_file():
+        parser.error(f"{args.input} not found")
+
+    timings = {}
+    orders, qty_agg = load_serving_data(args.data, None if args.no_snapshot else args.snapshot_dir, timings)
+    state = ServingState.build(orders, qty_agg)
+    del orders, qty_agg
+    _log(f"{len(state.orders)} orders loaded: {format_timings(timings)}")
+
+    if args.grid_years:
+        chunks = iter_demand_grid(state, args.grid_years, args.chunk_rows)
+    else:
+        chunks = iter_file_chunks(args.input, args.chunk_rows)
+
+    writer = ChunkWriter(args.output)
+    start = time.perf_counter()
+    try:
+        rows, errors = score_chunks(chunks, writer, args.kind, args.model or MODEL_PATHS[args.kind], state,
+                                    max(1, args.workers), args.order_dates)
+    finally:
+        writer.close()
+    _log(f"done: {rows} rows ({errors} errors) in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Endpoint benchmark: drives the FastAPI app in-process through its ASGI interface
+(no network, no running server) and reports latency percentiles, throughput and
+memory growth (RSS peak during the scenario minus RSS at its start) per endpoint
+and concurrency level.
+
+    python benchmark.py                                  # current dataset, concurrency 1 and 16
+    python benchmark.py --rows 500000 --concurrency 1,8,32
+    python benchmark.py --save-baseline                  # store results as the baseline
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.2
+
+--rows generates a dataset of that size with generate_synthetic_data.py (cached in
+bench_data/, same --seed -> same file) and points the app at it via BA_DATA_PATH.
+Prediction and forecast caches are off unless --cache, so every request does the
+full work. Results are compared with the baseline JSON when it exists: a scenario
+is flagged when its p50/p95 latency or memory growth increased, or its throughput
+fell, by more than the tolerance. The exit code is 1 if anything regressed.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+APP_DIR = Path(__file__).parent
+BENCH_DATA_DIR = APP_DIR / "bench_data"
+DEFAULT_BASELINE = APP_DIR / "benchmark_baseline.json"
+
+ENDPOINTS = ["predict_demand", "predict_sales", "forecast_sales_series", "options_subcategories"]
+WARMUP_REQUESTS = 20
+# Markers the home page must contain (the old check_html.py check)
+HOME_PAGE_MARKERS = ['id="btnSales"', 'src="/static/app.js']
+# Metric -> +1 if higher is worse, -1 if lower is worse
+COMPARED_METRICS = {"p50_ms": 1, "p95_ms": 1, "throughput_rps": -1, "rss_growth_mb": 1}
+# Latency changes smaller than this are timer/scheduler noise, whatever the ratio
+MIN_LATENCY_DELTA_MS = 0.5
+# Same for memory: allocator/page noise
+MIN_MEMORY_DELTA_MB = 5.0
+# How often the RSS is sampled during a scenario (seconds)
+RSS_SAMPLE_INTERVAL = 0.002
+
+
+# =============================
+# Dataset
+# =============================
+def _write_dataset(rows: int, seed: int, path: str):
+    from generate_synthetic_data import INPUT_CSV, expand_dataset
+
+    expand_dataset(rows, seed, APP_DIR / INPUT_CSV).to_csv(path, index=False)
+
+
+def ensure_dataset(rows: int, seed: int) -> Path:
+    """
+    Path of a generated dataset with rows orders. Generated in a child process so
+    the generator's memory does not count towards the benchmark's peak.
+    """
+    path = BENCH_DATA_DIR / f"orders_{rows}_seed{seed}.csv"
+    if not path.exists():
+        BENCH_DATA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".csv.tmp")
+        proc = multiprocessing.get_context("spawn").Process(target=_write_dataset, args=(rows, seed, str(tmp_path)))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            raise RuntimeError(f"Dataset generation failed (exit code {proc.exitcode})")
+        os.replace(tmp_path, path)
+    return path
+
+
+# =============================
+# In-process ASGI driver
+# =============================
+class AsgiClient:
+    """
+    Minimal ASGI client: one call = one HTTP request to app, returns (status, body).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan = None
+        self._lifespan_in = None
+        self._lifespan_out = None
+
+    async def request(self, method: str, path: str, body: bytes = b"", query: str = ""):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+        }
+        sent = False
+        done = asyncio.Event()
+        response = {"status": None, "body": []}
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    done.set()
+
+        await self.app(scope, receive, send)
+        done.set()
+        return response["status"], b"".join(response["body"])
+
+    async def _lifespan_event(self, event: str):
+        await self._lifespan_in.put({"type": f"lifespan.{event}"})
+        message = await self._lifespan_out.get()
+        if message["type"] != f"lifespan.{event}.complete":
+            raise RuntimeError(f"App lifespan {event} failed: {message}")
+
+    async def startup(self):
+        self._lifespan_in, self._lifespan_out = asyncio.Queue(), asyncio.Queue()
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan = asyncio.create_task(self.app(scope, self._lifespan_in.get, self._lifespan_out.put))
+        await self._lifespan_event("startup")
+
+    async def shutdown(self):
+        await self._lifespan_event("shutdown")
+        await self._lifespan
+
+
+# =============================
+# Scenarios
+# =============================
+def build_requests(endpoint: str, options: dict, n: int, rng):
+    """
+    n (method, path, body, query) tuples with valid inputs drawn from the dropdown options.
+    """
+    categories = [c for c in options["categories"] if options["subcategories_by_category"].get(c)]
+    regions = [r for r in options["regions"] if options["cities_by_region"].get(r)]
+    requests = []
+    for _ in range(n):
+        category = str(rng.choice(categories))
+        sub_category = str(rng.choice(options["subcategories_by_category"][category]))
+        region = str(rng.choice(regions))
+        if endpoint == "predict_demand":
+            payload = {"category": category, "sub_category": sub_category, "region": region,
+                       "year": int(rng.choice(options["years"])), "month": int(rng.integers(1, 13))}
+            requests.append(("POST", "/api/predict/demand", json.dumps(payload).encode(), ""))
+        elif endpoint == "predict_sales":
+            payload = {"category": category, "sub_category": sub_category, "region": region,
+                       "city": str(rng.choice(options["cities_by_region"][region])),
+                       "unit_price": round(float(rng.uniform(10, 2000)), 2),
+                       "discount": round(float(rng.uniform(0, 50)), 2),
+                       "quantity": int(rng.integers(1, 11))}
+            requests.append(("POST", "/api/predict/sales", json.dumps(payload).encode(), ""))
+        elif endpoint == "forecast_sales_series":
+            payload = {"category": str(rng.choice(["All"] + categories)), "horizon": int(rng.integers(6, 25))}
+            requests.append(("POST", "/api/forecast/sales_series", json.dumps(payload).encode(), ""))
+        elif endpoint == "options_subcategories":
+            requests.append(("GET", "/api/options/subcategories", b"", f"category={category}"))
+        else:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
+    return requests
+
+
+def current_rss_mb():
+    # Linux only (/proc); None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class RssSampler:
+    """
+    Samples the process RSS in a thread while active. growth_mb is the highest
+    sample minus the RSS at the start: the memory the scenario itself added
+    (ru_maxrss is the lifetime peak, usually set by loading the data and models).
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start_mb = self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb() or 0.0)
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        if self.start_mb is not None:
+            self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak_mb = max(self.peak_mb, current_rss_mb() or 0.0)
+
+    @property
+    def growth_mb(self):
+        if self.start_mb is None:
+            return None
+        return round(self.peak_mb - self.start_mb, 1)
+
+
+async def run_scenario(client: AsgiClient, requests: list, concurrency: int):
+    """
+    Sends requests with at most concurrency in flight. Returns the metrics dict.
+    """
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < len(requests):
+            method, path, body, query = requests[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            status, _ = await client.request(method, path, body, query)
+            latencies.append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                errors += 1
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000.0
+    return {
+        "requests": len(requests),
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_rps": round(len(requests) / wall, 1) if wall > 0 else 0.0,
+        "rss_growth_mb": rss.growth_mb,
+    }
+
+
+async def check_home_page(client: AsgiClient):
+    status, body = await client.request("GET", "/")
+    html = body.decode("utf-8", errors="replace")
+    missing = [marker for marker in HOME_PAGE_MARKERS if marker not in html]
+    if status != 200 or missing:
+        raise RuntimeError(f"Home page check failed: status {status}, missing {missing}")
+
+
+async def run_benchmark(app, options: dict, endpoints, concurrency_levels, n_requests: int,
+                        forecast_requests: int, seed: int):
+    client = AsgiClient(app)
+    await client.startup()
+    results = {}
+    try:
+        await check_home_page(client)
+        rng = np.random.default_rng(seed)
+        for endpoint in endpoints:
+            n = forecast_requests if endpoint == "forecast_sales_series" else n_requests
+            await run_scenario(client, build_requests(endpoint, options, WARMUP_REQUESTS, rng), 1)
+            for concurrency in concurrency_levels:
+                metrics = await run_scenario(client, build_requests(endpoint, options, n, rng), concurrency)
+                results[f"{endpoint}@c{concurrency}"] = metrics
+                print(f"[benchmark] {endpoint:<24} c={concurrency:<3} p50={metrics['p50_ms']:.2f}ms "
+                      f"p95={metrics['p95_ms']:.2f}ms p99={metrics['p99_ms']:.2f}ms "
+                      f"{metrics['throughput_rps']:.0f} req/s rss_growth={metrics['rss_growth_mb']}MB"
+                      + (f" errors={metrics['errors']}" if metrics["errors"] else ""))
+    finally:
+        await client.shutdown()
+    return results
+
+
+# =============================
+# Baseline comparison
+# =============================
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float):
+    """
+    Returns a list of regression messages (empty when nothing regressed).
+    """
+    regressions = []
+    for scenario, metrics in results.items():
+        base = baseline.get("results", {}).get(scenario)
+        if base is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if metric.endswith("_ms") and abs(new - old) < MIN_LATENCY_DELTA_MS:
+                continue
+            if metric.endswith("_mb") and abs(new - old) < MIN_MEMORY_DELTA_MB:
+                continue
+            if not old and not metric.endswith("_mb"):
+                continue
+            # A scenario that used to add no memory: any growth past the noise floor counts
+            change = (new - old) / old if old else float("inf")
+            if change * direction > tolerance:
+                regressions.append(f"{scenario}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process benchmark of the prediction API.")
+    parser.add_argument("--rows", type=int, default=None,
+                        help="generate a dataset of this many orders (default: the app's dataset)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", default="1,16", help="comma-separated in-flight request counts")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--forecast-requests", type=int, default=50, help="requests per forecast scenario")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--cache", action="store_true", help="keep the prediction/forecast caches on")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change that counts as a regression (default 0.2)")
+    parser.add_argument("--out", default=None, help="also write the results JSON here")
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = sorted(set(endpoints) - set(ENDPOINTS))
+    if unknown:
+        parser.error(f"unknown endpoints: {unknown} (choose from {ENDPOINTS})")
+    concurrency_levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    # App configuration has to be in the environment before main.py is imported
+    if args.rows:
+        data_path = ensure_dataset(args.rows, args.seed)
+        os.environ["BA_DATA_PATH"] = str(data_path)
+        os.environ["BA_SNAPSHOT_DIR"] = str(data_path.with_suffix(".snapshot"))
+    os.environ["BA_FORECAST_WARM"] = "0"
+    os.environ["BA_INGEST_DIR"] = ""
+    if not args.cache:
+        os.environ["BA_PREDICTION_CACHE_SIZE"] = "0"
+        os.environ["BA_FORECAST_CACHE_SIZE"] = "0"
+
+    import main as app_main
+    app_main.load_all()   # the startup phases run before the clock starts, also with BA_STARTUP=lazy
+
+    results = asyncio.run(run_benchmark(
+        app_main.app, app_main.DATA.options, endpoints, concurrency_levels,
+        args.requests, args.forecast_requests, args.seed,
+    ))
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "orders": int(len(app_main.DATA.orders)),
+            "cache": args.cache,
+            "inference_executor": app_main.INFERENCE_EXECUTOR,
+        },
+        "results": results,
+    }
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=1))
+
+    baseline_path = Path(args.baseline)
+    regressions = []
+    if baseline_path.exists() and not args.save_baseline:
+        baseline = json.loads(baseline_path.read_text())
+        base_meta = baseline.get("meta", {})
+        for key in ("orders", "cache", "cpus"):
+            if base_meta.get(key) != report["meta"][key]:
+                print(f"[benchmark] note: baseline {key}={base_meta.get(key)!r}, now {report['meta'][key]!r}")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        print(f"[benchmark] compared with baseline {baseline_path} (commit {base_meta.get('commit')}): "
+              f"{len(regressions)} regression(s)")
+        for message in regressions:
+            print(f"[benchmark] REGRESSION {message}")
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=1))
+        print(f"[benchmark] baseline saved: {baseline_path}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
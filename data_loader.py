@@ -0,0 +1,317 @@
+"""
+Loads the serving dataset used by main.py.
+
+Parsing the CSV (read_csv + to_datetime + dropna + the qty_agg groupby) gets slower
+as the file grows, so the cleaned orders frame and qty_agg are also written to a
+columnar binary snapshot: one .npy file per column, with text columns stored as
+integer codes + a label list. The server loads the snapshot when it was built from
+the current CSV and rebuilds it otherwise.
+
+Only the columns the endpoints and the forecaster read are kept in memory. The
+segment columns are categoricals and integer columns use the smallest dtype that
+holds their values (see compact_orders).
+
+With mmap_mode="r" the snapshot columns are memory-mapped instead of read: every
+process serving the same snapshot then shares one copy in the page cache
+(BA_SNAPSHOT_MMAP, used by serve.py).
+
+Build (or refresh) the snapshot ahead of a deploy with:
+    python data_loader.py
+"""
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+# Columns a row must have to be usable for demand/sales logic
+NEEDED_COLS = ["Order Date", "Unit Price", "Discount", "Category", "Sub-Category", "Region", "City"]
+QTY_GROUP_COLS = ["Order_Year", "Order_Month", "Category", "Sub-Category", "Region"]
+DATE_PART_COLS = ["Order_Year", "Order_Month", "Order_Quarter"]
+
+# Columns kept in the serving frame (dropdowns, segment stats, sales features, forecasts)
+SERVING_COLS = NEEDED_COLS + ["Quantity", "Sales", "Profit"] + DATE_PART_COLS
+# Low-cardinality text columns, held as categoricals (int8 codes instead of Python strings)
+CATEGORY_COLS = ["Category", "Sub-Category", "Region", "City"]
+
+
+@contextmanager
+def timed(timings: dict, phase: str):
+    """
+    Adds the wall time of the block to timings[phase] (seconds).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def format_timings(timings: dict) -> str:
+    return ", ".join(f"{phase}={seconds:.3f}s" for phase, seconds in timings.items())
+
+
+# =============================
+# Cleaning + aggregation
+# =============================
+def clean_orders(raw: pd.DataFrame, timings: dict) -> pd.DataFrame:
+    with timed(timings, "parse_dates"):
+        raw["Order Date"] = pd.to_datetime(raw["Order Date"], errors="coerce")
+
+    with timed(timings, "clean"):
+        orders = raw.dropna(subset=[c for c in NEEDED_COLS if c in raw.columns]).reset_index(drop=True)
+        orders["Order_Year"] = orders["Order Date"].dt.year.astype(int)
+        orders["Order_Month"] = orders["Order Date"].dt.month.astype(int)
+        orders["Order_Quarter"] = orders["Order Date"].dt.quarter.astype(int)
+    return orders
+
+
+def _sorted_categorical(values) -> pd.Series:
+    values = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype("category")
+    categories = values.cat.categories
+    if not categories.is_monotonic_increasing:
+        values = values.cat.reorder_categories(sorted(categories))
+    return values
+
+
+def compact_orders(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Serving-sized copy of an orders (or qty_agg) frame: columns outside SERVING_COLS /
+    QTY_GROUP_COLS are dropped, CATEGORY_COLS become categoricals with sorted categories
+    (so groupby order matches plain strings) and integer columns are downcast. Floats
+    stay float64: prices and discounts are not exact in float32, and the segment stats
+    and model inputs must not change.
+    """
+    keep = [c for c in frame.columns if c in SERVING_COLS or c in QTY_GROUP_COLS
+            or c in ("Avg_UnitPrice", "Avg_Discount", "Orders_Count")]
+    compact = {}
+    for col in keep:
+        values = frame[col]
+        if col in CATEGORY_COLS:
+            values = _sorted_categorical(values)
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = pd.to_numeric(values, downcast="integer")
+        compact[col] = values
+    return pd.DataFrame(compact, index=frame.index)
+
+
+def concat_orders(frames) -> pd.DataFrame:
+    """
+    pd.concat for compact frames. Categorical columns are first recoded to the union
+    of their categories; a plain concat would turn them back into object columns.
+    """
+    frames = list(frames)
+    for col in CATEGORY_COLS:
+        if not all(col in frame.columns for frame in frames):
+            continue
+        categories = set()
+        for frame in frames:
+            values = frame[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories.update(values.cat.categories)
+            else:
+                categories.update(values.dropna().unique())
+        dtype = pd.CategoricalDtype(sorted(categories))
+        frames = [frame.assign(**{col: frame[col].astype(dtype)}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_footprint(frame: pd.DataFrame) -> int:
+    """
+    Bytes held by frame, including the Python strings of object columns.
+    """
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def build_qty_agg(orders: pd.DataFrame) -> pd.DataFrame:
+    """
+    Monthly segment stats table (matches how the demand model was trained).
+    """
+    return orders.groupby(QTY_GROUP_COLS, as_index=False, observed=True).agg(
+        Avg_UnitPrice=("Unit Price", "mean"),
+        Avg_Discount=("Discount", "mean"),
+        Orders_Count=("Discount", "count")
+    )
+
+
+# =============================
+# Columnar snapshot
+# =============================
+def _source_fingerprint(csv_path: Path):
+    try:
+        st = csv_path.stat()
+    except OSError:
+        return None
+    return {"path": csv_path.name, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _write_table(frame: pd.DataFrame, directory: Path, table: str):
+    columns = []
+    for i, name in enumerate(frame.columns):
+        series = frame[name]
+        file_name = f"{table}_{i:03d}.npy"
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Codes + categories as they are, so the category order survives a reload
+            np.save(directory / file_name, series.cat.codes.to_numpy())
+            columns.append({"name": name, "kind": "category", "file": file_name,
+                            "labels": [str(label) for label in series.cat.categories]})
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            np.save(directory / file_name, series.to_numpy())
+            columns.append({"name": name, "kind": "datetime", "file": file_name})
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            np.save(directory / file_name, series.to_numpy())
+            columns.append({"name": name, "kind": "numeric", "file": file_name})
+        else:
+            codes, labels = pd.factorize(series, use_na_sentinel=True)
+            np.save(directory / file_name, codes.astype(np.int32))
+            columns.append({"name": name, "kind": "text", "file": file_name,
+                            "labels": [str(label) for label in labels]})
+    return {"rows": int(len(frame)), "columns": columns}
+
+
+def _read_table(directory: Path, spec: dict, mmap_mode=None) -> pd.DataFrame:
+    data = {}
+    for col in spec["columns"]:
+        values = np.load(directory / col["file"], mmap_mode=mmap_mode)
+        if col["kind"] == "category":
+            # Explicit dtype, no validation: the codes were written by _write_table, and this
+            # way a memory-mapped codes array is wrapped as is (no scan, no recoded copy)
+            dtype = pd.CategoricalDtype(col["labels"])
+            data[col["name"]] = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        elif col["kind"] == "text":
+            labels = np.array(col["labels"] + [None], dtype=object)
+            # code -1 (missing) picks the trailing None
+            data[col["name"]] = pd.Series(labels[values])
+        else:
+            data[col["name"]] = values
+    # copy=False keeps memory-mapped columns mapped instead of consolidating them
+    return pd.DataFrame(data, copy=False)
+
+
+def write_snapshot(tables: dict, snapshot_dir: Path, source):
+    """
+    Writes each frame in tables as a columnar snapshot. The directory is built
+    under a temporary name and swapped in, so readers never see a partial snapshot.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    tmp_dir = snapshot_dir.with_name(f"{snapshot_dir.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    meta = {"format": SNAPSHOT_FORMAT_VERSION, "source": source, "tables": {}}
+    for table, frame in tables.items():
+        meta["tables"][table] = _write_table(frame, tmp_dir, table)
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=1))
+
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, snapshot_dir)
+    except OSError:
+        # Another worker swapped its snapshot in first; theirs is just as good
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def read_snapshot_meta(snapshot_dir: Path):
+    try:
+        meta = json.loads((Path(snapshot_dir) / "meta.json").read_text())
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != SNAPSHOT_FORMAT_VERSION:
+        return None
+    return meta
+
+
+def read_snapshot(snapshot_dir: Path, meta: dict, mmap_mode=None) -> dict:
+    return {
+        table: _read_table(Path(snapshot_dir), spec, mmap_mode=mmap_mode)
+        for table, spec in meta["tables"].items()
+    }
+
+
+def snapshot_is_fresh(meta, csv_path: Path) -> bool:
+    """
+    A snapshot is usable when it was built from the current CSV (same mtime + size),
+    or when there is no CSV at all (snapshot-only deploy).
+    """
+    if meta is None:
+        return False
+    source = _source_fingerprint(csv_path)
+    return source is None or meta.get("source") == source
+
+
+# =============================
+# Entry point used by main.py
+# =============================
+def load_serving_data(csv_path: Path, snapshot_dir: Path = None, timings: dict = None, mmap_mode=None):
+    """
+    Returns (orders, qty_agg). Uses the snapshot in snapshot_dir when it is fresh,
+    otherwise parses the CSV and (re)writes the snapshot. Phase durations are added
+    to timings. With mmap_mode (e.g. "r") the returned columns are mapped from the
+    snapshot files, including right after a rebuild.
+    """
+    csv_path = Path(csv_path)
+    timings = {} if timings is None else timings
+
+    if snapshot_dir is not None:
+        with timed(timings, "snapshot_check"):
+            meta = read_snapshot_meta(snapshot_dir)
+            fresh = snapshot_is_fresh(meta, csv_path)
+        if fresh:
+            try:
+                with timed(timings, "read_snapshot"):
+                    tables = read_snapshot(snapshot_dir, meta, mmap_mode=mmap_mode)
+                return tables["orders"], tables["qty_agg"]
+            except (OSError, KeyError, ValueError) as e:
+                print(f"[data_loader] Snapshot unreadable ({e}); rebuilding from CSV.")
+
+    with timed(timings, "read_csv"):
+        raw = pd.read_csv(csv_path, usecols=lambda col: col in SERVING_COLS,
+                          dtype={col: "category" for col in CATEGORY_COLS})
+    orders = clean_orders(raw, timings)
+
+    with timed(timings, "compact"):
+        orders = compact_orders(orders)
+
+    with timed(timings, "aggregate"):
+        qty_agg = compact_orders(build_qty_agg(orders))
+
+    if snapshot_dir is not None:
+        try:
+            with timed(timings, "write_snapshot"):
+                write_snapshot({"orders": orders, "qty_agg": qty_agg}, snapshot_dir,
+                               _source_fingerprint(csv_path))
+        except OSError as e:
+            print(f"[data_loader] Could not write snapshot to {snapshot_dir}: {e}")
+        else:
+            if mmap_mode is not None:
+                meta = read_snapshot_meta(snapshot_dir)
+                if meta is not None:
+                    with timed(timings, "read_snapshot"):
+                        tables = read_snapshot(snapshot_dir, meta, mmap_mode=mmap_mode)
+                    return tables["orders"], tables["qty_agg"]
+
+    return orders, qty_agg
+
+
+if __name__ == "__main__":
+    import argparse
+
+    app_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Build the columnar snapshot of the serving dataset.")
+    parser.add_argument("--csv", default=str(app_dir / "Ecommerce_Sales_Data_Expanded.csv"))
+    parser.add_argument("--out", default=str(app_dir / "data_snapshot"))
+    args = parser.parse_args()
+
+    timings = {}
+    shutil.rmtree(args.out, ignore_errors=True)
+    orders, qty_agg = load_serving_data(args.csv, args.out, timings)
+    print(f"Saved snapshot: {args.out} ({len(orders)} orders, {len(qty_agg)} segment-months, "
+          f"{memory_footprint(orders) / 2**20:.1f} MB in memory)")
+    print(f"Timings: {format_timings(timings)}")
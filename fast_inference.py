@@ -0,0 +1,150 @@
+"""
+DataFrame-free inference for the pipelines saved by prediction_models.py.
+
+Those pipelines are Pipeline([("prep", ColumnTransformer(OneHotEncoder + passthrough)),
+("model", estimator)]). Scoring one request through them means building a one-row
+DataFrame and going through pandas column selection, which costs far more than the
+model itself. CompiledPipeline reads the fitted encoder categories and passthrough
+columns once and encodes request dicts straight into the NumPy / sparse matrix the
+estimator was trained on, then calls the same fitted estimator.
+
+compile_pipeline() only returns a compiled pipeline when its predictions are
+bit-for-bit equal to Pipeline.predict on a sample; otherwise callers keep using the
+original pipeline.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
+
+
+UNKNOWN_PROBE = "__unknown_category__"
+
+
+class UnsupportedPipeline(Exception):
+    pass
+
+
+def _is_passthrough(transformer) -> bool:
+    if isinstance(transformer, str):
+        return transformer == "passthrough"
+    # Newer sklearn stores "passthrough" as an identity FunctionTransformer
+    return isinstance(transformer, FunctionTransformer) and transformer.func is None
+
+
+class CompiledPipeline:
+    """
+    Encodes rows (dicts keyed by training column names) without pandas and scores
+    them with the pipeline's fitted estimator.
+    """
+
+    def __init__(self, pipeline):
+        if not isinstance(pipeline, Pipeline) or not isinstance(pipeline.steps[0][1], ColumnTransformer):
+            raise UnsupportedPipeline("expected Pipeline([ColumnTransformer, ..., estimator])")
+
+        prep = pipeline.steps[0][1]
+        if getattr(prep, "_sklearn_output_config", {}).get("transform") == "pandas":
+            raise UnsupportedPipeline("ColumnTransformer is configured for pandas output")
+
+        self.sparse_output = bool(prep.sparse_output_)
+        self.onehot = []        # (column, {category: output index}, handle_unknown)
+        self.numeric = []       # (column, output index)
+        self.n_features = 0
+
+        for name, transformer, columns in prep.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            if not all(isinstance(c, str) for c in columns):
+                raise UnsupportedPipeline(f"transformer {name!r} selects columns by position")
+            if isinstance(transformer, OneHotEncoder):
+                self._add_onehot(transformer, columns)
+            elif _is_passthrough(transformer):
+                for col in columns:
+                    self.numeric.append((col, self.n_features))
+                    self.n_features += 1
+            else:
+                raise UnsupportedPipeline(f"unsupported transformer {type(transformer).__name__}")
+
+        self.steps = [step for _, step in pipeline.steps[1:-1]]
+        self.estimator = pipeline.steps[-1][1]
+        if hasattr(self.estimator, "feature_names_in_"):
+            raise UnsupportedPipeline("estimator was fitted on named features")
+
+    def _add_onehot(self, encoder: OneHotEncoder, columns):
+        if encoder.drop is not None or getattr(encoder, "_infrequent_enabled", False):
+            raise UnsupportedPipeline("OneHotEncoder with drop/infrequent categories")
+        if encoder.handle_unknown not in ("ignore", "error"):
+            raise UnsupportedPipeline(f"OneHotEncoder handle_unknown={encoder.handle_unknown!r}")
+        if np.dtype(encoder.dtype) != np.float64:
+            raise UnsupportedPipeline("OneHotEncoder dtype must be float64")
+
+        for col, categories in zip(columns, encoder.categories_):
+            index = {cat: self.n_features + i for i, cat in enumerate(categories.tolist())}
+            self.onehot.append((col, index, encoder.handle_unknown))
+            self.n_features += len(categories)
+
+    def transform(self, rows):
+        """
+        Rows -> the matrix the ColumnTransformer would have produced.
+        """
+        n = len(rows)
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+
+        for col, index, handle_unknown in self.onehot:
+            for i, row in enumerate(rows):
+                j = index.get(row[col])
+                if j is not None:
+                    X[i, j] = 1.0
+                elif handle_unknown == "error":
+                    raise ValueError(f"Found unknown category {row[col]!r} in column {col!r}")
+
+        if self.numeric:
+            cols = [j for _, j in self.numeric]
+            X[:, cols] = np.array([[row[c] for c, _ in self.numeric] for row in rows], dtype=np.float64)
+
+        if self.sparse_output:
+            # sparse.hstack in ColumnTransformer never stores explicit zeros
+            X = sparse.csr_matrix(X)
+            X.eliminate_zeros()
+
+        for step in self.steps:
+            X = step.transform(X)
+        return X
+
+    def predict(self, rows):
+        return self.estimator.predict(self.transform(rows))
+
+
+def compile_pipeline(pipeline, sample):
+    """
+    Returns a CompiledPipeline for pipeline, or None when the pipeline is not
+    supported or its predictions on sample (a DataFrame of training columns)
+    differ in any way from pipeline.predict.
+    """
+    try:
+        compiled = CompiledPipeline(pipeline)
+    except UnsupportedPipeline as e:
+        print(f"[fast_inference] Using the original pipeline: {e}")
+        return None
+
+    # Also check a row with unseen categories (encoded as all zeros)
+    ignore_cols = [col for col, _, handle_unknown in compiled.onehot if handle_unknown == "ignore"]
+    if ignore_cols and len(sample):
+        probe = sample.head(1).astype({col: object for col in ignore_cols})
+        probe[ignore_cols] = UNKNOWN_PROBE
+        sample = pd.concat([sample.astype({col: object for col in ignore_cols}), probe], ignore_index=True)
+
+    try:
+        expected = pipeline.predict(sample)
+        actual = compiled.predict(sample.to_dict("records"))
+    except Exception as e:
+        print(f"[fast_inference] Using the original pipeline: self-check failed ({e})")
+        return None
+
+    if not np.array_equal(np.asarray(expected), np.asarray(actual)):
+        print("[fast_inference] Using the original pipeline: compiled predictions differ")
+        return None
+    return compiled
@@ -0,0 +1,111 @@
+"""
+Model feature rows built from request payloads, shared by the API (main.py) and
+the offline batch scorer (batch_score.py) so both score exactly the same inputs.
+
+Payloads use the API field names (category, sub_category, ...). Files exported
+from the dataset use its column names instead; INPUT_ALIASES maps those onto the
+API names.
+"""
+# IMPORTANT: feature names must match training EXACTLY
+DEMAND_FEATURES = ["Category", "Sub-Category", "Region", "Order_Year", "Order_Month",
+                   "Avg_UnitPrice", "Avg_Discount", "Orders_Count"]
+SALES_FEATURES = ["Category", "Sub-Category", "Region", "City", "Unit Price", "Discount",
+                  "Order_Year", "Order_Month", "Order_Quarter", "Quantity"]
+
+# Dataset column -> payload field
+INPUT_ALIASES = {
+    "Category": "category",
+    "Sub-Category": "sub_category",
+    "Region": "region",
+    "City": "city",
+    "Unit Price": "unit_price",
+    "Discount": "discount",
+    "Quantity": "quantity",
+    "Order_Year": "year",
+    "Order_Month": "month",
+    "Order Date": "order_date",
+}
+
+
+def demand_key(payload: dict):
+    """
+    (category, sub_category, region, year, month) of a demand payload. Raises on a malformed payload.
+    """
+    return (
+        str(payload["category"]),
+        str(payload["sub_category"]),
+        str(payload["region"]),
+        int(payload["year"]),
+        int(payload["month"]),
+    )
+
+
+def demand_row(key, avg_price: float, avg_discount: float, orders_count: int) -> dict:
+    category, sub_category, region, year, month = key
+    return {
+        "Category": category,
+        "Sub-Category": sub_category,
+        "Region": region,
+        "Order_Year": year,
+        "Order_Month": month,
+        "Avg_UnitPrice": avg_price,
+        "Avg_Discount": avg_discount,
+        "Orders_Count": orders_count
+    }
+
+
+def demand_features(payload: dict, state):
+    """
+    Parses one demand payload and enriches it with the segment stats from state
+    (a ServingState). Raises on a malformed payload. Returns (feature row, stats_mode).
+    """
+    key = demand_key(payload)
+    avg_price, avg_discount, orders_count, mode = state.segment_stats_for(*key)
+    return demand_row(key, avg_price, avg_discount, orders_count), mode
+
+
+def demand_response(pred: float, row: dict, mode: str):
+    # Demand is a count -> return integer + non-negative
+    pred_int = int(round(pred))
+    if pred_int < 0:
+        pred_int = 0
+
+    return {
+        "predicted_total_quantity": pred_int,
+        "stats_mode": mode,
+        "used_features": {
+            "Avg_UnitPrice": round(row["Avg_UnitPrice"], 2),
+            "Avg_Discount": round(row["Avg_Discount"], 2),
+            "Orders_Count": int(row["Orders_Count"])
+        }
+    }
+
+
+def sales_features(payload: dict, state, time_parts: dict = None):
+    """
+    Parses one sales payload into a model row. Raises on a malformed payload.
+    Year/Month/Quarter come from time_parts, else from state.sales_time_defaults.
+    """
+    return {
+        "Category": str(payload["category"]),
+        "Sub-Category": str(payload["sub_category"]),
+        "Region": str(payload["region"]),
+        "City": str(payload["city"]),
+        "Unit Price": float(payload["unit_price"]),
+        "Discount": float(payload["discount"]),
+        **(time_parts or state.sales_time_defaults),
+        "Quantity": float(payload["quantity"]),
+    }
+
+
+def sweep_rows(base: dict, axes: dict):
+    """
+    One sales model row per point of the unit_price x discount x quantity grid in
+    axes, on top of base (unit_price varies slowest, quantity fastest).
+    """
+    return [
+        {**base, "Unit Price": price, "Discount": discount, "Quantity": quantity}
+        for price in axes["unit_price"]
+        for discount in axes["discount"]
+        for quantity in axes["quantity"]
+    ]
@@ -1,7 +1,11 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import numpy as np
 import pandas as pd
 from pathlib import Path
-from datetime import datetime
 
 # ----------------------------
 # Config
@@ -17,7 +21,11 @@ RANDOM_SEED = 42
 # If you want more/less seasonality effect:
 SEASONAL_STRENGTH = 0.30  # 0.0=no seasonality, 0.2-0.4 moderate
 
-np.random.seed(RANDOM_SEED)
+SEG_COLS = ["Category", "Sub-Category", "Region"]
+
+# Sharded mode (--out-dir): rows per shard (one process task) and per in-memory chunk
+SHARD_ROWS = 1_000_000
+CHUNK_ROWS = 200_000
 
 
 # ----------------------------
@@ -26,13 +34,30 @@ np.random.seed(RANDOM_SEED)
 def safe_to_datetime(s):
     return pd.to_datetime(s, errors="coerce")
 
-def clamp(x, lo, hi):
-    return max(lo, min(hi, x))
-
-def weighted_choice(values, probs, size=1):
+def weighted_choice(values, probs, size, rng):
     probs = np.array(probs, dtype=float)
     probs = probs / probs.sum()
-    return np.random.choice(values, size=size, p=probs)
+    return rng.choice(np.asarray(values), size=size, p=probs)
+
+def grouped_choice(group_ids, tables, fallback, rng):
+    """
+    Row i gets a value drawn from tables[group_ids[i]] = (values, probs), or uniformly
+    from fallback when that table is None. One draw per group, not per row.
+    """
+    out = np.empty(len(group_ids), dtype=object)
+    order = np.argsort(group_ids, kind="stable")
+    sorted_ids = group_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) else []
+    ends = np.r_[starts[1:], len(order)] if len(order) else []
+
+    for start, end in zip(starts, ends):
+        rows = order[start:end]
+        table = tables[sorted_ids[start]]
+        if table is None:
+            out[rows] = rng.choice(fallback, size=len(rows))
+        else:
+            out[rows] = weighted_choice(table[0], table[1], len(rows), rng)
+    return out
 
 def month_weights_from_data(df):
     # Base weights from historical frequency
@@ -57,12 +82,10 @@ def build_segment_stats(df):
     Build per-segment distributions for Unit Price, Discount, Quantity.
     Segment = (Category, Sub-Category, Region)
     """
-    seg_cols = ["Category", "Sub-Category", "Region"]
-
-    for c in seg_cols:
+    for c in SEG_COLS:
         df[c] = df[c].astype(str)
 
-    seg = df.groupby(seg_cols).agg(
+    seg = df.groupby(SEG_COLS).agg(
         price_med=("Unit Price", "median"),
         price_q1=("Unit Price", lambda x: np.percentile(x, 25)),
         price_q3=("Unit Price", lambda x: np.percentile(x, 75)),
@@ -80,21 +103,19 @@ def build_segment_stats(df):
 
     def iqr_scale(q1, q3):
         s = (q3 - q1)
-        return s if s > 1e-9 else max(q3 * 0.10, 1.0)
+        return np.where(s > 1e-9, s, np.maximum(q3 * 0.10, 1.0))
 
-    seg["price_scale"] = seg.apply(lambda r: iqr_scale(r["price_q1"], r["price_q3"]), axis=1)
-    seg["disc_scale"] = seg.apply(lambda r: iqr_scale(r["disc_q1"], r["disc_q3"]), axis=1)
-    seg["qty_scale"]  = seg.apply(lambda r: iqr_scale(r["qty_q1"],  r["qty_q3"]), axis=1)
+    seg["price_scale"] = iqr_scale(seg["price_q1"], seg["price_q3"])
+    seg["disc_scale"] = iqr_scale(seg["disc_q1"], seg["disc_q3"])
+    seg["qty_scale"]  = iqr_scale(seg["qty_q1"],  seg["qty_q3"])
 
     return seg
 
 
-def sample_normal_around(med, scale, minv=None, maxv=None):
-    x = np.random.normal(loc=med, scale=scale)
-    if minv is not None:
-        x = max(minv, x)
-    if maxv is not None:
-        x = min(maxv, x)
+def sample_normal_around(med, scale, rng, minv=None, maxv=None):
+    x = rng.normal(loc=med, scale=scale)
+    if minv is not None or maxv is not None:
+        x = np.clip(x, minv, maxv)
     return x
 
 
@@ -102,30 +123,28 @@ def generate_order_id(start_id, n):
     return np.arange(start_id, start_id + n, dtype=int)
 
 
-def make_customer_names(n):
+def make_customer_names(n, rng):
     """
-    FIXED: use np.char.add for safe vectorized string concat in NumPy.
+    Uniform first + last name: pick from the precomputed "First Last" combinations.
     """
     first = np.array(["Amina", "Sara", "Ali", "Omar", "Zain", "Nadia", "Riya", "Ishan",
-                      "Misha", "Anika", "Ayaan", "Kashvi"], dtype=str)
+                      "Misha", "Anika", "Ayaan", "Kashvi"], dtype=object)
     last  = np.array(["Khan", "Sharma", "Patel", "Singh", "Desai", "Gupta", "Acharya",
-                      "Chandra", "Thakur", "Ram", "Yadav"], dtype=str)
+                      "Chandra", "Thakur", "Ram", "Yadav"], dtype=object)
+
+    full = (first[:, None] + " " + last[None, :]).ravel()
+    return full[rng.integers(0, len(full), size=n)]
 
-    fn = np.random.choice(first, size=n)
-    ln = np.random.choice(last, size=n)
 
-    full = np.char.add(np.char.add(fn, " "), ln)
-    return full.astype(str)
+def make_order_dates(years, months, days):
+    month_start = ((years - 1970) * 12 + (months - 1)).astype("datetime64[M]")
+    return month_start.astype("datetime64[D]") + (days - 1).astype("timedelta64[D]")
 
 
 # ----------------------------
-# Main
+# Fit + sample
 # ----------------------------
-def main():
-    input_path = Path(INPUT_CSV)
-    if not input_path.exists():
-        raise FileNotFoundError(f"Could not find {INPUT_CSV} in this folder.")
-
+def load_input(input_path: Path):
     df = pd.read_csv(input_path)
 
     required = ["Order Date", "Customer Name", "Region", "City", "Category", "Sub-Category",
@@ -143,8 +162,13 @@ def main():
     for col in ["Quantity", "Unit Price", "Discount", "Sales", "Profit"]:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors="coerce")
-    df = df.dropna(subset=[c for c in ["Quantity", "Unit Price", "Discount"] if c in df.columns]).copy()
+    return df.dropna(subset=[c for c in ["Quantity", "Unit Price", "Discount"] if c in df.columns]).copy()
+
 
+def fit_sampler(df):
+    """
+    Everything sample_orders needs, fitted once from the input data.
+    """
     months, month_probs = month_weights_from_data(df)
 
     years = np.arange(START_YEAR, END_YEAR + 1)
@@ -161,118 +185,90 @@ def main():
     if "City" in df.columns:
         for r, sub in df.groupby("Region"):
             counts = sub["City"].value_counts()
-            cities = counts.index.astype(str).tolist()
-            probs = (counts.values / counts.values.sum()).astype(float)
-            city_by_region[str(r)] = (cities, probs)
+            city_by_region[str(r)] = (counts.index.astype(str).to_numpy(dtype=object), counts.values / counts.values.sum())
 
     prod_by_subcat = {}
     if "Product Name" in df.columns:
         for (cat, subcat), sub in df.groupby(["Category", "Sub-Category"]):
             counts = sub["Product Name"].value_counts()
-            prods = counts.index.astype(str).tolist()
-            probs = (counts.values / counts.values.sum()).astype(float)
-            prod_by_subcat[(str(cat), str(subcat))] = (prods, probs)
+            prod_by_subcat[(str(cat), str(subcat))] = (counts.index.astype(str).to_numpy(dtype=object), counts.values / counts.values.sum())
 
     seg_stats = build_segment_stats(df)
 
-    seg_freq = df.groupby(["Category", "Sub-Category", "Region"]).size().reset_index(name="n")
-    seg_stats = seg_stats.merge(seg_freq, on=["Category", "Sub-Category", "Region"], how="left")
+    seg_freq = df.groupby(SEG_COLS).size().reset_index(name="n")
+    seg_stats = seg_stats.merge(seg_freq, on=SEG_COLS, how="left")
     seg_stats["n"] = seg_stats["n"].fillna(1).astype(int)
     seg_probs = seg_stats["n"].values.astype(float)
     seg_probs = seg_probs / seg_probs.sum()
 
-    start_id = int(df["Order ID"].max() + 1) if "Order ID" in df.columns else 100000
+    if "Profit" in df.columns and "Sales" in df.columns:
+        df_nonzero = df[(df["Sales"] > 0) & (df["Profit"].notna())].copy()
+        df_nonzero["margin"] = df_nonzero["Profit"] / df_nonzero["Sales"]
+        margin_by_cat = df_nonzero.groupby("Category")["margin"].median().to_dict()
+    else:
+        margin_by_cat = {}
 
-    n_new = max(0, TARGET_ROWS - len(df))
-    print(f"Original rows: {len(df)}")
-    print(f"Generating additional rows: {n_new}")
-    if n_new == 0:
-        print("TARGET_ROWS <= current rows. Nothing to generate.")
-        df.to_csv(OUTPUT_CSV, index=False)
-        print(f"Saved: {OUTPUT_CSV}")
-        return
+    return {
+        "months": months, "month_probs": month_probs,
+        "years": years, "year_probs": year_probs,
+        "payment_modes": np.array(payment_modes, dtype=object), "pm_probs": pm_probs,
+        "seg_stats": seg_stats, "seg_probs": seg_probs,
+        # Per segment: (values, probs) for its region's cities / its sub-category's products
+        "city_tables": [city_by_region.get(r) for r in seg_stats["Region"]],
+        "product_tables": [prod_by_subcat.get((c, s)) for c, s in zip(seg_stats["Category"], seg_stats["Sub-Category"])],
+        "city_fallback": (df["City"].dropna().astype(str).to_numpy(dtype=object)
+                          if "City" in df.columns else np.array(["Unknown"], dtype=object)),
+        "product_fallback": (df["Product Name"].dropna().astype(str).to_numpy(dtype=object)
+                             if "Product Name" in df.columns else np.array(["Product"], dtype=object)),
+        "seg_margins": np.array([margin_by_cat.get(c, 0.15) for c in seg_stats["Category"]], dtype=float),
+        "start_id": int(df["Order ID"].max() + 1) if "Order ID" in df.columns else 100000,
+    }
+
+
+def sample_orders(sampler, n, start_id, rng):
+    """
+    Generates n synthetic orders with array operations only (no per-row Python loop).
+    """
+    seg_stats = sampler["seg_stats"]
+    seg_idx = rng.choice(len(seg_stats), size=n, p=sampler["seg_probs"])
 
-    seg_idx = np.random.choice(np.arange(len(seg_stats)), size=n_new, p=seg_probs)
-    seg_chosen = seg_stats.iloc[seg_idx].reset_index(drop=True)
+    def seg_col(col):
+        return seg_stats[col].to_numpy()[seg_idx]
 
-    years_sampled = weighted_choice(years, year_probs, size=n_new)
-    months_sampled = weighted_choice(np.arange(1, 13), month_probs, size=n_new)
+    years_sampled = weighted_choice(sampler["years"], sampler["year_probs"], n, rng)
+    months_sampled = weighted_choice(sampler["months"], sampler["month_probs"], n, rng)
+    days = rng.integers(1, 29, size=n)
+    order_dates = make_order_dates(years_sampled, months_sampled, days)
 
-    days = np.random.randint(1, 29, size=n_new)
-    order_dates = [datetime(int(y), int(m), int(d)).strftime("%Y-%m-%d")
-                   for y, m, d in zip(years_sampled, months_sampled, days)]
+    cities = grouped_choice(seg_idx, sampler["city_tables"], sampler["city_fallback"], rng)
+    products = grouped_choice(seg_idx, sampler["product_tables"], sampler["product_fallback"], rng)
 
-    regions = seg_chosen["Region"].astype(str).values
-    cities = []
-    for r in regions:
-        if r in city_by_region:
-            c_list, c_probs = city_by_region[r]
-            cities.append(weighted_choice(c_list, c_probs, size=1)[0])
-        else:
-            cities.append(str(df["City"].dropna().sample(1).iloc[0]) if "City" in df.columns else "Unknown")
-
-    cats = seg_chosen["Category"].astype(str).values
-    subcats = seg_chosen["Sub-Category"].astype(str).values
-    products = []
-    for cat, subcat in zip(cats, subcats):
-        key = (cat, subcat)
-        if key in prod_by_subcat:
-            p_list, p_probs = prod_by_subcat[key]
-            products.append(weighted_choice(p_list, p_probs, size=1)[0])
-        else:
-            products.append(str(df["Product Name"].dropna().sample(1).iloc[0]) if "Product Name" in df.columns else "Product")
-
-    unit_prices = []
-    discounts = []
-    quantities = []
-    for i, row in seg_chosen.iterrows():
-        up = sample_normal_around(row["price_med"], row["price_scale"], minv=1.0)
-        disc = sample_normal_around(row["disc_med"], row["disc_scale"], minv=0.0, maxv=60.0)
-        q = sample_normal_around(row["qty_med"], row["qty_scale"], minv=1.0)
-
-        m = int(months_sampled[i])
-        if m in [11, 12]:
-            q *= (1.0 + SEASONAL_STRENGTH / 2)
-        if m in [2, 3]:
-            q *= (1.0 - SEASONAL_STRENGTH / 3)
-
-        unit_prices.append(float(up))
-        discounts.append(float(disc))
-        quantities.append(int(round(q)))
-
-    unit_prices = np.array(unit_prices)
-    discounts = np.array(discounts)
-    quantities = np.array(quantities)
+    unit_prices = sample_normal_around(seg_col("price_med"), seg_col("price_scale"), rng, minv=1.0)
+    discounts = sample_normal_around(seg_col("disc_med"), seg_col("disc_scale"), rng, minv=0.0, maxv=60.0)
+    q = sample_normal_around(seg_col("qty_med"), seg_col("qty_scale"), rng, minv=1.0)
 
-    sales = unit_prices * quantities * (1.0 - discounts / 100.0)
+    # Seasonal demand: more in Nov/Dec, less in Feb/Mar
+    q = np.where(np.isin(months_sampled, [11, 12]), q * (1.0 + SEASONAL_STRENGTH / 2), q)
+    q = np.where(np.isin(months_sampled, [2, 3]), q * (1.0 - SEASONAL_STRENGTH / 3), q)
+    quantities = np.round(q).astype(int)
 
-    if "Profit" in df.columns and "Sales" in df.columns:
-        df_nonzero = df[(df["Sales"] > 0) & (df["Profit"].notna())].copy()
-        df_nonzero["margin"] = df_nonzero["Profit"] / df_nonzero["Sales"]
-        margin_by_cat = df_nonzero.groupby("Category")["margin"].median().to_dict()
-    else:
-        margin_by_cat = {}
+    sales = unit_prices * quantities * (1.0 - discounts / 100.0)
 
-    profits = []
-    for cat, s in zip(cats, sales):
-        base_margin = margin_by_cat.get(cat, 0.15)
-        noise = np.random.normal(0, 0.04)
-        m = clamp(base_margin + noise, 0.01, 0.40)
-        profits.append(float(s * m))
-    profits = np.array(profits)
+    margins = np.clip(sampler["seg_margins"][seg_idx] + rng.normal(0, 0.04, size=n), 0.01, 0.40)
+    profits = sales * margins
 
-    pm = weighted_choice(payment_modes, pm_probs, size=n_new)
-    cust_names = make_customer_names(n_new)
-    order_ids = generate_order_id(start_id, n_new)
+    pm = weighted_choice(sampler["payment_modes"], sampler["pm_probs"], n, rng)
+    cust_names = make_customer_names(n, rng)
+    order_ids = generate_order_id(start_id, n)
 
-    new_df = pd.DataFrame({
+    return pd.DataFrame({
         "Order ID": order_ids,
         "Order Date": order_dates,
         "Customer Name": cust_names,
-        "Region": regions,
+        "Region": seg_col("Region"),
         "City": cities,
-        "Category": cats,
-        "Sub-Category": subcats,
+        "Category": seg_col("Category"),
+        "Sub-Category": seg_col("Sub-Category"),
         "Product Name": products,
         "Quantity": quantities,
         "Unit Price": np.round(unit_prices, 2),
@@ -282,12 +278,156 @@ def main():
         "Payment Mode": pm
     })
 
-    out = pd.concat([df.drop(columns=["Order_Year", "Order_Month"], errors="ignore"), new_df], ignore_index=True)
 
-    out["Order Date"] = safe_to_datetime(out["Order Date"])
+def expand_dataset(rows: int, seed: int = RANDOM_SEED, input_path=INPUT_CSV):
+    """
+    The input orders plus synthetic ones up to rows in total, sorted by date, with
+    "Order Date" as YYYY-MM-DD text (the layout of Ecommerce_Sales_Data_Expanded.csv).
+    """
+    input_path = Path(input_path)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Could not find {input_path}.")
+
+    rng = np.random.default_rng(seed)
+    df = load_input(input_path)
+    sampler = fit_sampler(df)
+
+    n_new = max(0, rows - len(df))
+    print(f"Original rows: {len(df)}")
+    print(f"Generating additional rows: {n_new}")
+    out = df.drop(columns=["Order_Year", "Order_Month"], errors="ignore")
+    if n_new == 0:
+        print("Target rows <= current rows. Nothing to generate.")
+    else:
+        new_df = sample_orders(sampler, n_new, sampler["start_id"], rng)
+        out = pd.concat([out, new_df], ignore_index=True)
+
     out = out.sort_values("Order Date").reset_index(drop=True)
-    out["Order Date"] = out["Order Date"].dt.strftime("%Y-%m-%d")
+    out["Order Date"] = np.datetime_as_string(out["Order Date"].to_numpy(dtype="datetime64[D]"), unit="D")
+    return out
+
+
+# ----------------------------
+# Sharded generation
+# ----------------------------
+_shard_sampler = {}
+
+
+def _init_shard_worker(sampler):
+    # Pool initializer: the fitted sampler is sent to each worker process once
+    _shard_sampler.clear()
+    _shard_sampler.update(sampler)
+
+
+def _write_partitions(chunk, out_dir: Path, shard: int, part: int, fmt: str):
+    """
+    Writes one chunk into year=YYYY/month=MM partitions. Files get a .tmp suffix until
+    the shard is complete. Returns the paths written.
+    """
+    chunk = chunk.sort_values("Order Date", kind="stable")
+    dates = chunk["Order Date"].to_numpy(dtype="datetime64[D]")
+    month_keys = dates.astype("datetime64[M]").astype(int)
+    chunk["Order Date"] = np.datetime_as_string(dates, unit="D")
+
+    written = set()
+    for key, group in chunk.groupby(month_keys, sort=True):
+        year, month = 1970 + int(key) // 12, int(key) % 12 + 1
+        folder = out_dir / f"year={year}" / f"month={month:02d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        if fmt == "parquet":
+            path = folder / f"part-{shard:05d}-{part:04d}.parquet.tmp"
+            group.to_parquet(path, index=False)
+        else:
+            path = folder / f"part-{shard:05d}.csv.tmp"
+            group.to_csv(path, mode="a", header=not path.exists(), index=False)
+        written.add(path)
+    return written
+
+
+def generate_shard(shard: int, n_rows: int, start_id: int, seed_seq, out_dir: Path, fmt: str,
+                   chunk_rows: int = CHUNK_ROWS):
+    """
+    Worker job: streams n_rows orders to out_dir, chunk_rows at a time, so memory stays
+    flat however large the shard. The result depends only on (seed_seq, n_rows, chunk_rows).
+    """
+    # Drop leftovers of an interrupted earlier run of this shard
+    for stale in out_dir.glob(f"year=*/month=*/part-{shard:05d}*.tmp"):
+        stale.unlink()
+
+    rng = np.random.default_rng(seed_seq)
+    written = set()
+    for part, offset in enumerate(range(0, n_rows, chunk_rows)):
+        n = min(chunk_rows, n_rows - offset)
+        chunk = sample_orders(_shard_sampler, n, start_id + offset, rng)
+        written |= _write_partitions(chunk, out_dir, shard, part, fmt)
+
+    for path in written:
+        os.replace(path, path.with_suffix(""))
+    return shard, n_rows
+
+
+def generate_sharded(rows: int, out_dir: Path, fmt: str = "csv", shard_rows: int = SHARD_ROWS,
+                     workers: int = None, seed: int = RANDOM_SEED):
+    """
+    Generates rows synthetic orders (input rows not included) as shards in a process
+    pool. The sampler is fitted once and shared; each shard gets its own child of
+    SeedSequence(seed), so the output is reproducible whatever the worker count.
+    """
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow (pip install pyarrow)")
+
+    input_path = Path(INPUT_CSV)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Could not find {INPUT_CSV} in this folder.")
+    sampler = fit_sampler(load_input(input_path))
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_shards = -(-rows // shard_rows)
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    print(f"Generating {rows} rows in {n_shards} shards of up to {shard_rows} rows -> {out_dir} ({fmt})")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker, initargs=(sampler,)) as pool:
+        futures = [
+            pool.submit(generate_shard, shard, min(shard_rows, rows - shard * shard_rows),
+                        sampler["start_id"] + shard * shard_rows, seeds[shard], out_dir, fmt)
+            for shard in range(n_shards)
+        ]
+        for future in as_completed(futures):
+            shard, n = future.result()
+            print(f"Shard {shard}: {n} rows")
+
+    (out_dir / "_manifest.json").write_text(json.dumps({
+        "rows": rows, "shards": n_shards, "shard_rows": shard_rows, "chunk_rows": CHUNK_ROWS,
+        "seed": seed, "format": fmt, "input": INPUT_CSV,
+    }, indent=1))
+    print(f"Saved partitioned dataset: {out_dir}")
+
+
+# ----------------------------
+# Main
+# ----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic e-commerce orders.")
+    parser.add_argument("--rows", type=int, default=None,
+                        help=f"total rows (default {TARGET_ROWS}, input rows included unless --out-dir)")
+    parser.add_argument("--out-dir", default=None,
+                        help="sharded mode: write year=/month= partitions here instead of one CSV")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    args = parser.parse_args()
+
+    if args.out_dir:
+        generate_sharded(args.rows or TARGET_ROWS, Path(args.out_dir), args.format,
+                         args.shard_rows, args.workers, args.seed)
+        return
 
+    out = expand_dataset(args.rows or TARGET_ROWS, args.seed)
     out.to_csv(OUTPUT_CSV, index=False)
     print(f"Saved expanded dataset: {OUTPUT_CSV}")
     print(f"Total rows now: {len(out)}")
@@ -0,0 +1,178 @@
+"""
+Bounded executor for the CPU-bound work behind the API (model predict, forecasting).
+
+The endpoints in main.py are async, so running pandas/sklearn directly in them
+blocks the event loop: one slow forecast stalls every other request on the worker,
+static files included. InferencePool runs that work in a thread pool or a process
+pool instead, and caps how much work may be waiting so an overloaded server
+answers 503 + Retry-After rather than queueing without bound.
+
+In "process" mode each pool process loads the models once, using the module-level
+functions at the bottom of this file. Forecast jobs bring their data with them.
+"""
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class InferencePool:
+    """
+    Thread or process pool with at most max_workers running and max_queue waiting jobs.
+    """
+
+    def __init__(self, mode: str, max_workers: int, max_queue: int,
+                 start_method: str = "spawn", initializer=None, initargs=()):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor mode: {mode!r}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._start_method = start_method
+        self._initializer = initializer
+        self._initargs = initargs
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            # serve.py forks workers after main.py built this pool: each worker
+            # needs its own executor (and its own pool processes)
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self._start_method),
+                initializer=self._initializer,
+                initargs=self._initargs,
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.pending += 1
+
+    def _release(self, ok: bool):
+        with self._lock:
+            self.pending -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    async def run(self, fn, *args):
+        """
+        Runs fn(*args) in the pool. Raises PoolSaturated when the queue is full.
+        """
+        self._acquire()
+        ok = False
+        if self.mode == "thread":
+            # Like asyncio.to_thread: fn sees the caller's context variables
+            fn, args = contextvars.copy_context().run, (fn, *args)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            ok = True
+            return result
+        finally:
+            self._release(ok)
+
+    def stats(self):
+        with self._lock:
+            pending = self.pending
+            return {
+                "mode": self.mode,
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": min(pending, self.max_workers),
+                "queue_depth": max(0, pending - self.max_workers),
+                "saturation": round(pending / self.capacity, 4) if self.capacity else 1.0,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# =============================
+# Process-pool worker side
+# =============================
+_worker = {}
+
+
+def init_worker(model_paths: dict, samples: dict):
+    """
+    Pool initializer: remembers where the artifacts live. Models are loaded on
+    first use (and reloaded when the parent reports a new file fingerprint).
+    """
+    _worker.clear()
+    _worker.update({
+        "model_paths": model_paths,
+        "samples": samples,
+        "models": {},
+    })
+
+
+def _worker_predictor(kind: str, fingerprint):
+    import joblib
+    from fast_inference import compile_pipeline
+
+    loaded = _worker["models"].get(kind)
+    if loaded is None or loaded[0] != fingerprint:
+        model = joblib.load(_worker["model_paths"][kind])
+        sample = _worker["samples"].get(kind)
+        compiled = compile_pipeline(model, sample) if sample is not None else None
+        loaded = (fingerprint, model, compiled)
+        _worker["models"][kind] = loaded
+    return loaded[1], loaded[2]
+
+
+def score_rows(kind: str, rows: list, columns: list, fingerprint=None):
+    """
+    Scores feature rows with the process-local copy of the demand/sales model.
+    """
+    model, compiled = _worker_predictor(kind, fingerprint)
+    if compiled is not None:
+        return [float(v) for v in compiled.predict(rows)]
+
+    import pandas as pd
+    return [float(v) for v in model.predict(pd.DataFrame(rows, columns=columns))]
+
+
+def score_sweep(base: dict, axes: dict, columns: list, fingerprint=None):
+    """
+    Builds the sales sweep grid of base x axes here, in the worker, and scores it.
+    """
+    from features import sweep_rows
+
+    return score_rows("sales", sweep_rows(base, axes), columns, fingerprint)
+
+
+def run_forecast(frame, horizon: int, category):
+    """
+    forecast_sales on frame, the category's precomputed monthly series, sent by the
+    parent from its current serving state.
+    """
+    from forecasting import forecast_sales
+
+    return forecast_sales(frame, horizon=horizon, category=category)
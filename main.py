@@ -1,116 +1,866 @@
+from __future__ import annotations
+
 from fastapi import FastAPI, Request, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-import pandas as pd
-import joblib
+import asyncio
+import contextvars
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+import hashlib
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 
 APP_DIR = Path(__file__).parent
 
-DATA_PATH = APP_DIR / "Ecommerce_Sales_Data_Expanded.csv"
+DATA_PATH = Path(os.environ.get("BA_DATA_PATH", str(APP_DIR / "Ecommerce_Sales_Data_Expanded.csv")))
 SALES_MODEL_PATH = APP_DIR / "best_sales_model.pkl"
 QTY_MODEL_PATH = APP_DIR / "best_quantity_model.pkl"
 
-# New Forecasting Module
-from forecasting import forecast_sales
+# Startup: "full" loads the models and the dataset (and warms them up) before serving;
+# "lazy" starts with the dropdown options only (saved next to the snapshot by a full
+# start) and loads the rest on the first request that needs it
+STARTUP_MODE = os.environ.get("BA_STARTUP", "full")
+WARMUP = os.environ.get("BA_WARMUP", "1") != "0"
+
+# Columnar snapshot of the cleaned dataset (BA_SNAPSHOT=0 always parses the CSV)
+SNAPSHOT_DIR = Path(os.environ.get("BA_SNAPSHOT_DIR", str(APP_DIR / "data_snapshot")))
+USE_SNAPSHOT = os.environ.get("BA_SNAPSHOT", "1") != "0"
+# Memory-map the snapshot columns (shared page cache across worker processes; set by serve.py)
+SNAPSHOT_MMAP = "r" if USE_SNAPSHOT and os.environ.get("BA_SNAPSHOT_MMAP", "0") == "1" else None
+
+# Upper bound on records per /batch request
+MAX_BATCH_SIZE = int(os.environ.get("BA_MAX_BATCH_SIZE", "5000"))
+
+# Most grid points one /api/predict/sales/sweep request may ask for
+MAX_SWEEP_POINTS = int(os.environ.get("BA_MAX_SWEEP_POINTS", "10000"))
+
+# Streaming NDJSON predictions (/api/predict/{demand,sales}/stream): records scored per
+# chunk, and the most records one request may send
+STREAM_CHUNK_ROWS = int(os.environ.get("BA_STREAM_CHUNK_ROWS", "2000"))
+MAX_STREAM_ROWS = int(os.environ.get("BA_MAX_STREAM_ROWS", "1000000"))
+
+# Prediction cache (0 entries disables it)
+PREDICTION_CACHE_SIZE = int(os.environ.get("BA_PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.environ.get("BA_PREDICTION_CACHE_TTL", "3600"))
+# Browser/proxy cache lifetime for the dropdown options (revalidated with ETag afterwards)
+OPTIONS_MAX_AGE = int(os.environ.get("BA_OPTIONS_MAX_AGE", "300"))
+
+# Compiled (DataFrame-free) inference; checked against Pipeline.predict on a sample first
+FAST_INFERENCE = os.environ.get("BA_FAST_INFERENCE", "1") != "0"
+FAST_PATH_CHECK_ROWS = 256
+
+# Executor for model predict / forecasting ("thread" or "process"), so CPU-bound
+# work never runs on the event loop. Beyond WORKERS + QUEUE pending jobs -> 503.
+INFERENCE_EXECUTOR = os.environ.get("BA_INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.environ.get("BA_INFERENCE_WORKERS", str(min(8, os.cpu_count() or 1))))
+INFERENCE_QUEUE = int(os.environ.get("BA_INFERENCE_QUEUE", "64"))
+INFERENCE_START_METHOD = os.environ.get("BA_INFERENCE_START_METHOD", "spawn")
+RETRY_AFTER_SECONDS = int(os.environ.get("BA_RETRY_AFTER", "1"))
+
+# Micro-batching of concurrent single predictions (window 0 disables it)
+BATCH_WINDOW_MS = float(os.environ.get("BA_BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.environ.get("BA_BATCH_MAX_SIZE", "64"))
+
+# Forecast results cache + background warm-up of every category at the default horizon
+FORECAST_CACHE_SIZE = int(os.environ.get("BA_FORECAST_CACHE_SIZE", "256"))
+FORECAST_CACHE_TTL = float(os.environ.get("BA_FORECAST_CACHE_TTL", "86400"))
+FORECAST_WARM = os.environ.get("BA_FORECAST_WARM", "1") != "0"
+DEFAULT_FORECAST_HORIZON = 12
+MAX_FORECAST_HORIZON = int(os.environ.get("BA_MAX_FORECAST_HORIZON", "60"))
+
+# Background job forecasting every Category x Sub-Category x Region series into a
+# SQLite store (POST /api/forecast/segments/run, reads on GET /api/forecast/segments)
+SEGMENT_FORECAST_DB = Path(os.environ.get("BA_SEGMENT_FORECAST_DB", str(APP_DIR / "segment_forecasts.sqlite")))
+SEGMENT_FORECAST_WORKERS = int(os.environ.get("BA_SEGMENT_FORECAST_WORKERS", str(os.cpu_count() or 1)))
+SEGMENT_FORECAST_TIME_LIMIT = float(os.environ.get("BA_SEGMENT_FORECAST_TIME_LIMIT", "60"))
+
+# Live ingestion of new orders (POST /api/ingest/orders and/or CSV files dropped into
+# BA_INGEST_DIR). Accepted rows are also appended to the dataset CSV unless BA_INGEST_PERSIST=0.
+# The API endpoint is disabled unless BA_INGEST_TOKEN is set (sent as X-Ingest-Token).
+INGEST_DIR = os.environ.get("BA_INGEST_DIR", "")
+INGEST_POLL_SECONDS = float(os.environ.get("BA_INGEST_POLL_SECONDS", "2"))
+INGEST_PERSIST = os.environ.get("BA_INGEST_PERSIST", "1") != "0"
+INGEST_TOKEN = os.environ.get("BA_INGEST_TOKEN", "")
+# serve.py turns ingestion off when it forks several workers: each holds its own serving
+# state, so an ingest would only reach the worker that handled it
+INGEST_ENABLED = True
+MAX_INGEST_ROWS = int(os.environ.get("BA_MAX_INGEST_ROWS", "50000"))
+
+# How often (seconds) to stat the model/data files for changes
+ARTIFACT_CHECK_INTERVAL = float(os.environ.get("BA_ARTIFACT_CHECK_INTERVAL", "5"))
+
+# Admin endpoints (/api/admin/...: on-demand profiling, slow-request log) need this
+# value in the X-Admin-Token header; unset = admin endpoints disabled
+ADMIN_TOKEN = os.environ.get("BA_ADMIN_TOKEN", "")
+PROFILE_DIR = Path(os.environ.get("BA_PROFILE_DIR", str(APP_DIR / "profiles")))
+# Predict/forecast requests slower than this (ms) are logged with payload + stage timings (0 = off)
+SLOW_REQUEST_MS = float(os.environ.get("BA_SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_LOG = os.environ.get("BA_SLOW_REQUEST_LOG", str(APP_DIR / "slow_requests.jsonl"))
+
+from features import (DEMAND_FEATURES, SALES_FEATURES, demand_key, demand_row, demand_response,
+                      sales_features, sweep_rows)
+from options_cache import json_etag, read_options_cache, write_options_cache
+import inference_pool
+from inference_pool import InferencePool, PoolSaturated
+from metrics import Registry, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from profiling import Profiler, SlowRequestLog, SlowRequestMiddleware, add_to_trace, record_stage, start_trace
+
+
+# ✅ Startup phases, run from the app lifespan (serve.py runs them before forking):
+#   full: import_libraries, load_models, load_data, build_indexes, compile_models,
+#         executor, warmup
+#   lazy: options (from the options cache) only; the full phases run on the first
+#         request that needs the models or the dataset
+# Importing this module stays cheap: pandas, sklearn & co. are imported by the first phase.
+STARTUP_TIMINGS = {}    # phase -> seconds (plus the data loader's own steps)
+STARTUP = {"loaded": False, "ready": False, "error": None}
+_startup_lock = threading.Lock()
+_startup_task = None        # task running the startup phases after the lifespan yields
+_lazy_load = None           # task of the on-demand load (lazy mode)
+_background_started = False
+
+# Filled in by the phases
+DATA = None                 # ServingState
+LAZY_OPTIONS = None         # (options, etag) from the options cache, lazy mode
+sales_model = qty_model = None
+_predictors = {}
+INFERENCE_POOL = None
+SEGMENT_STORE = SEGMENT_JOB = None
+
+# Served while the startup phases are still running
+PROBE_PATHS = {"/healthz", "/readyz", "/metrics"}
+# Served without the models or the dataset in lazy mode (plus /static/...)
+LIGHT_PATHS = PROBE_PATHS | {"/", "/api/options", "/api/options/subcategories"}
+
+
+def _run_phase(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    STARTUP_TIMINGS[name] = time.perf_counter() - start
+    print(f"[startup] {name}: {STARTUP_TIMINGS[name]:.3f}s")
+    return result
+
+
+def _import_libraries():
+    global pd, joblib, forecast_sales, load_serving_data, clean_orders, compact_orders, memory_footprint
+    global format_timings, DATE_PART_COLS, ServingState, rollup, SegmentForecastStore, JobProgress, run_job
+    global compile_pipeline
+    import pandas as pd
+    import joblib
+    # New Forecasting Module
+    from forecasting import forecast_sales
+    from data_loader import (load_serving_data, clean_orders, compact_orders, memory_footprint,
+                             format_timings, DATE_PART_COLS)
+    from serving_state import ServingState
+    from analytics import rollup
+    from segment_forecasts import SegmentForecastStore, JobProgress, run_job
+    from fast_inference import compile_pipeline
+
+
+def _load_models():
+    global sales_model, qty_model
+    sales_model = joblib.load(SALES_MODEL_PATH)     # per-order sales
+    qty_model = joblib.load(QTY_MODEL_PATH)         # aggregated demand (monthly segment)
+    _artifacts.update(fingerprints=_artifact_fingerprints(), checked_at=time.monotonic())
 
-app = FastAPI(title="Business Analytics Predictor")
+
+def _save_options_cache(state):
+    try:
+        write_options_cache(SNAPSHOT_DIR, state.options, state.options_etag, DATA_PATH)
+    except OSError as e:
+        print(f"[startup] could not save the options cache: {e}")
+
+
+def _compile_models():
+    global _predictors
+    # kind -> (fitted Pipeline, CompiledPipeline or None); replaced as a whole on model reload
+    _predictors = {
+        "demand": (qty_model, _compile_fast_path("demand", qty_model)),
+        "sales": (sales_model, _compile_fast_path("sales", sales_model)),
+    }
+
+
+def _start_executor():
+    global INFERENCE_POOL, SEGMENT_STORE, SEGMENT_JOB
+    # ✅ Inference executor (keeps pandas/sklearn work off the asyncio event loop)
+    INFERENCE_POOL = InferencePool(
+        INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_QUEUE,
+        start_method=INFERENCE_START_METHOD,
+        initializer=inference_pool.init_worker,
+        initargs=(
+            {"demand": str(QTY_MODEL_PATH), "sales": str(SALES_MODEL_PATH)},
+            {kind: _fast_path_sample(kind) for kind in ("demand", "sales")} if FAST_INFERENCE else {},
+        ),
+    )
+    SEGMENT_STORE = SegmentForecastStore(SEGMENT_FORECAST_DB)
+    SEGMENT_JOB = JobProgress()
+
+
+def _warm_up_rows(kind: str):
+    state = DATA
+    sample = state.qty_agg[DEMAND_FEATURES] if kind == "demand" else state.orders[SALES_FEATURES]
+    return sample.head(1).to_dict("records")
+
+
+def _warm_up():
+    """
+    One predict per model on the path requests take, and the "All" forecast, so
+    the first real request does not pay for lazy initialization in sklearn/numpy.
+    """
+    for kind, columns in (("demand", DEMAND_FEATURES), ("sales", SALES_FEATURES)):
+        model, compiled = _predictors[kind]
+        rows = _warm_up_rows(kind)
+        if compiled is not None:
+            compiled.predict(rows)
+        model.predict(pd.DataFrame(rows, columns=columns))
+    _warm_forecasts(["All"])
+
+
+def load_all():
+    """
+    Runs the full startup phases once (later calls return at once).
+    """
+    global DATA
+    with _startup_lock:
+        if STARTUP["loaded"]:
+            return
+        _run_phase("import_libraries", _import_libraries)
+        _run_phase("load_models", _load_models)
+        # Dataset (for dropdowns + demand stats) + monthly segment stats table (qty_agg),
+        # from the columnar snapshot when it is up to date with the CSV
+        orders, qty_agg = _run_phase("load_data", load_serving_data, DATA_PATH,
+                                     SNAPSHOT_DIR if USE_SNAPSHOT else None, STARTUP_TIMINGS, SNAPSHOT_MMAP)
+        # ✅ Serving state: dropdown lists, options catalog, hash-indexed segment stats and the
+        # monthly forecast series. Ingestion swaps DATA for a new state, so every handler
+        # reads DATA once and works with that object.
+        DATA = _run_phase("build_indexes", ServingState.build, orders, qty_agg)
+        del orders, qty_agg   # use DATA.orders / DATA.qty_agg: they change on ingestion
+        _save_options_cache(DATA)
+        _run_phase("compile_models", _compile_models)
+        _run_phase("executor", _start_executor)
+        if WARMUP:
+            _run_phase("warmup", _warm_up)
+        STARTUP["loaded"] = True
+
+    print(f"[startup] {len(DATA.orders)} orders loaded: {format_timings(STARTUP_TIMINGS)}")
+    print(f"[startup] dataset memory: orders={memory_footprint(DATA.orders) / 2**20:.1f} MB, "
+          f"qty_agg={memory_footprint(DATA.qty_agg) / 2**20:.1f} MB")
+    print("[startup] fast-path inference: " + ", ".join(
+        f"{kind}={'on' if compiled is not None else 'off'}" for kind, (_, compiled) in _predictors.items()
+    ))
+
+
+def _load_options():
+    global LAZY_OPTIONS
+    LAZY_OPTIONS = read_options_cache(SNAPSHOT_DIR, DATA_PATH)
+
+
+def startup():
+    """
+    Runs the startup phases of STARTUP_MODE (once). In lazy mode without an up-to-date
+    options cache, that is the full startup.
+    """
+    if STARTUP_MODE == "lazy" and not STARTUP["loaded"]:
+        if LAZY_OPTIONS is None:
+            _run_phase("options", _load_options)
+        if LAZY_OPTIONS is not None:
+            print("[startup] lazy: serving options; models and dataset load on first use")
+            return
+        print("[startup] lazy: no up-to-date options cache, loading everything")
+    load_all()
+
+
+async def _after_load():
+    """
+    Once per process after load_all: warms the process pool and starts the
+    background threads (which do not survive serve.py's fork, so not in load_all).
+    """
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    if WARMUP and INFERENCE_POOL.mode == "process":
+        start = time.perf_counter()
+        for kind, columns in (("demand", DEMAND_FEATURES), ("sales", SALES_FEATURES)):
+            await _run_scoring(kind, _warm_up_rows(kind), columns)
+        STARTUP_TIMINGS["warmup_pool"] = time.perf_counter() - start
+        print(f"[startup] warmup_pool: {STARTUP_TIMINGS['warmup_pool']:.3f}s")
+    _start_forecast_warmup()
+    _start_ingest_watcher()
+
+
+async def _load_on_demand():
+    print("[startup] lazy: first request that needs the models, loading")
+    await asyncio.to_thread(load_all)
+    await _after_load()
+
+
+async def _ensure_loaded():
+    global _lazy_load
+    if _lazy_load is None:
+        _lazy_load = asyncio.ensure_future(_load_on_demand())
+    try:
+        await asyncio.shield(_lazy_load)
+    except Exception:
+        if _lazy_load.done():
+            _lazy_load = None   # failed: the next request tries again
+        raise
+
+
+async def _run_startup():
+    """
+    The startup phases, run after the lifespan has yielded so the server accepts
+    connections (and answers the probes) while they run. A failed startup stops the server.
+    """
+    try:
+        await asyncio.to_thread(startup)
+        if STARTUP["loaded"]:
+            await _after_load()
+    except Exception as e:
+        STARTUP["error"] = f"{type(e).__name__}: {e}"
+        print(f"[startup] failed: {STARTUP['error']}")
+        traceback.print_exc()
+        os.kill(os.getpid(), signal.SIGTERM)
+        raise
+    STARTUP["ready"] = True
+
+
+class LazyLoadMiddleware:
+    """
+    Until startup is done, every request but the probes and static files waits for it.
+    Lazy mode: a request that needs the models or the dataset then waits for them to
+    load (one load, shared). The page, static files, options and probes never do.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] == "http" and path not in PROBE_PATHS and not path.startswith("/static/"):
+            if not STARTUP["ready"] and _startup_task is not None:
+                await asyncio.shield(_startup_task)
+            if not STARTUP["loaded"] and path not in LIGHT_PATHS:
+                await _ensure_loaded()
+        await self.app(scope, receive, send)
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    global _startup_task
+    _startup_task = asyncio.ensure_future(_run_startup())
+    yield
+    STARTUP["ready"] = False
+    if not _startup_task.done():
+        _startup_task.cancel()
+    if INFERENCE_POOL is not None:
+        INFERENCE_POOL.shutdown()
+
+
+app = FastAPI(title="Business Analytics Predictor", lifespan=_lifespan)
+app.add_middleware(LazyLoadMiddleware)
+
+# ✅ Metrics (Prometheus text format on /metrics): request latency per route, time per
+# stage of the prediction/forecast path, demand stats_mode outcomes and errors
+METRICS = Registry()
+REQUEST_SECONDS = METRICS.histogram(
+    "ba_request_duration_seconds", "HTTP request duration by route and status.", ["route", "status"])
+STAGE_SECONDS = METRICS.histogram(
+    "ba_stage_duration_seconds", "Time spent in each stage of a request.", ["endpoint", "stage"])
+STATS_MODE_TOTAL = METRICS.counter(
+    "ba_demand_stats_mode_total", "Demand predictions by source of the segment stats.", ["mode"])
+ERRORS_TOTAL = METRICS.counter(
+    "ba_errors_total", "Rejected or failed requests/records by endpoint and type.", ["endpoint", "type"])
+app.add_middleware(RequestMetricsMiddleware, duration=REQUEST_SECONDS)
+
+# ✅ Opt-in profiling (armed via /api/admin/profile) + slow-request log
+PROFILER = Profiler(PROFILE_DIR)
+SLOW_REQUESTS = None
+if SLOW_REQUEST_MS > 0:
+    SLOW_REQUESTS = SlowRequestLog(SLOW_REQUEST_MS, SLOW_REQUEST_LOG)
+    STAGE_SECONDS.listener = record_stage
+    app.add_middleware(SlowRequestMiddleware, log=SLOW_REQUESTS, prefixes=("/api/predict", "/api/forecast"))
 
 # Static + templates
 app.mount("/static", StaticFiles(directory=str(APP_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(APP_DIR / "templates"))
 
-# Load models once
-sales_model = joblib.load(SALES_MODEL_PATH)     # per-order sales
-qty_model = joblib.load(QTY_MODEL_PATH)         # aggregated demand (monthly segment)
 
-# Load dataset (for dropdowns + demand stats)
-df = pd.read_csv(DATA_PATH)
-df["Order Date"] = pd.to_datetime(df["Order Date"], errors="coerce")
+# ✅ Fast-path inference: encode request rows straight to arrays (no per-request DataFrame)
+def _fast_path_sample(kind: str):
+    sample = DATA.qty_agg[DEMAND_FEATURES] if kind == "demand" else DATA.orders[SALES_FEATURES]
+    if len(sample) > FAST_PATH_CHECK_ROWS:
+        sample = sample.sample(FAST_PATH_CHECK_ROWS, random_state=0)
+    return sample
+
 
-# Keep only rows needed for demand/sales logic
-needed_cols = ["Order Date", "Unit Price", "Discount", "Category", "Sub-Category", "Region", "City"]
-df = df.dropna(subset=[c for c in needed_cols if c in df.columns]).copy()
+def _compile_fast_path(kind: str, model):
+    if not FAST_INFERENCE:
+        return None
+    return compile_pipeline(model, _fast_path_sample(kind))
 
-df["Order_Year"] = df["Order Date"].dt.year.astype(int)
-df["Order_Month"] = df["Order Date"].dt.month.astype(int)
-df["Order_Quarter"] = df["Order Date"].dt.quarter.astype(int)
 
-# Dropdown lists (Category list is global; subcategories will be filtered via API)
-CATEGORIES = sorted(df["Category"].dropna().unique().tolist())
-SUBCATEGORIES = sorted(df["Sub-Category"].dropna().unique().tolist())
-REGIONS = sorted(df["Region"].dropna().unique().tolist())
-CITIES = sorted(df["City"].dropna().unique().tolist()) if "City" in df.columns else []
+@app.exception_handler(PoolSaturated)
+async def _pool_saturated_handler(request: Request, exc: PoolSaturated):
+    ERRORS_TOTAL.inc(request.url.path, "saturated")
+    return JSONResponse(
+        {"error": "Server is busy, please retry shortly."},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
+
+
+# ✅ Probes: /healthz = the process is up and its event loop answers (also while the
+# startup phases run); /readyz = the startup phases of BA_STARTUP are done (503 before
+# that and during shutdown). In lazy mode that means the page and options are served and
+# the models load on first use; ?models=1 also requires the models and dataset.
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(models: bool = Query(False)):
+    ready = STARTUP["ready"] and (STARTUP["loaded"] or not models)
+    body = {
+        "ready": ready,
+        "mode": STARTUP_MODE,
+        "models_loaded": STARTUP["loaded"],
+        "phases": {phase: round(seconds, 4) for phase, seconds in STARTUP_TIMINGS.items()},
+    }
+    if STARTUP["error"]:
+        body["error"] = STARTUP["error"]
+    return JSONResponse(body, status_code=200 if ready else 503)
 
-YEARS = sorted(df["Order_Year"].unique().tolist())
-MONTHS = list(range(1, 13))
 
-# ✅ Build monthly segment stats table (matches how the demand model was trained)
-qty_agg = df.groupby(["Order_Year", "Order_Month", "Category", "Sub-Category", "Region"], as_index=False).agg(
-    Avg_UnitPrice=("Unit Price", "mean"),
-    Avg_Discount=("Discount", "mean"),
-    Orders_Count=("Discount", "count")
-)
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
 
 
-def _segment_stats(category: str, sub_category: str, region: str, year: int, month: int):
+def _cacheable_json(request: Request, content, etag: str = None):
     """
-    Returns the aggregated numeric features used by the demand model:
-      Avg_UnitPrice, Avg_Discount, Orders_Count
-    Also returns stats_mode so you can verify if fallback is happening.
+    JSON response with ETag + Cache-Control; answers 304 when the client already has it.
     """
+    etag = etag or json_etag(content)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={OPTIONS_MAX_AGE}"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content, headers=headers)
 
-    # 1) Exact match for that month/year/segment
-    exact = qty_agg[
-        (qty_agg["Category"] == category) &
-        (qty_agg["Sub-Category"] == sub_category) &
-        (qty_agg["Region"] == region) &
-        (qty_agg["Order_Year"] == year) &
-        (qty_agg["Order_Month"] == month)
-    ]
 
-    if len(exact) > 0:
-        row = exact.iloc[0]
-        return float(row["Avg_UnitPrice"]), float(row["Avg_Discount"]), int(row["Orders_Count"]), "exact_month"
+def _options_and_etag():
+    # Lazy mode serves the options cache until the dataset is loaded
+    state = DATA
+    if state is None:
+        return LAZY_OPTIONS
+    return state.options, state.options_etag
 
-    # 2) Segment fallback (same segment, any month/year)
-    seg = qty_agg[
-        (qty_agg["Category"] == category) &
-        (qty_agg["Sub-Category"] == sub_category) &
-        (qty_agg["Region"] == region)
-    ]
-    if len(seg) > 0:
-        return float(seg["Avg_UnitPrice"].mean()), float(seg["Avg_Discount"].mean()), int(seg["Orders_Count"].mean()), "segment_fallback"
 
-    # 3) Global fallback
-    return float(df["Unit Price"].mean()), float(df["Discount"].mean()), int(len(df)), "global_fallback"
+@app.get("/api/options")
+def get_options(request: Request):
+    """
+    All dropdown options in one payload (categories, sub-categories per category,
+    regions, cities per region, years, months). Supports If-None-Match -> 304.
+    """
+    return _cacheable_json(request, *_options_and_etag())
 
 
 # ✅ NEW: API to get subcategories based on selected category
 @app.get("/api/options/subcategories")
-def get_subcategories(category: str = Query(...)):
-    subset = df[df["Category"] == category]
-    subs = sorted(subset["Sub-Category"].dropna().unique().tolist())
-    return {"category": category, "subcategories": subs}
+def get_subcategories(request: Request, category: str = Query(...)):
+    options, _ = _options_and_etag()
+    subs = options["subcategories_by_category"].get(category, [])
+    return _cacheable_json(request, {"category": category, "subcategories": subs})
 
 
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "categories": CATEGORIES,
-            "subcategories": SUBCATEGORIES,   # initial list, will be replaced dynamically by app.js
-            "regions": REGIONS,
-            "cities": CITIES,
-            "years": YEARS,
-            "months": MONTHS,
-        },
-    )
+    state = DATA
+    if state is None:
+        options, _ = LAZY_OPTIONS
+        lists = {
+            "categories": options["categories"],
+            "subcategories": sorted({sub for subs in options["subcategories_by_category"].values() for sub in subs}),
+            "regions": options["regions"],
+            "cities": options["cities"],
+            "years": options["years"],
+            "months": options["months"],
+        }
+    else:
+        lists = {
+            "categories": state.categories,
+            "subcategories": state.subcategories,   # initial list, will be replaced dynamically by app.js
+            "regions": state.regions,
+            "cities": state.cities,
+            "years": state.years,
+            "months": state.months,
+        }
+    return templates.TemplateResponse("index.html", {"request": request, **lists})
+
+
+# ✅ Prediction cache (LRU + TTL), invalidated when the models or the dataset change
+class PredictionCache:
+    """
+    Thread-safe LRU cache for model outputs keyed on the normalized feature tuple.
+    Entries expire after ttl_seconds; max_size=0 disables caching.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.discarded = 0
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def discard(self, predicate):
+        """
+        Drops only the entries whose key matches predicate. Returns how many were dropped.
+        """
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self.discarded += len(stale)
+            return len(stale)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "discarded": self.discarded,
+            }
+
+
+PREDICTION_CACHE = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+
+
+def _file_fingerprint(path: Path):
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _artifact_fingerprints():
+    return {
+        "demand": _file_fingerprint(QTY_MODEL_PATH),
+        "sales": _file_fingerprint(SALES_MODEL_PATH),
+        "data": _file_fingerprint(DATA_PATH),
+    }
+
+
+_artifacts = {"fingerprints": _artifact_fingerprints(), "checked_at": time.monotonic(), "reloading": False}
+_artifacts_lock = threading.Lock()
+
+
+def _artifact_version():
+    return hashlib.sha1(repr(sorted(_artifacts["fingerprints"].items())).encode()).hexdigest()[:12]
+
+
+def _check_artifacts():
+    """
+    Stats the model/data files at most every ARTIFACT_CHECK_INTERVAL seconds.
+    Called from the async handlers, so it only stats: a change is picked up by
+    _reload_artifacts in a background thread, and requests keep using the
+    current models until it swaps the new ones in.
+    """
+    if time.monotonic() - _artifacts["checked_at"] < ARTIFACT_CHECK_INTERVAL:
+        return
+    with _artifacts_lock:
+        if _artifacts["reloading"] or time.monotonic() - _artifacts["checked_at"] < ARTIFACT_CHECK_INTERVAL:
+            return
+        _artifacts["checked_at"] = time.monotonic()
+        current = _artifact_fingerprints()
+        if current == _artifacts["fingerprints"]:
+            return
+        _artifacts["reloading"] = True
+    threading.Thread(target=_reload_artifacts, args=(current,), name="model-reload", daemon=True).start()
+
+
+def _reload_artifacts(current: dict):
+    """
+    Loads + compiles every replaced .pkl, then swaps _predictors in one assignment
+    and clears the prediction cache (a data-only change just clears the cache).
+    """
+    global qty_model, sales_model, _predictors
+
+    previous = _artifacts["fingerprints"]
+    predictors = dict(_predictors)
+    try:
+        if current["demand"] != previous["demand"]:
+            model = joblib.load(QTY_MODEL_PATH)
+            predictors["demand"] = (model, _compile_fast_path("demand", model))
+        if current["sales"] != previous["sales"]:
+            model = joblib.load(SALES_MODEL_PATH)
+            predictors["sales"] = (model, _compile_fast_path("sales", model))
+    except Exception as e:
+        # File is probably still being written; retried on the next check
+        print(f"[models] reload failed, keeping the current models: {e}")
+    else:
+        qty_model, sales_model = predictors["demand"][0], predictors["sales"][0]
+        _predictors = predictors
+        _artifacts["fingerprints"] = current
+        PREDICTION_CACHE.clear()
+    finally:
+        _artifacts["reloading"] = False
+
+
+def _score_rows(kind: str, rows: list, columns: list):
+    """
+    Runs the model (thread-pool job): compiled fast path when available,
+    the original pipeline otherwise.
+    """
+    model, compiled = _predictors[kind]
+    if compiled is not None:
+        with STAGE_SECONDS.time(kind, "predict"):
+            values = compiled.predict(rows)
+    else:
+        with STAGE_SECONDS.time(kind, "dataframe"):
+            frame = pd.DataFrame(rows, columns=columns)
+        with STAGE_SECONDS.time(kind, "predict"):
+            values = model.predict(frame)
+    return [float(v) for v in values]
+
+
+async def _run_scoring(kind: str, rows: list, columns: list):
+    # "executor": queue wait + predict (+ IPC in process mode)
+    with STAGE_SECONDS.time(kind, "executor"):
+        if INFERENCE_POOL.mode == "process":
+            return await INFERENCE_POOL.run(
+                inference_pool.score_rows, kind, rows, columns, _artifacts["fingerprints"][kind]
+            )
+        return await INFERENCE_POOL.run(_score_rows, kind, rows, columns)
+
+
+# ✅ Micro-batching: concurrent single-row predictions share one vectorized predict
+class MicroBatcher:
+    """
+    Collects single rows for one model for up to window_ms (or until max_batch rows
+    are waiting) and scores them with one predict call; each caller gets its own value.
+    Rows that arrive while a batch is running are sent as soon as it finishes, so
+    batches grow with load and an idle server only adds the window to latency.
+    Runs entirely on the event loop, so no locking is needed.
+    A batch runs in its own empty context, not the first caller's: its stage timings
+    are handed to every caller in the batch, with batch_rows.
+    """
+
+    def __init__(self, kind: str, columns: list, window_ms: float, max_batch: int):
+        self.kind = kind
+        self.columns = columns
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = []          # (row, future)
+        self._timer = None
+        self._running = set()
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    async def submit(self, row: dict) -> float:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        value, stages = await future
+        add_to_trace(stages)
+        return value
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.get_running_loop().create_task(self._score(batch), context=contextvars.Context())
+            self._running.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task):
+        self._running.discard(task)
+        if self._pending and self._timer is not None:
+            self._flush()
+
+    async def _score(self, batch):
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        trace = start_trace()
+        try:
+            values = await _run_scoring(self.kind, [row for row, _ in batch], self.columns)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        stages = [{**entry, "batch_rows": len(batch)} for entry in trace]
+        for (_, future), value in zip(batch, values):
+            if not future.done():
+                future.set_result((value, stages))
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "waiting": len(self._pending),
+        }
+
+
+BATCHERS = {}
+if BATCH_WINDOW_MS > 0 and BATCH_MAX_SIZE > 1:
+    BATCHERS = {
+        "demand": MicroBatcher("demand", DEMAND_FEATURES, BATCH_WINDOW_MS, BATCH_MAX_SIZE),
+        "sales": MicroBatcher("sales", SALES_FEATURES, BATCH_WINDOW_MS, BATCH_MAX_SIZE),
+    }
+
+
+def _claim_profile(route: str, categories=()):
+    # No session armed (the normal case): one attribute check
+    if PROFILER.session is None:
+        return None
+    return PROFILER.claim(route, categories)
+
+
+async def _run_profiled(profile, label: str, fn, *args):
+    """
+    fn(*args) under the profiler, in this process: on INFERENCE_POOL in thread mode,
+    in a plain thread in process mode (the profile has to be taken where fn runs).
+    """
+    session, seq = profile
+    if INFERENCE_POOL.mode == "thread":
+        return await INFERENCE_POOL.run(PROFILER.run, session, seq, label, fn, *args)
+    return await asyncio.to_thread(PROFILER.run, session, seq, label, fn, *args)
+
+
+async def _predict_rows(kind: str, rows: list, columns: list, profile=None):
+    """
+    Scores feature rows with the demand or sales model, serving repeats from
+    PREDICTION_CACHE. Only cache misses are scored: a single row goes through the
+    micro-batcher, several rows are sent as one job on INFERENCE_POOL.
+    With profile (from _claim_profile) all rows are scored under the profiler instead.
+    """
+    _check_artifacts()
+
+    if profile is not None:
+        return await _run_profiled(profile, kind, _score_rows, kind, rows, columns)
+
+    with STAGE_SECONDS.time(kind, "cache_lookup"):
+        keys = [(kind, *(row[c] for c in columns)) for row in rows]
+        preds = [PREDICTION_CACHE.get(key) for key in keys]
+        missing = [i for i, pred in enumerate(preds) if pred is None]
+
+    if missing:
+        missing_rows = [rows[i] for i in missing]
+        if len(missing_rows) == 1 and kind in BATCHERS:
+            # "batched": batching window + executor, as seen by this request
+            with STAGE_SECONDS.time(kind, "batched"):
+                values = [await BATCHERS[kind].submit(missing_rows[0])]
+        else:
+            values = await _run_scoring(kind, missing_rows, columns)
+        for i, pred in zip(missing, values):
+            preds[i] = float(pred)
+            PREDICTION_CACHE.put(keys[i], preds[i])
+    return preds
+
+
+def _demand_features(payload: dict, state: ServingState):
+    """
+    features.demand_features with the segment stats lookup timed.
+    Raises on a malformed payload. Returns (feature row, stats_mode).
+    """
+    key = demand_key(payload)
+    with STAGE_SECONDS.time("demand", "stats_lookup"):
+        avg_price, avg_discount, orders_count, mode = state.segment_stats_for(*key)
+    return demand_row(key, avg_price, avg_discount, orders_count), mode
+
+
+def _batch_records(payload: dict):
+    """
+    Returns the list of records from a batch payload, or an error message.
+    """
+    records = payload.get("records")
+    if not isinstance(records, list):
+        return None, "Batch payload must contain a 'records' list."
+    if len(records) > MAX_BATCH_SIZE:
+        return None, f"Batch too large ({len(records)} records, max {MAX_BATCH_SIZE})."
+    return records, None
+
+
+def _timed_json(endpoint: str, content, status_code: int = 200):
+    """
+    JSONResponse built here (same output as returning the dict) so the JSON encoding
+    shows up as the "serialize" stage.
+    """
+    with STAGE_SECONDS.time(endpoint, "serialize"):
+        return JSONResponse(content, status_code=status_code)
 
 
 @app.post("/api/predict/demand")
@@ -125,44 +875,58 @@ async def predict_demand(payload: dict):
       used_features
     """
     try:
-        category = str(payload["category"])
-        sub_category = str(payload["sub_category"])
-        region = str(payload["region"])
-        year = int(payload["year"])
-        month = int(payload["month"])
+        with STAGE_SECONDS.time("demand", "features"):
+            row, mode = _demand_features(payload, DATA)
     except Exception:
+        ERRORS_TOTAL.inc("demand", "invalid_payload")
         return JSONResponse({"error": "Invalid payload for demand prediction."}, status_code=400)
+    STATS_MODE_TOTAL.inc(mode)
+
+    profile = _claim_profile("/api/predict/demand", (row["Category"],))
+    pred = (await _predict_rows("demand", [row], DEMAND_FEATURES, profile))[0]
 
-    avg_price, avg_discount, orders_count, mode = _segment_stats(category, sub_category, region, year, month)
+    return _timed_json("demand", demand_response(pred, row, mode))
 
-    # IMPORTANT: feature names must match training EXACTLY
-    X = pd.DataFrame([{
-        "Category": category,
-        "Sub-Category": sub_category,
-        "Region": region,
-        "Order_Year": year,
-        "Order_Month": month,
-        "Avg_UnitPrice": avg_price,
-        "Avg_Discount": avg_discount,
-        "Orders_Count": orders_count
-    }])
 
-    pred = float(qty_model.predict(X)[0])
+@app.post("/api/predict/demand/batch")
+async def predict_demand_batch(payload: dict):
+    """
+    Input: { "records": [ {category, sub_category, region, year, month}, ... ] }
 
-    # Demand is a count -> return integer + non-negative
-    pred_int = int(round(pred))
-    if pred_int < 0:
-        pred_int = 0
+    Output:
+      results: one entry per record (same order), either the single-prediction
+               output or { "error": ... } for a record that could not be parsed.
+    Cache misses among the valid records are scored with a single predict call.
+    """
+    records, error = _batch_records(payload)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
 
-    return {
-        "predicted_total_quantity": pred_int,
-        "stats_mode": mode,
-        "used_features": {
-            "Avg_UnitPrice": round(avg_price, 2),
-            "Avg_Discount": round(avg_discount, 2),
-            "Orders_Count": int(orders_count)
-        }
-    }
+    state = DATA
+    results = [None] * len(records)
+    rows, modes, positions = [], [], []
+    with STAGE_SECONDS.time("demand_batch", "features"):
+        for i, record in enumerate(records):
+            try:
+                row, mode = _demand_features(record, state)
+            except Exception:
+                results[i] = {"index": i, "error": "Invalid payload for demand prediction."}
+                continue
+            rows.append(row)
+            modes.append(mode)
+            positions.append(i)
+    for mode, count in Counter(modes).items():
+        STATS_MODE_TOTAL.inc(mode, amount=count)
+    if len(rows) < len(records):
+        ERRORS_TOTAL.inc("demand_batch", "invalid_record", amount=len(records) - len(rows))
+
+    if rows:
+        profile = _claim_profile("/api/predict/demand/batch", {row["Category"] for row in rows})
+        preds = await _predict_rows("demand", rows, DEMAND_FEATURES, profile)
+        for i, row, mode, pred in zip(positions, rows, modes, preds):
+            results[i] = {"index": i, **demand_response(pred, row, mode)}
+
+    return _timed_json("demand_batch", {"count": len(records), "errors": len(records) - len(rows), "results": results})
 
 
 @app.post("/api/predict/sales")
@@ -177,28 +941,461 @@ async def predict_sales(payload: dict):
     to keep the Sales UI simple and avoid confusion.
     """
     try:
-        latest_dt = df["Order Date"].dropna().max()
-        auto_year = int(latest_dt.year)
-        auto_month = int(latest_dt.month)
-        auto_quarter = int(((auto_month - 1) // 3) + 1)
-
-        X = pd.DataFrame([{
-            "Category": str(payload["category"]),
-            "Sub-Category": str(payload["sub_category"]),
-            "Region": str(payload["region"]),
-            "City": str(payload["city"]),
-            "Unit Price": float(payload["unit_price"]),
-            "Discount": float(payload["discount"]),
-            "Order_Year": auto_year,
-            "Order_Month": auto_month,
-            "Order_Quarter": auto_quarter,
-            "Quantity": float(payload["quantity"]),
-        }])
+        with STAGE_SECONDS.time("sales", "features"):
+            row = sales_features(payload, DATA)
     except Exception:
+        ERRORS_TOTAL.inc("sales", "invalid_payload")
         return JSONResponse({"error": "Invalid payload for sales prediction."}, status_code=400)
 
-    pred = float(sales_model.predict(X)[0])
-    return {"predicted_sales": round(pred, 2)}
+    profile = _claim_profile("/api/predict/sales", (row["Category"],))
+    pred = (await _predict_rows("sales", [row], SALES_FEATURES, profile))[0]
+    return _timed_json("sales", {"predicted_sales": round(pred, 2)})
+
+
+@app.post("/api/predict/sales/batch")
+async def predict_sales_batch(payload: dict):
+    """
+    Input: { "records": [ {category, sub_category, region, city, unit_price, discount, quantity}, ... ] }
+
+    Output:
+      results: one entry per record (same order), either { predicted_sales }
+               or { "error": ... } for a record that could not be parsed.
+    Cache misses among the valid records are scored with a single predict call.
+    """
+    records, error = _batch_records(payload)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    state = DATA
+    results = [None] * len(records)
+    rows, positions = [], []
+    with STAGE_SECONDS.time("sales_batch", "features"):
+        for i, record in enumerate(records):
+            try:
+                rows.append(sales_features(record, state))
+            except Exception:
+                results[i] = {"index": i, "error": "Invalid payload for sales prediction."}
+                continue
+            positions.append(i)
+    if len(rows) < len(records):
+        ERRORS_TOTAL.inc("sales_batch", "invalid_record", amount=len(records) - len(rows))
+
+    if rows:
+        profile = _claim_profile("/api/predict/sales/batch", {row["Category"] for row in rows})
+        preds = await _predict_rows("sales", rows, SALES_FEATURES, profile)
+        for i, pred in zip(positions, preds):
+            results[i] = {"index": i, "predicted_sales": round(pred, 2)}
+
+    return _timed_json("sales_batch", {"count": len(records), "errors": len(records) - len(rows), "results": results})
+
+
+# ✅ Sensitivity sweep: one base sales scenario x grids of price/discount/quantity,
+# scored with a single predict call
+SWEEP_AXES = ["unit_price", "discount", "quantity"]
+
+
+def _sweep_axis_size(name: str, spec) -> int:
+    # Checked before any axis is built, so an oversized request costs nothing
+    if spec is None:
+        return 1
+    if isinstance(spec, list):
+        size = len(spec)
+    elif isinstance(spec, dict):
+        size = int(spec["steps"])
+        if not 1 <= size <= MAX_SWEEP_POINTS:
+            raise ValueError(f"{name}: steps must be between 1 and {MAX_SWEEP_POINTS}")
+    else:
+        raise ValueError(f"{name}: give a list of values or {{min, max, steps}}")
+    if size == 0:
+        raise ValueError(f"{name}: no values")
+    return size
+
+
+def _sweep_axis(spec, base):
+    """
+    Values of one sweep axis: [base] when not swept, a list as given, or
+    {"min", "max", "steps"} -> steps evenly spaced values from min to max (inclusive).
+    """
+    if spec is None:
+        return [float(base)]
+    if isinstance(spec, list):
+        return [float(v) for v in spec]
+    low, high, steps = float(spec["min"]), float(spec["max"]), int(spec["steps"])
+    if steps == 1:
+        return [low]
+    return [round(low + (high - low) * i / (steps - 1), 6) for i in range(steps)]
+
+
+def _sweep_axes(payload: dict, state: ServingState):
+    """
+    Returns (axes {name: values}, base sales row). The grid size is checked against
+    MAX_SWEEP_POINTS first; the grid rows themselves are built by the scoring job
+    (features.sweep_rows). Raises ValueError on a malformed payload.
+    """
+    sweep = payload.get("sweep") or {}
+    if not isinstance(sweep, dict) or set(sweep) - set(SWEEP_AXES):
+        raise ValueError(f"sweep must map some of {SWEEP_AXES} to values")
+    points = 1
+    for name in SWEEP_AXES:
+        points *= _sweep_axis_size(name, sweep.get(name))
+    if points > MAX_SWEEP_POINTS:
+        raise ValueError(f"Sweep too large ({points} points, max {MAX_SWEEP_POINTS}).")
+
+    axes = {name: _sweep_axis(sweep.get(name), payload.get(name)) for name in SWEEP_AXES}
+    base = sales_features({**payload, **{name: values[0] for name, values in axes.items()}}, state)
+    return axes, base
+
+
+def _score_sweep(base: dict, axes: dict):
+    """
+    Builds the grid rows and scores them (thread-pool / profiler job).
+    """
+    return _score_rows("sales", sweep_rows(base, axes), SALES_FEATURES)
+
+
+async def _run_sweep(base: dict, axes: dict):
+    with STAGE_SECONDS.time("sales", "executor"):
+        if INFERENCE_POOL.mode == "process":
+            return await INFERENCE_POOL.run(
+                inference_pool.score_sweep, base, axes, SALES_FEATURES, _artifacts["fingerprints"]["sales"]
+            )
+        return await INFERENCE_POOL.run(_score_sweep, base, axes)
+
+
+@app.post("/api/predict/sales/sweep")
+async def predict_sales_sweep(payload: dict):
+    """
+    Input:
+      category, sub_category, region, city, unit_price, discount, quantity (base scenario)
+      sweep: { unit_price / discount / quantity: [values] or {min, max, steps} }
+      format: "points" (default) or "arrays"
+
+    Output:
+      axes (the values of each axis), shape, min / max (points),
+      points: [ {unit_price, discount, quantity, predicted_sales}, ... ]
+      or, with format "arrays", predicted_sales: flat list in the same order
+      (unit_price varies slowest, quantity fastest).
+    Every grid point is scored in one predict call (not cached).
+    """
+    fmt = payload.get("format", "points")
+    try:
+        if fmt not in ("points", "arrays"):
+            raise ValueError('format must be "points" or "arrays"')
+        with STAGE_SECONDS.time("sales_sweep", "features"):
+            axes, base = _sweep_axes(payload, DATA)
+    except ValueError as e:
+        ERRORS_TOTAL.inc("sales_sweep", "invalid_payload")
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception:
+        ERRORS_TOTAL.inc("sales_sweep", "invalid_payload")
+        return JSONResponse({"error": "Invalid payload for sales sweep."}, status_code=400)
+
+    _check_artifacts()
+    profile = _claim_profile("/api/predict/sales/sweep", (base["Category"],))
+    if profile is not None:
+        preds = await _run_profiled(profile, "sales", _score_sweep, base, axes)
+    else:
+        preds = await _run_sweep(base, axes)
+    preds = [round(pred, 2) for pred in preds]
+
+    n_discount, n_quantity = len(axes["discount"]), len(axes["quantity"])
+
+    def point(i):
+        return {
+            "unit_price": axes["unit_price"][i // (n_discount * n_quantity)],
+            "discount": axes["discount"][i // n_quantity % n_discount],
+            "quantity": axes["quantity"][i % n_quantity],
+            "predicted_sales": preds[i],
+        }
+
+    result = {
+        "axes": axes,
+        "shape": [len(axes[name]) for name in SWEEP_AXES],
+        "min": point(min(range(len(preds)), key=preds.__getitem__)),
+        "max": point(max(range(len(preds)), key=preds.__getitem__)),
+    }
+    if fmt == "arrays":
+        result["predicted_sales"] = preds
+    else:
+        result["points"] = [point(i) for i in range(len(preds))]
+    return _timed_json("sales_sweep", result)
+
+
+# ✅ Streaming predictions: NDJSON records in, NDJSON results out, STREAM_CHUNK_ROWS at a
+# time, so memory stays flat however many records are sent (offline: batch_score.py)
+class NDJSONStream(StreamingResponse):
+    """
+    StreamingResponse that does not listen for the client disconnect while streaming:
+    that listener reads the request messages, and the body iterator here is still
+    reading the request body while it sends results.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def _ndjson_lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        if b"\n" in chunk:
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _score_stream_chunk(kind: str, lines: list, start: int, state: ServingState) -> bytes:
+    """
+    Scores one chunk of NDJSON records (not cached: bulk jobs would only evict the
+    interactive entries). Returns the result lines, one per record in order.
+    """
+    results = [None] * len(lines)
+    rows, modes, positions = [], [], []
+    for i, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+            if kind == "demand":
+                row, mode = _demand_features(record, state)
+            else:
+                row, mode = sales_features(record, state), None
+        except Exception:
+            results[i] = {"index": start + i, "error": f"Invalid payload for {kind} prediction."}
+            continue
+        rows.append(row)
+        modes.append(mode)
+        positions.append(i)
+    if kind == "demand":
+        for mode, count in Counter(modes).items():
+            STATS_MODE_TOTAL.inc(mode, amount=count)
+    if len(rows) < len(lines):
+        ERRORS_TOTAL.inc(f"{kind}_stream", "invalid_record", amount=len(lines) - len(rows))
+
+    if rows:
+        _check_artifacts()
+        columns = DEMAND_FEATURES if kind == "demand" else SALES_FEATURES
+        while True:
+            try:
+                preds = await _run_scoring(kind, rows, columns)
+                break
+            except PoolSaturated:
+                # A long job waits for room rather than failing halfway through
+                await asyncio.sleep(RETRY_AFTER_SECONDS)
+        for i, row, mode, pred in zip(positions, rows, modes, preds):
+            if kind == "demand":
+                results[i] = {"index": start + i, **demand_response(pred, row, mode)}
+            else:
+                results[i] = {"index": start + i, "predicted_sales": round(pred, 2)}
+
+    with STAGE_SECONDS.time(f"{kind}_stream", "serialize"):
+        return "".join(json.dumps(result) + "\n" for result in results).encode()
+
+
+async def _stream_predictions(kind: str, request: Request):
+    state = DATA
+    lines, start = [], 0
+    async for line in _ndjson_lines(request):
+        if start + len(lines) >= MAX_STREAM_ROWS:
+            ERRORS_TOTAL.inc(f"{kind}_stream", "too_many_records")
+            if lines:
+                yield await _score_stream_chunk(kind, lines, start, state)
+            yield (json.dumps({"error": f"Stream too large (max {MAX_STREAM_ROWS} records); stopped here."}) + "\n").encode()
+            return
+        lines.append(line)
+        if len(lines) >= STREAM_CHUNK_ROWS:
+            yield await _score_stream_chunk(kind, lines, start, state)
+            start += len(lines)
+            lines = []
+    if lines:
+        yield await _score_stream_chunk(kind, lines, start, state)
+
+
+@app.post("/api/predict/demand/stream")
+async def predict_demand_stream(request: Request):
+    """
+    Input: NDJSON, one {category, sub_category, region, year, month} per line
+
+    Output: NDJSON, one line per record (same order): { index, single-prediction output }
+            or { index, error }. Results are sent while the records are still arriving.
+    """
+    return NDJSONStream(_stream_predictions("demand", request))
+
+
+@app.post("/api/predict/sales/stream")
+async def predict_sales_stream(request: Request):
+    """
+    Input: NDJSON, one {category, sub_category, region, city, unit_price, discount, quantity} per line
+
+    Output: NDJSON, one line per record (same order): { index, predicted_sales }
+            or { index, error }. Results are sent while the records are still arriving.
+    """
+    return NDJSONStream(_stream_predictions("sales", request))
+
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """
+    Hit/miss counters for the prediction cache (use these to size BA_PREDICTION_CACHE_SIZE)
+    and the forecast cache.
+    """
+    return {
+        **PREDICTION_CACHE.stats(),
+        "artifact_version": _artifact_version(),
+        "forecast": FORECAST_CACHE.stats(),
+    }
+
+
+@app.get("/api/executor/stats")
+def get_executor_stats():
+    """
+    Queue depth / saturation of the inference executor (503s start at saturation 1.0)
+    and micro-batching counters.
+    """
+    return {
+        **INFERENCE_POOL.stats(),
+        "batching": {kind: batcher.stats() for kind, batcher in BATCHERS.items()},
+    }
+
+
+def _cache_counters():
+    counters = {}
+    for name, cache in (("prediction", PREDICTION_CACHE), ("forecast", FORECAST_CACHE)):
+        stats = cache.stats()
+        counters[(name, "hit")] = stats["hits"]
+        counters[(name, "miss")] = stats["misses"]
+    return counters
+
+
+def _executor_gauges():
+    if INFERENCE_POOL is None:
+        return {}
+    stats = INFERENCE_POOL.stats()
+    return {("in_flight",): stats["in_flight"], ("queue_depth",): stats["queue_depth"]}
+
+
+METRICS.gauge("ba_cache_requests_total", "Prediction/forecast cache lookups by result.",
+              _cache_counters, ["cache", "result"], kind="counter")
+METRICS.gauge("ba_executor_jobs", "Inference executor jobs running or waiting.",
+              _executor_gauges, ["state"])
+METRICS.gauge("ba_data_version", "Serving data version (incremented by each ingest).",
+              lambda: {(): DATA.version} if DATA is not None else {})
+METRICS.gauge("ba_startup_phase_seconds", "Duration of each startup phase (and data loader step).",
+              lambda: {(phase,): seconds for phase, seconds in STARTUP_TIMINGS.items()}, ["phase"])
+METRICS.gauge("ba_ready", "1 once the startup phases are done (see /readyz).",
+              lambda: {(): int(STARTUP["ready"])})
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus text format: ba_request_duration_seconds{route,status},
+    ba_stage_duration_seconds{endpoint,stage}, ba_demand_stats_mode_total{mode},
+    ba_errors_total{endpoint,type}, cache/executor/data gauges.
+    """
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+# ✅ Forecast cache keyed by (category, horizon, category data version); concurrent
+# requests for the same key share one computation. Ingestion only bumps the versions
+# of the categories it touched (and "All"), so other cached forecasts stay valid.
+FORECAST_CACHE = PredictionCache(FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL)
+_forecasts_in_flight = {}
+
+
+def _forecast_key(state: ServingState, category, horizon: int):
+    return (str(category), horizon, state.forecast_versions.get(str(category), state.version))
+
+
+def _forecast_input(state: ServingState, category):
+    # Monthly series of "All" and of every category; None for anything else (no orders)
+    return state.forecast_frames.get(str(category))
+
+
+def _no_forecast_data(category):
+    return {"error": f"No sales data for category {category!r}."}
+
+
+def _parse_horizon(value) -> int:
+    """
+    Forecast horizon from a request: a whole number of months from 1 to
+    MAX_FORECAST_HORIZON. Raises ValueError otherwise.
+    """
+    try:
+        horizon = int(value)
+    except (TypeError, ValueError):
+        horizon = 0
+    if isinstance(value, bool) or not 1 <= horizon <= MAX_FORECAST_HORIZON:
+        raise ValueError(f"horizon must be an integer from 1 to {MAX_FORECAST_HORIZON}.")
+    return horizon
+
+
+def _timed_forecast(frame, horizon: int, category):
+    with STAGE_SECONDS.time("forecast", "fit"):
+        return forecast_sales(frame, horizon=horizon, category=category)
+
+
+async def _cached_forecast(category, horizon: int, profile=None):
+    state = DATA
+    frame = _forecast_input(state, category)
+    if frame is None:
+        return _no_forecast_data(category)
+    if profile is not None:
+        # Profiled: computed in this process, bypassing the cache and in-flight sharing
+        return await _run_profiled(profile, f"forecast-{category}", _timed_forecast, frame, horizon, category)
+
+    key = _forecast_key(state, category, horizon)
+    with STAGE_SECONDS.time("forecast", "cache_lookup"):
+        result = FORECAST_CACHE.get(key)
+    if result is not None:
+        return result
+
+    in_flight = _forecasts_in_flight.get(key)
+    if in_flight is not None:
+        return await asyncio.shield(in_flight)
+
+    future = asyncio.get_running_loop().create_future()
+    _forecasts_in_flight[key] = future
+    try:
+        # The job gets this state's series in both modes: pool processes have no copy of ingested orders
+        with STAGE_SECONDS.time("forecast", "executor"):
+            if INFERENCE_POOL.mode == "process":
+                result = await INFERENCE_POOL.run(inference_pool.run_forecast, frame, horizon, category)
+            else:
+                result = await INFERENCE_POOL.run(_timed_forecast, frame, horizon, category)
+        if "error" not in result:
+            FORECAST_CACHE.put(key, result)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _forecasts_in_flight.pop(key, None)
+
+
+def _warm_forecasts(categories=None):
+    state = DATA
+    for category in categories or ["All"] + state.categories:
+        key = _forecast_key(state, category, DEFAULT_FORECAST_HORIZON)
+        frame = _forecast_input(state, category)
+        if frame is None or FORECAST_CACHE.get(key) is not None:
+            continue
+        try:
+            result = forecast_sales(frame, horizon=DEFAULT_FORECAST_HORIZON, category=category)
+        except Exception as e:
+            print(f"[forecast] warm-up failed for {category!r}: {e}")
+            continue
+        if "error" not in result:
+            FORECAST_CACHE.put(key, result)
+
+
+def _start_forecast_warmup():
+    if FORECAST_WARM:
+        threading.Thread(target=_warm_forecasts, name="forecast-warmup", daemon=True).start()
 
 
 @app.post("/api/forecast/sales_series")
@@ -208,14 +1405,386 @@ async def get_sales_forecast(payload: dict):
     Output: JSON with history, forecast, and metrics.
     """
     try:
-        horizon = int(payload.get("horizon", 12))
-        category = payload.get("category", "All")
-        
-        result = forecast_sales(df, horizon=horizon, category=category)
-        
+        horizon = _parse_horizon(payload.get("horizon", DEFAULT_FORECAST_HORIZON))
+    except ValueError as e:
+        ERRORS_TOTAL.inc("forecast", "invalid_payload")
+        return JSONResponse({"error": str(e)}, status_code=400)
+    category = payload.get("category")
+    if category is None:
+        category = "All"
+
+    try:
+        profile = _claim_profile("/api/forecast/sales_series", (str(category),))
+        result = await _cached_forecast(category, horizon, profile)
+
         if "error" in result:
+            ERRORS_TOTAL.inc("forecast", "no_data")
             return JSONResponse(result, status_code=400)
-            
-        return result
+
+        return _timed_json("forecast", result)
+    except PoolSaturated:
+        raise
     except Exception as e:
+        ERRORS_TOTAL.inc("forecast", "exception")
         return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# ✅ Segment forecasts: computed by a background job (segment_forecasts.py), which only
+# recomputes segments whose series changed; reads come straight from the SQLite store
+# (SEGMENT_STORE / SEGMENT_JOB are created by the executor startup phase)
+_segment_job_lock = threading.Lock()
+
+
+def _run_segment_job(state: ServingState, horizon: int, force: bool):
+    try:
+        run_job(state.orders, SEGMENT_STORE, horizon, SEGMENT_FORECAST_WORKERS, SEGMENT_FORECAST_TIME_LIMIT,
+                force=force, start_method=INFERENCE_START_METHOD, progress=SEGMENT_JOB)
+    except Exception as e:
+        print(f"[segments] job failed: {e}")
+        SEGMENT_JOB.update(running=False, exception=str(e))
+    finally:
+        _segment_job_lock.release()
+
+
+@app.post("/api/forecast/segments/run")
+def start_segment_forecasts(request: Request, payload: dict = None):
+    """
+    Input: { "horizon": 12, "force": false } (X-Admin-Token header)
+    Starts the segment forecast job on the current data in the background -> 202,
+    or 409 while a job is running. Progress: GET /api/forecast/segments/run.
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    payload = payload or {}
+    try:
+        horizon = _parse_horizon(payload.get("horizon", DEFAULT_FORECAST_HORIZON))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not _segment_job_lock.acquire(blocking=False):
+        return JSONResponse({"error": "A segment forecast job is already running.", "job": SEGMENT_JOB.snapshot()},
+                            status_code=409)
+    SEGMENT_JOB.update(running=True, horizon=horizon, exception=None)
+    threading.Thread(target=_run_segment_job, args=(DATA, horizon, bool(payload.get("force", False))),
+                     name="segment-forecasts", daemon=True).start()
+    return JSONResponse({"started": True, "horizon": horizon, "data_version": DATA.version}, status_code=202)
+
+
+@app.get("/api/forecast/segments/run")
+def get_segment_forecast_job():
+    """
+    Progress of the running (or last) segment forecast job in this process, and the
+    last run recorded in the store (also runs started by the CLI).
+    """
+    return {"job": SEGMENT_JOB.snapshot(), "last_run": SEGMENT_STORE.last_run()}
+
+
+@app.get("/api/forecast/segments")
+def get_segment_forecasts(category: str = None, sub_category: str = None, region: str = None,
+                          horizon: int = DEFAULT_FORECAST_HORIZON):
+    """
+    Stored segment forecasts for horizon, optionally filtered by category / sub_category / region:
+    { horizon, count, segments: [ {category, sub_category, region, status, updated_at, result}, ... ] }
+    result is the forecast_sales output (or { error }). 404 for a single segment with no stored forecast.
+    """
+    with STAGE_SECONDS.time("segment_forecasts", "query"):
+        rows = SEGMENT_STORE.query(horizon, category, sub_category, region)
+    if not rows and None not in (category, sub_category, region):
+        return JSONResponse({"error": "No stored forecast for this segment; run the segment forecast job."},
+                            status_code=404)
+
+    # The stored results are already JSON: spliced in as they are, not parsed and re-encoded
+    with STAGE_SECONDS.time("segment_forecasts", "serialize"):
+        segments = ",".join(
+            json.dumps({"category": cat, "sub_category": sub, "region": reg, "status": status,
+                        "updated_at": updated_at})[:-1] + ', "result": ' + result + "}"
+            for cat, sub, reg, status, result, updated_at in rows
+        )
+        body = f'{{"horizon": {horizon}, "count": {len(rows)}, "segments": [{segments}]}}'
+    return Response(body, media_type="application/json")
+
+
+# ✅ Analytics: KPI rollups answered from the pre-aggregated sales cube (never scans the orders)
+@app.post("/api/analytics/rollup")
+def analytics_rollup(payload: dict):
+    """
+    Input: { "group_by": ["region", "year"], "filters": {"category": "Furniture", "year": [2024, 2025]},
+             "from": "2024-01", "to": "2024-12", "sort_by": "sales", "descending": true, "limit": 100 }
+    (all optional; dimensions: year, quarter, month, category, sub_category, region, city)
+    Output: rows (one per group: sales, quantity, profit, orders, avg_order_value, profit_margin)
+            and totals over everything that passed the filters.
+    """
+    state = DATA
+    try:
+        with STAGE_SECONDS.time("rollup", "query"):
+            result = rollup(
+                state.sales_cube,
+                group_by=payload.get("group_by") or [],
+                filters=payload.get("filters") or {},
+                period_from=payload.get("from"),
+                period_to=payload.get("to"),
+                sort_by=payload.get("sort_by"),
+                descending=bool(payload.get("descending", True)),
+                limit=payload.get("limit"),
+            )
+    except (TypeError, ValueError) as e:
+        ERRORS_TOTAL.inc("rollup", "invalid_payload")
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {**result, "data_version": state.version}
+
+
+# ✅ Live ingestion: new orders are folded into a new serving state (running sums for
+# the touched segment-months only) which replaces DATA in one assignment
+_ingest_lock = threading.Lock()
+INGEST_NUMERIC_COLS = ["Quantity", "Unit Price", "Discount", "Sales", "Profit"]
+INGEST_STATS = {"batches": 0, "received": 0, "accepted": 0, "rejected": 0, "files": 0, "failed_files": 0}
+
+
+def _prepare_orders(raw: pd.DataFrame, state: ServingState) -> pd.DataFrame:
+    """
+    Aligns raw order rows with the dataset columns and cleans them like the CSV:
+    rows with a missing/unparseable date, price, discount or segment are dropped.
+    All CSV columns are kept (for _append_to_csv); compact_orders trims them for serving.
+    """
+    if DATA_PATH.exists():
+        columns = list(pd.read_csv(DATA_PATH, nrows=0).columns)
+    else:
+        columns = [c for c in state.order_template.columns if c not in DATE_PART_COLS]
+    raw = raw.reindex(columns=columns)
+    for col in INGEST_NUMERIC_COLS:
+        if col in raw.columns:
+            raw[col] = pd.to_numeric(raw[col], errors="coerce")
+    orders = clean_orders(raw, {})
+
+    # Keep integer columns (e.g. Quantity) integer when the new values allow it
+    template = state.order_template
+    for col in columns:
+        if col not in template.columns:
+            continue
+        values = orders[col]
+        if (pd.api.types.is_integer_dtype(template[col].dtype) and pd.api.types.is_numeric_dtype(values)
+                and values.notna().all() and (values % 1 == 0).all()):
+            orders[col] = values.astype("int64")
+    return orders
+
+
+def _append_to_csv(orders: pd.DataFrame):
+    """
+    Appends accepted orders to the dataset CSV so they survive a restart, and records
+    the new file fingerprint so this write does not look like an external data change.
+    """
+    header = pd.read_csv(DATA_PATH, nrows=0).columns
+    orders.reindex(columns=header).to_csv(DATA_PATH, mode="a", header=False, index=False)
+    with _artifacts_lock:
+        _artifacts["fingerprints"] = {**_artifacts["fingerprints"], "data": _file_fingerprint(DATA_PATH)}
+
+
+def ingest_orders(raw: pd.DataFrame):
+    """
+    Adds raw order rows (dataset CSV columns) to the serving data and invalidates only
+    what they touched: demand predictions of the touched segments, forecasts of the
+    touched categories + "All", sales predictions if the latest order month moved,
+    and the options ETag if new dropdown values appeared. Returns a summary dict.
+    """
+    global DATA
+
+    with _ingest_lock:
+        state = DATA
+        orders = _prepare_orders(raw, state)
+        summary = {
+            "received": int(len(raw)),
+            "accepted": int(len(orders)),
+            "rejected": int(len(raw) - len(orders)),
+            "data_version": state.version,
+        }
+        INGEST_STATS["batches"] += 1
+        INGEST_STATS["received"] += summary["received"]
+        INGEST_STATS["rejected"] += summary["rejected"]
+        if orders.empty:
+            return summary
+
+        if INGEST_PERSIST and DATA_PATH.exists():
+            _append_to_csv(orders)
+
+        new_state, touched = state.apply_orders(compact_orders(orders))
+        DATA = new_state
+        INGEST_STATS["accepted"] += summary["accepted"]
+
+    segments = touched["segments"]
+    forecasts = touched["categories"] | {"All"}
+    PREDICTION_CACHE.discard(lambda key: key[0] == "demand" and key[1:4] in segments)
+    if new_state.sales_time_defaults != state.sales_time_defaults:
+        PREDICTION_CACHE.discard(lambda key: key[0] == "sales")
+    FORECAST_CACHE.discard(lambda key: key[0] in forecasts)
+    if FORECAST_WARM:
+        threading.Thread(target=_warm_forecasts, args=(sorted(forecasts),),
+                         name="forecast-warmup", daemon=True).start()
+
+    summary.update({
+        "data_version": new_state.version,
+        "segments_touched": len(segments),
+        "categories_touched": sorted(touched["categories"]),
+        "options_changed": touched["options_changed"],
+    })
+    return summary
+
+
+@app.post("/api/ingest/orders")
+def ingest_orders_endpoint(request: Request, payload: dict):
+    """
+    Input: { "orders": [ {"Order Date": ..., "Category": ..., "Sub-Category": ..., "Region": ...,
+                          "City": ..., "Unit Price": ..., "Discount": ..., "Quantity": ..., ...}, ... ] }
+    (same column names as the dataset CSV; requires X-Ingest-Token = BA_INGEST_TOKEN)
+
+    Output: received / accepted / rejected counts, new data_version and what was touched.
+    """
+    if not INGEST_ENABLED:
+        return JSONResponse({"error": "Order ingestion is disabled with several serve.py workers."},
+                            status_code=403)
+    if not INGEST_TOKEN:
+        return JSONResponse({"error": "Order ingestion over the API is disabled (set BA_INGEST_TOKEN)."},
+                            status_code=403)
+    if request.headers.get("x-ingest-token") != INGEST_TOKEN:
+        return JSONResponse({"error": "Invalid or missing ingest token."}, status_code=403)
+
+    records = payload.get("orders")
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return JSONResponse({"error": "Ingest payload must contain an 'orders' list of objects."}, status_code=400)
+    if len(records) > MAX_INGEST_ROWS:
+        return JSONResponse({"error": f"Too many orders ({len(records)}, max {MAX_INGEST_ROWS})."}, status_code=400)
+
+    try:
+        return ingest_orders(pd.DataFrame.from_records(records))
+    except Exception as e:
+        return JSONResponse({"error": f"Ingestion failed: {e}"}, status_code=500)
+
+
+@app.get("/api/ingest/stats")
+def get_ingest_stats():
+    state = DATA
+    return {**INGEST_STATS, "data_version": state.version, "orders": state.order_count}
+
+
+def _watch_ingest_dir(folder: Path):
+    """
+    Polls folder for *.csv files, ingests each one and moves it to processed/ (or
+    failed/). Write files elsewhere and move them in, so a half-written file is never read.
+    """
+    for sub in ("processed", "failed"):
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+
+    while True:
+        for path in sorted(folder.glob("*.csv")):
+            # Moved out of the watched folder first, so a file is never ingested twice
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{path.name}"
+            try:
+                os.replace(path, folder / "processed" / name)
+            except OSError as e:
+                print(f"[ingest] could not move {path.name}: {e}")
+                continue
+            try:
+                summary = ingest_orders(pd.read_csv(folder / "processed" / name))
+                print(f"[ingest] {path.name}: {summary['accepted']} accepted, {summary['rejected']} rejected")
+                INGEST_STATS["files"] += 1
+            except Exception as e:
+                print(f"[ingest] {path.name} failed: {e}")
+                INGEST_STATS["failed_files"] += 1
+                os.replace(folder / "processed" / name, folder / "failed" / name)
+        time.sleep(INGEST_POLL_SECONDS)
+
+
+def _start_ingest_watcher():
+    if INGEST_DIR and INGEST_ENABLED:
+        threading.Thread(target=_watch_ingest_dir, args=(Path(INGEST_DIR),),
+                         name="ingest-watcher", daemon=True).start()
+
+
+# ✅ Admin: on-demand profiling + slow-request log (X-Admin-Token must equal BA_ADMIN_TOKEN)
+def _admin_denied(request: Request):
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "Admin endpoints are disabled (set BA_ADMIN_TOKEN)."}, status_code=403)
+    if request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        return JSONResponse({"error": "Invalid admin token."}, status_code=403)
+    return None
+
+
+@app.post("/api/admin/profile")
+def start_profiling(request: Request, payload: dict):
+    """
+    Input: { "mode": "cprofile" | "sampling", "count": 10,
+             "route": "/api/forecast/sales_series" (optional), "category": "Furniture" (optional),
+             "interval_ms": 5 (sampling only), "ttl_seconds": 600 }
+    Profiles the next count matching requests (predict endpoints, forecast) and
+    replaces any session already armed.
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    try:
+        session = PROFILER.arm(
+            str(payload.get("mode", "cprofile")),
+            int(payload.get("count", 1)),
+            route=payload.get("route"),
+            category=payload.get("category"),
+            interval_ms=float(payload.get("interval_ms", 5.0)),
+            ttl_seconds=float(payload.get("ttl_seconds", 600.0)),
+        )
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return session.to_dict()
+
+
+@app.get("/api/admin/profile")
+def get_profiling(request: Request):
+    """
+    Armed session (if any), the last session and the profile files available for download.
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    session, last = PROFILER.session, PROFILER.last_session
+    return {
+        "armed": session.to_dict() if session is not None else None,
+        "last_session": last.to_dict() if last is not None else None,
+        "files": PROFILER.list_files(),
+    }
+
+
+@app.delete("/api/admin/profile")
+def stop_profiling(request: Request):
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    PROFILER.disarm()
+    return {"armed": None}
+
+
+@app.get("/api/admin/profiles/{name}")
+def download_profile(request: Request, name: str):
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    path = PROFILER.file_path(name)
+    if path is None:
+        return JSONResponse({"error": "Profile not found."}, status_code=404)
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+@app.get("/api/admin/slow_requests")
+def get_slow_requests(request: Request):
+    """
+    Most recent slow requests (payload + stage timings); BA_SLOW_REQUEST_MS must be set.
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    if SLOW_REQUESTS is None:
+        return {"enabled": False, "threshold_ms": 0, "logged": 0, "requests": []}
+    return {
+        "enabled": True,
+        "threshold_ms": SLOW_REQUEST_MS,
+        "logged": SLOW_REQUESTS.logged,
+        "log_file": str(SLOW_REQUESTS.path) if SLOW_REQUESTS.path else None,
+        "requests": SLOW_REQUESTS.entries(),
+    }
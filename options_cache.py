@@ -0,0 +1,62 @@
+"""
+The dropdown options catalog, saved as JSON next to the dataset snapshot.
+
+main.py writes it after a full startup. A process started with BA_STARTUP=lazy
+reads it back to serve the page and /api/options without importing pandas or
+loading the models. It is only used while the dataset file still has the size
+and mtime it was built from.
+
+Stdlib only: importing this module must stay cheap.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+OPTIONS_CACHE_FILE = "options.json"
+
+
+def json_etag(content) -> str:
+    body = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _source_stat(source_path: Path):
+    try:
+        st = Path(source_path).stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def read_options_cache(directory: Path, source_path: Path):
+    """
+    (options, etag) from the cache in directory, or None when it is missing,
+    unreadable or was built from another version of source_path.
+    """
+    try:
+        with open(Path(directory) / OPTIONS_CACHE_FILE, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    source = _source_stat(source_path)
+    if source is None or cached.get("source") != source:
+        return None
+    return cached["options"], cached["etag"]
+
+
+def write_options_cache(directory: Path, options: dict, etag: str, source_path: Path) -> bool:
+    """
+    Saves options (atomically) unless the cache already holds them for this
+    version of source_path. Returns True when the file was written.
+    """
+    if read_options_cache(directory, source_path) == (options, etag):
+        return False
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f"{OPTIONS_CACHE_FILE}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": _source_stat(source_path), "etag": etag, "options": options}, f)
+    os.replace(tmp, directory / OPTIONS_CACHE_FILE)
+    return True
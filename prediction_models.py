@@ -1,7 +1,16 @@
+import os
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import joblib
+from joblib import Parallel, delayed
 
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder
@@ -27,29 +36,82 @@ from sklearn.svm import SVR
 from sklearn.neighbors import KNeighborsRegressor
 
 
-# =============================
-# 1) Load data
-# =============================
 DATA_PATH = Path("Ecommerce_Sales_Data_2024_2025.csv")
-df = pd.read_csv(DATA_PATH)
+
+# Candidates are fitted in parallel worker processes (override with --workers)
+TRAIN_WORKERS = int(os.environ.get("BA_TRAIN_WORKERS", str(os.cpu_count() or 1)))
+
+# Expected slowest first, so the long fits start right away and the quick ones fill the gaps
+FIT_ORDER = ["SVR_RBF", "KNN", "RandomForest", "ExtraTrees", "GradientBoosting", "AdaBoost",
+             "ElasticNet", "Lasso", "Ridge", "LinearRegression"]
+
+# Tuning mode (--tune): successive halving keeps the best 1/TUNE_ETA configurations of
+# each model per rung and gives them TUNE_ETA times more training rows (and trees)
+TUNE_ETA = 3
+MIN_TUNE_ROWS = 100
+
+# Per-model search space; the configured value of each parameter is always tried as well
+PARAM_GRIDS = {
+    "Ridge": {"alpha": [0.1, 1.0, 10.0, 100.0]},
+    "Lasso": {"alpha": [0.001, 0.01, 0.1, 1.0, 10.0]},
+    "ElasticNet": {"alpha": [0.01, 0.1, 1.0], "l1_ratio": [0.2, 0.5, 0.8]},
+    "RandomForest": {"max_features": [1.0, 0.5, "sqrt"], "min_samples_leaf": [1, 2, 5]},
+    "ExtraTrees": {"max_features": [1.0, 0.5, "sqrt"], "min_samples_leaf": [1, 2, 5]},
+    "GradientBoosting": {"learning_rate": [0.05, 0.1, 0.2], "max_depth": [2, 3, 5]},
+    "AdaBoost": {"learning_rate": [0.1, 0.5, 1.0], "loss": ["linear", "square"]},
+    "KNN": {"n_neighbors": [3, 5, 7, 11, 15], "weights": ["uniform", "distance"]},
+    "SVR_RBF": {"C": [1, 10, 100], "gamma": ["scale", 0.1, 0.01]},
+}
+
+# Iteration budget that grows with the rung, like the number of training rows
+ITERATION_PARAMS = {
+    "RandomForest": "n_estimators",
+    "ExtraTrees": "n_estimators",
+    "GradientBoosting": "n_estimators",
+    "AdaBoost": "n_estimators",
+}
+
+# How a fit's cost grows with the training rows (cost ~ rows ** exponent, times the
+# iterations for ITERATION_PARAMS models); used to keep --time-budget / --cpu-budget.
+# A model whose measured growth between rungs is steeper uses the measured exponent.
+ROW_COST_EXPONENTS = {
+    "SVR_RBF": 2.0,
+    "KNN": 1.5,
+    "RandomForest": 1.2,
+    "ExtraTrees": 1.2,
+    "GradientBoosting": 1.2,
+    "AdaBoost": 1.2,
+}
+MAX_ROW_COST_EXPONENT = 3.0
+
+# Streaming mode (--stream): source read STREAM_CHUNK_ROWS at a time; the per-order
+# sales model trains on a sample of SALES_SAMPLE_ROWS orders
+STREAM_CHUNK_ROWS = 200_000
+SALES_SAMPLE_ROWS = 200_000
+MIN_ROWS_PER_STRATUM = 50
+
+REQUIRED_COLS = ["Order Date", "Sales", "Quantity", "Unit Price", "Discount",
+                 "Category", "Sub-Category", "Region", "City"]
 
 
 # =============================
-# 2) Cleaning + base feature engineering
+# 1) Load data + 2) Cleaning + base feature engineering
 # =============================
-df["Order Date"] = pd.to_datetime(df["Order Date"], errors="coerce")
+def load_training_data(path: Path = DATA_PATH) -> pd.DataFrame:
+    return clean_training_rows(pd.read_csv(path))
+
 
-df = df.dropna(subset=[
-    "Order Date", "Sales", "Quantity", "Unit Price", "Discount",
-    "Category", "Sub-Category", "Region", "City"
-]).copy()
+def clean_training_rows(df: pd.DataFrame) -> pd.DataFrame:
+    df["Order Date"] = pd.to_datetime(df["Order Date"], errors="coerce")
 
-df["Order_Month"] = df["Order Date"].dt.month.astype(int)
-df["Order_Quarter"] = df["Order Date"].dt.quarter.astype(int)
-df["Order_Year"] = df["Order Date"].dt.year.astype(int)
+    df = df.dropna(subset=REQUIRED_COLS).copy()
 
-drop_cols = ["Order ID", "Customer Name", "Product Name", "Payment Mode", "Profit", "Order Date"]
-df = df.drop(columns=[c for c in drop_cols if c in df.columns])
+    df["Order_Month"] = df["Order Date"].dt.month.astype(int)
+    df["Order_Quarter"] = df["Order Date"].dt.quarter.astype(int)
+    df["Order_Year"] = df["Order Date"].dt.year.astype(int)
+
+    drop_cols = ["Order ID", "Customer Name", "Product Name", "Payment Mode", "Profit", "Order Date"]
+    return df.drop(columns=[c for c in drop_cols if c in df.columns])
 
 
 # =============================
@@ -71,20 +133,49 @@ def manual_metrics(y_true, preds):
     r2 = r2_score(y_true, preds)
     return mae, rmse, r2
 
-def evaluate_models(X, y, preprocessor, models_dict, task_name):
+def _single_threaded(model):
+    # The worker pool already uses every core; a nested n_jobs=-1 would oversubscribe it
+    model = clone(model)
+    if "n_jobs" in model.get_params():
+        model.set_params(n_jobs=1)
+    return model
+
+def _fit_and_score(name, model, X_train, y_train, X_test, y_test):
+    """
+    Worker job: fits one candidate on the already-encoded training matrix.
+    Returns (metrics row, wall seconds, CPU seconds).
+    """
+    start, cpu_start = time.perf_counter(), time.process_time()
+    model.fit(X_train, y_train)
+    preds = model.predict(X_test)
+
+    mae, rmse, r2 = manual_metrics(y_test, preds)
+    return ({"Model": name, "MAE": mae, "RMSE": rmse, "R2": r2},
+            time.perf_counter() - start, time.process_time() - cpu_start)
+
+def evaluate_models(X, y, preprocessor, models_dict, task_name, n_workers=TRAIN_WORKERS):
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
 
-    rows = []
-    for name, model in models_dict.items():
-        print(f"Training {task_name} with {name}...")
-        pipe = Pipeline([("prep", preprocessor), ("model", model)])
-        pipe.fit(X_train, y_train)
-        preds = pipe.predict(X_test)
+    # Encode once: the fitted preprocessor is the same for every candidate, so each
+    # one gets exactly the matrix its own Pipeline would have built
+    prep = clone(preprocessor).fit(X_train)
+    Xt_train = prep.transform(X_train)
+    Xt_test = prep.transform(X_test)
+
+    names = sorted(models_dict, key=lambda n: FIT_ORDER.index(n) if n in FIT_ORDER else -1)
+    print(f"Training {task_name}: {len(names)} models on {n_workers} worker(s)...")
+    outputs = Parallel(n_jobs=n_workers)(
+        delayed(_fit_and_score)(name, _single_threaded(models_dict[name]), Xt_train, y_train, Xt_test, y_test)
+        for name in names
+    )
 
-        mae, rmse, r2 = manual_metrics(y_test, preds)
-        rows.append({"Model": name, "MAE": mae, "RMSE": rmse, "R2": r2})
+    by_name = {}
+    for row, seconds, _ in outputs:
+        by_name[row["Model"]] = row
+        print(f"  {row['Model']}: {seconds:.2f}s")
+    rows = [by_name[name] for name in models_dict]
 
     results = pd.DataFrame(rows).sort_values(["MAE", "RMSE"], ascending=True).reset_index(drop=True)
     best_name = results.loc[0, "Model"]
@@ -98,51 +189,198 @@ def evaluate_models(X, y, preprocessor, models_dict, task_name):
     return results, best_name
 
 
+def _param_configs(model, grid: dict):
+    configs = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    configured = {key: model.get_params()[key] for key in grid}
+    if configured not in configs:
+        configs.insert(0, configured)
+    return configs
+
+
+class FitCosts:
+    """
+    Wall/CPU seconds of the tuning fits so far, per model and rung, to predict what
+    a fit of the same model on more rows (and iterations) will cost.
+    """
+
+    def __init__(self):
+        self.fits = {}   # name -> {rung: (rows, iterations, [wall], [cpu])}
+
+    def add(self, name, rung, n_rows, iterations, wall, cpu):
+        fit = self.fits.setdefault(name, {}).setdefault(rung, (n_rows, iterations, [], []))
+        fit[2].append(wall)
+        fit[3].append(cpu)
+
+    def _exponent(self, name, measured):
+        exponent = ROW_COST_EXPONENTS.get(name, 1.0)
+        if len(measured) < 2:
+            return exponent
+        (rows0, iters0, _, cpus0), (rows1, iters1, _, cpus1) = (measured[r] for r in sorted(measured)[-2:])
+        if rows1 <= rows0:
+            return exponent
+        growth = np.mean(cpus1) / max(np.mean(cpus0), 1e-6) / (iters1 / iters0 if iters0 else 1.0)
+        measured_exponent = np.log(max(growth, 1e-6)) / np.log(rows1 / rows0)
+        return min(MAX_ROW_COST_EXPONENT, max(exponent, measured_exponent))
+
+    def predict(self, name, n_rows, iterations):
+        """
+        (wall, cpu) seconds of one fit, from the model's slowest fit in its latest
+        rung scaled by the row (and iteration) growth; None before its first fit.
+        """
+        measured = self.fits.get(name)
+        if not measured:
+            return None
+        rows, iters, walls, cpus = measured[max(measured)]
+        scale = (n_rows / rows) ** self._exponent(name, measured) * (iterations / iters if iters else 1.0)
+        return max(walls) * scale, max(cpus) * scale
+
+    def estimate(self, batch, rung, n_rows):
+        """
+        (wall, cpu) seconds of a batch of (name, params, model, iterations) jobs run in
+        parallel. A model not fitted yet counts as the mean fit of this rung so far.
+        """
+        this_rung = [(w, c) for fits in self.fits.values() if rung in fits
+                     for w, c in zip(fits[rung][2], fits[rung][3])]
+        fallback = tuple(np.mean(this_rung, axis=0)) if this_rung else (0.0, 0.0)
+        costs = [self.predict(name, n_rows, iterations) or fallback for name, _, _, iterations in batch]
+        return max(w for w, _ in costs), sum(c for _, c in costs)
+
+
+def tune_models(X, y, preprocessor, models_dict, task_name, n_workers=TRAIN_WORKERS,
+                time_budget=None, cpu_budget=None, eta=TUNE_ETA):
+    """
+    Successive-halving search over PARAM_GRIDS, scored on a validation split carved
+    out of the training rows (the test rows stay untouched for evaluate_models).
+    Every configuration starts on a small sample with few trees; after each rung only
+    the best 1/eta of each model's configurations move on to eta times more rows.
+    Fits run in batches of n_workers; no batch is started (from the second one of rung 0
+    on) when FitCosts predicts it would exceed time_budget (wall seconds) or cpu_budget
+    (CPU seconds summed over the workers). The search then ends with the fits so far.
+
+    Returns (models with their best parameters, per-rung results DataFrame).
+    """
+    X_train, _, y_train, _ = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.2, random_state=42)
+
+    prep = clone(preprocessor).fit(X_fit)
+    Xt_fit, Xt_val = prep.transform(X_fit), prep.transform(X_val)
+    y_fit, y_val = np.asarray(y_fit), np.asarray(y_val)
+    order = np.random.RandomState(42).permutation(len(y_fit))
+
+    survivors = {name: _param_configs(model, PARAM_GRIDS.get(name, {})) for name, model in models_dict.items()}
+    n_rungs = 1
+    while eta ** (n_rungs - 1) < max(len(configs) for configs in survivors.values()):
+        n_rungs += 1
+    n_configs = sum(len(configs) for configs in survivors.values())
+    print(f"Tuning {task_name}: {n_configs} configurations, {n_rungs} rungs, {n_workers} worker(s)...")
+
+    rows, best, costs = [], {}, FitCosts()
+    start, cpu_used, stopped = time.perf_counter(), 0.0, False
+    with Parallel(n_jobs=n_workers) as parallel:
+        for rung in range(n_rungs):
+            fraction = float(eta) ** -(n_rungs - 1 - rung)
+            n_rows = min(len(order), max(MIN_TUNE_ROWS, int(round(len(order) * fraction))))
+            X_rung, y_rung = Xt_fit[order[:n_rows]], y_fit[order[:n_rows]]
+
+            jobs = []
+            for name, configs in survivors.items():
+                iter_param = ITERATION_PARAMS.get(name)
+                for params in configs:
+                    model = _single_threaded(models_dict[name]).set_params(**params)
+                    iterations = None
+                    if iter_param:
+                        full = models_dict[name].get_params()[iter_param]
+                        iterations = max(10, int(full * fraction))
+                        model.set_params(**{iter_param: iterations})
+                    jobs.append((name, params, model, iterations))
+            jobs.sort(key=lambda job: FIT_ORDER.index(job[0]) if job[0] in FIT_ORDER else -1)
+
+            rung_start, outputs = time.perf_counter(), []
+            for i in range(0, len(jobs), n_workers):
+                batch = jobs[i:i + n_workers]
+                est_wall, est_cpu = costs.estimate(batch, rung, n_rows)
+                elapsed = time.perf_counter() - start
+                if (time_budget and elapsed + est_wall > time_budget) or (cpu_budget and cpu_used + est_cpu > cpu_budget):
+                    print(f"  budget reached after {elapsed:.1f}s / {cpu_used:.1f} CPU-s; "
+                          f"stopping in rung {rung} after {len(outputs)} of {len(jobs)} fits")
+                    stopped = True
+                    break
+                batch_outputs = parallel(
+                    delayed(_fit_and_score)(name, model, X_rung, y_rung, Xt_val, y_val) for name, _, model, _ in batch
+                )
+                for (name, _, _, iterations), (_, wall, cpu) in zip(batch, batch_outputs):
+                    costs.add(name, rung, n_rows, iterations, wall, cpu)
+                    cpu_used += cpu
+                outputs.extend(batch_outputs)
+            if outputs:
+                print(f"  rung {rung}: {len(outputs)} fits on {n_rows} rows in {time.perf_counter() - rung_start:.1f}s")
+
+            ranked = {}
+            for (name, params, _, iterations), (metrics, wall, cpu) in zip(jobs, outputs):
+                rows.append({
+                    "Model": name, "Rung": rung, "Rows": n_rows, "Iterations": iterations,
+                    "Params": json.dumps(params), "Val_MAE": metrics["MAE"], "Val_RMSE": metrics["RMSE"],
+                    "Val_R2": metrics["R2"], "Fit_Seconds": wall, "CPU_Seconds": cpu,
+                })
+                ranked.setdefault(name, []).append((metrics["MAE"], metrics["RMSE"], len(ranked.get(name, [])), params))
+            for name, scores in ranked.items():
+                scores.sort(key=lambda s: s[:3])
+                best[name] = scores[0][3]
+                survivors[name] = [s[3] for s in scores[:max(1, len(scores) // eta)]]
+            if stopped:
+                break
+
+    results = pd.DataFrame(rows)
+    results["Selected"] = [
+        row["Params"] == json.dumps(best[row["Model"]]) and row["Rung"] == results.loc[results["Model"] == row["Model"], "Rung"].max()
+        for _, row in results.iterrows()
+    ]
+    for name, params in best.items():
+        print(f"  {name}: {params}")
+
+    tuned = {name: clone(model).set_params(**best.get(name, {})) for name, model in models_dict.items()}
+    return tuned, results
+
+
 # ==========================================================
 # 4) Quantity Model (Demand) - AGGREGATED
 # ==========================================================
 group_cols = ["Order_Year", "Order_Month", "Category", "Sub-Category", "Region"]
 
-qty_agg = df.groupby(group_cols, as_index=False).agg(
-    Total_Quantity=("Quantity", "sum"),
-    Avg_UnitPrice=("Unit Price", "mean"),
-    Avg_Discount=("Discount", "mean"),
-    Orders_Count=("Quantity", "count")
-)
-
 qty_cat_cols = ["Category", "Sub-Category", "Region"]
 qty_num_cols = ["Order_Year", "Order_Month", "Avg_UnitPrice", "Avg_Discount", "Orders_Count"]
 
-X_qty = qty_agg[qty_cat_cols + qty_num_cols]
-y_qty = qty_agg["Total_Quantity"]
 
-prep_qty = build_preprocessor(qty_cat_cols, qty_num_cols)
+def build_qty_training_set(df: pd.DataFrame):
+    qty_agg = df.groupby(group_cols, as_index=False).agg(
+        Total_Quantity=("Quantity", "sum"),
+        Avg_UnitPrice=("Unit Price", "mean"),
+        Avg_Discount=("Discount", "mean"),
+        Orders_Count=("Quantity", "count")
+    )
+    return split_qty_training_set(qty_agg)
 
-# 🔥 MANY ALGORITHMS FOR DEMAND
-qty_models = {
-    "LinearRegression": LinearRegression(),
-    "Ridge": Ridge(random_state=42),
-    "Lasso": Lasso(random_state=42, max_iter=20000),
-    "ElasticNet": ElasticNet(random_state=42, max_iter=20000),
-
-    "RandomForest": RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=-1),
-    "ExtraTrees": ExtraTreesRegressor(n_estimators=400, random_state=42, n_jobs=-1),
-    "GradientBoosting": GradientBoostingRegressor(random_state=42),
-    "AdaBoost": AdaBoostRegressor(random_state=42),
-
-    "KNN": KNeighborsRegressor(n_neighbors=7),
-    "SVR_RBF": SVR(kernel="rbf", C=10, gamma="scale"),
-}
 
-qty_results, best_qty = evaluate_models(
-    X_qty, y_qty, prep_qty, qty_models, "Quantity (Aggregated Demand)"
-)
+def split_qty_training_set(qty_agg: pd.DataFrame):
+    return qty_agg[qty_cat_cols + qty_num_cols], qty_agg["Total_Quantity"]
 
-best_qty_pipe = Pipeline([("prep", prep_qty), ("model", qty_models[best_qty])])
-best_qty_pipe.fit(X_qty, y_qty)
 
-joblib.dump(best_qty_pipe, "best_quantity_model.pkl")
-qty_results.to_csv("quantity_model_comparison.csv", index=False)
+# 🔥 MANY ALGORITHMS FOR DEMAND
+def qty_candidates():
+    return {
+        "LinearRegression": LinearRegression(),
+        "Ridge": Ridge(random_state=42),
+        "Lasso": Lasso(random_state=42, max_iter=20000),
+        "ElasticNet": ElasticNet(random_state=42, max_iter=20000),
+
+        "RandomForest": RandomForestRegressor(n_estimators=400, random_state=42, n_jobs=-1),
+        "ExtraTrees": ExtraTreesRegressor(n_estimators=400, random_state=42, n_jobs=-1),
+        "GradientBoosting": GradientBoostingRegressor(random_state=42),
+        "AdaBoost": AdaBoostRegressor(random_state=42),
+
+        "KNN": KNeighborsRegressor(n_neighbors=7),
+        "SVR_RBF": SVR(kernel="rbf", C=10, gamma="scale"),
+    }
 
 
 # ===========================================
@@ -151,44 +389,280 @@ qty_results.to_csv("quantity_model_comparison.csv", index=False)
 sales_cat_cols = ["Category", "Sub-Category", "Region", "City"]
 sales_num_cols = ["Unit Price", "Discount", "Order_Month", "Order_Quarter", "Order_Year", "Quantity"]
 
-X_sales = df[sales_cat_cols + sales_num_cols]
-y_sales = df["Sales"]
 
-prep_sales = build_preprocessor(sales_cat_cols, sales_num_cols)
+def build_sales_training_set(df: pd.DataFrame):
+    return df[sales_cat_cols + sales_num_cols], df["Sales"]
 
-# 🔥 MANY ALGORITHMS FOR SALES
-sales_models = {
-    "LinearRegression": LinearRegression(),
-    "Ridge": Ridge(random_state=42),
-    "Lasso": Lasso(random_state=42, max_iter=20000),
-    "ElasticNet": ElasticNet(random_state=42, max_iter=20000),
-
-    "RandomForest": RandomForestRegressor(n_estimators=300, random_state=42, n_jobs=-1),
-    "ExtraTrees": ExtraTreesRegressor(n_estimators=300, random_state=42, n_jobs=-1),
-    "GradientBoosting": GradientBoostingRegressor(random_state=42),
-    "AdaBoost": AdaBoostRegressor(random_state=42),
-
-    "KNN": KNeighborsRegressor(n_neighbors=7),
-    "SVR_RBF": SVR(kernel="rbf", C=10, gamma="scale"),
-}
 
-sales_results, best_sales = evaluate_models(
-    X_sales, y_sales, prep_sales, sales_models, "Sales (Revenue)"
-)
+# 🔥 MANY ALGORITHMS FOR SALES
+def sales_candidates():
+    return {
+        "LinearRegression": LinearRegression(),
+        "Ridge": Ridge(random_state=42),
+        "Lasso": Lasso(random_state=42, max_iter=20000),
+        "ElasticNet": ElasticNet(random_state=42, max_iter=20000),
 
-best_sales_pipe = Pipeline([("prep", prep_sales), ("model", sales_models[best_sales])])
-best_sales_pipe.fit(X_sales, y_sales)
+        "RandomForest": RandomForestRegressor(n_estimators=300, random_state=42, n_jobs=-1),
+        "ExtraTrees": ExtraTreesRegressor(n_estimators=300, random_state=42, n_jobs=-1),
+        "GradientBoosting": GradientBoostingRegressor(random_state=42),
+        "AdaBoost": AdaBoostRegressor(random_state=42),
 
-joblib.dump(best_sales_pipe, "best_sales_model.pkl")
-sales_results.to_csv("sales_model_comparison.csv", index=False)
+        "KNN": KNeighborsRegressor(n_neighbors=7),
+        "SVR_RBF": SVR(kernel="rbf", C=10, gamma="scale"),
+    }
 
 
-# =============================
-# 6) Final message
-# =============================
-print("Training complete!")
-print("Saved files:")
-print(" - best_quantity_model.pkl")
-print(" - best_sales_model.pkl")
-print(" - quantity_model_comparison.csv")
-print(" - sales_model_comparison.csv")
+# ===========================================
+# 5b) Streaming mode: chunked source, incremental aggregates, sampled orders
+# ===========================================
+def iter_source_chunks(path: Path, chunk_rows: int = STREAM_CHUNK_ROWS):
+    """
+    Yields raw order chunks of at most chunk_rows rows from a CSV file, or from every
+    .csv / .parquet file under a directory (e.g. the year=/month= partitions written
+    by generate_synthetic_data.py).
+    """
+    path = Path(path)
+    files = [path] if path.is_file() else sorted(
+        f for f in path.rglob("*") if f.suffix in (".csv", ".parquet") and f.is_file()
+    )
+    if not files:
+        raise FileNotFoundError(f"No .csv or .parquet files in {path}")
+
+    for f in files:
+        if f.suffix == ".parquet":
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise SystemExit("Reading .parquet partitions needs pyarrow (pip install pyarrow)")
+            parquet = pq.ParquetFile(f)
+            columns = [c for c in parquet.schema_arrow.names if c in REQUIRED_COLS]
+            for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(f, usecols=lambda c: c in REQUIRED_COLS, chunksize=chunk_rows)
+
+
+class QtyAggregator:
+    """
+    Running sums and counts per segment-month; result() is the same table as the
+    in-memory groupby in build_qty_training_set.
+    """
+
+    def __init__(self):
+        self.sums = None
+
+    def add(self, chunk: pd.DataFrame):
+        part = chunk.groupby(group_cols).agg(
+            Total_Quantity=("Quantity", "sum"),
+            Sum_UnitPrice=("Unit Price", "sum"),
+            Sum_Discount=("Discount", "sum"),
+            Orders_Count=("Quantity", "count"),
+        )
+        self.sums = part if self.sums is None else self.sums.add(part, fill_value=0)
+
+    def result(self) -> pd.DataFrame:
+        if self.sums is None:
+            # Nothing streamed: no segment-months
+            return pd.DataFrame(columns=group_cols + ["Total_Quantity", "Avg_UnitPrice", "Avg_Discount",
+                                                      "Orders_Count"])
+        s = self.sums
+        return pd.DataFrame({
+            "Total_Quantity": s["Total_Quantity"],
+            "Avg_UnitPrice": s["Sum_UnitPrice"] / s["Orders_Count"],
+            "Avg_Discount": s["Sum_Discount"] / s["Orders_Count"],
+            "Orders_Count": s["Orders_Count"].astype(int),
+        }).reset_index()
+
+
+class ReservoirSample:
+    """
+    Uniform sample of at most size rows from a stream (reservoir sampling, one chunk
+    at a time). Rows are only moved with pd.concat / iloc, and result() has the dtypes
+    of all chunks concatenated (what a single read_csv infers), not those of the first.
+    """
+
+    def __init__(self, size: int, seed: int = 42):
+        self.size = size
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+        self.rows = None
+        self.schema = None      # no rows, dtypes of every chunk so far combined
+
+    def add(self, chunk: pd.DataFrame):
+        chunk = chunk.reset_index(drop=True)
+        empty = chunk.iloc[:0]
+        self.schema = empty if self.schema is None else pd.concat([self.schema, empty], ignore_index=True)
+        fill = 0
+        if self.rows is None or len(self.rows) < self.size:
+            fill = min(self.size - (0 if self.rows is None else len(self.rows)), len(chunk))
+            head = chunk.iloc[:fill]
+            self.rows = head if self.rows is None else pd.concat([self.rows, head], ignore_index=True)
+
+        rest = chunk.iloc[fill:]
+        if len(rest):
+            # Row number i (0-based, whole stream) replaces a random slot with probability size / (i + 1)
+            positions = self.seen + fill + np.arange(len(rest))
+            slots = self.rng.integers(0, positions + 1)
+            keep = np.flatnonzero(slots < self.size)
+            # When two rows land on the same slot the later one wins
+            _, last = np.unique(slots[keep][::-1], return_index=True)
+            keep = keep[len(keep) - 1 - last]
+            take = np.arange(len(self.rows))
+            take[slots[keep]] = len(self.rows) + np.arange(len(keep))
+            self.rows = pd.concat([self.rows, rest.iloc[keep]], ignore_index=True).iloc[take].reset_index(drop=True)
+        self.seen += len(chunk)
+
+    def result(self) -> pd.DataFrame:
+        if self.rows is None:
+            return self.schema
+        return self.rows.astype(self.schema.dtypes.to_dict())
+
+
+class StratifiedSample:
+    """
+    About size rows, allocated to the strata in proportion to their row counts, with
+    at least min_per_stratum rows each, so rare segments stay represented.
+    Every row gets a random key and each stratum keeps its smallest keys (a uniform
+    sample of that stratum). While streaming, each stratum keeps up to 2x its current
+    share, so memory stays around 2 * size rows.
+    """
+
+    def __init__(self, size: int, strata_cols, min_per_stratum: int = MIN_ROWS_PER_STRATUM, seed: int = 42):
+        self.size = size
+        self.strata_cols = list(strata_cols)
+        self.min_per_stratum = min_per_stratum
+        self.rng = np.random.default_rng(seed)
+        self.counts = None
+        self.rows = None
+
+    def add(self, chunk: pd.DataFrame):
+        chunk = chunk.assign(_key=self.rng.random(len(chunk)))
+        counts = chunk.groupby(self.strata_cols).size()
+        self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+        self.rows = chunk if self.rows is None else pd.concat([self.rows, chunk], ignore_index=True)
+        self._truncate(slack=2.0)
+
+    def _truncate(self, slack: float):
+        caps = np.maximum(self.min_per_stratum, np.ceil(self.size * slack * self.counts / self.counts.sum()))
+        rows = self.rows.sort_values("_key", kind="stable")
+        rank = rows.groupby(self.strata_cols).cumcount().to_numpy()
+        cap = caps.reindex(pd.MultiIndex.from_frame(rows[self.strata_cols])).to_numpy()
+        self.rows = rows[rank < cap].reset_index(drop=True)
+
+    def result(self) -> pd.DataFrame:
+        self._truncate(slack=1.0)
+        return self.rows.drop(columns="_key")
+
+
+def load_training_stream(path: Path, chunk_rows: int = STREAM_CHUNK_ROWS, sample_rows: int = SALES_SAMPLE_ROWS,
+                         sampling: str = "reservoir"):
+    """
+    One pass over the source, chunk by chunk. Returns (qty_agg, sampled orders for the
+    sales model, number of clean rows). Peak memory depends on chunk_rows and
+    sample_rows, not on the size of the dataset.
+    """
+    aggregator = QtyAggregator()
+    if sampling == "stratified":
+        sample = StratifiedSample(sample_rows, ["Category", "Sub-Category", "Region"])
+    else:
+        sample = ReservoirSample(sample_rows)
+
+    n_rows = 0
+    for i, raw in enumerate(iter_source_chunks(path, chunk_rows)):
+        chunk = clean_training_rows(raw)
+        aggregator.add(chunk)
+        sample.add(chunk[sales_cat_cols + sales_num_cols + ["Sales"]])
+        n_rows += len(chunk)
+        print(f"  chunk {i}: {n_rows} rows so far")
+
+    if n_rows == 0:
+        raise ValueError(f"No training rows in {path}: it is empty or every row lacks one of {REQUIRED_COLS}")
+    return aggregator.result(), sample.result(), n_rows
+
+
+def train_best_model(X, y, cat_cols, num_cols, models, task_name, n_workers=TRAIN_WORKERS):
+    """
+    Compares the candidates, then refits the winner on all rows as a full Pipeline
+    (preprocessor + model), which is what main.py loads.
+    """
+    prep = build_preprocessor(cat_cols, num_cols)
+    results, best_name = evaluate_models(X, y, prep, models, task_name, n_workers)
+
+    best_pipe = Pipeline([("prep", prep), ("model", models[best_name])])
+    best_pipe.fit(X, y)
+    return best_pipe, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and compare the demand and sales models.")
+    parser.add_argument("--data", default=str(DATA_PATH))
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS,
+                        help="parallel worker processes for the candidate models")
+    parser.add_argument("--tune", action="store_true",
+                        help="search PARAM_GRIDS with successive halving before comparing the models")
+    parser.add_argument("--time-budget", type=float, default=None,
+                        help="wall-clock seconds per tuning run (quantity, sales)")
+    parser.add_argument("--cpu-budget", type=float, default=None,
+                        help="CPU seconds (all workers) per tuning run")
+    parser.add_argument("--stream", action="store_true",
+                        help="read --data (CSV file or directory of partitions) in chunks")
+    parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS)
+    parser.add_argument("--sample-rows", type=int, default=SALES_SAMPLE_ROWS,
+                        help="orders sampled for the sales model in --stream mode")
+    parser.add_argument("--sampling", choices=["reservoir", "stratified"], default="reservoir")
+    args = parser.parse_args()
+
+    if args.stream:
+        print(f"Streaming {args.data} ({args.sampling} sample of {args.sample_rows} orders)...")
+        qty_agg, sales_df, n_rows = load_training_stream(
+            Path(args.data), args.chunk_rows, args.sample_rows, args.sampling
+        )
+        print(f"Read {n_rows} orders: {len(qty_agg)} segment-months, {len(sales_df)} sampled orders")
+        X_qty, y_qty = split_qty_training_set(qty_agg)
+    else:
+        sales_df = load_training_data(Path(args.data))
+        X_qty, y_qty = build_qty_training_set(sales_df)
+
+    def candidates(X, y, cat_cols, num_cols, models, task_name, tuning_csv):
+        if not args.tune:
+            return models
+        tuned, tuning = tune_models(X, y, build_preprocessor(cat_cols, num_cols), models, task_name,
+                                    args.workers, args.time_budget, args.cpu_budget)
+        tuning.to_csv(tuning_csv, index=False)
+        return tuned
+
+    qty_models = candidates(X_qty, y_qty, qty_cat_cols, qty_num_cols, qty_candidates(),
+                            "Quantity (Aggregated Demand)", "quantity_model_tuning.csv")
+    best_qty_pipe, qty_results = train_best_model(
+        X_qty, y_qty, qty_cat_cols, qty_num_cols, qty_models,
+        "Quantity (Aggregated Demand)", args.workers
+    )
+    joblib.dump(best_qty_pipe, "best_quantity_model.pkl")
+    qty_results.to_csv("quantity_model_comparison.csv", index=False)
+
+    X_sales, y_sales = build_sales_training_set(sales_df)
+    sales_models = candidates(X_sales, y_sales, sales_cat_cols, sales_num_cols, sales_candidates(),
+                              "Sales (Revenue)", "sales_model_tuning.csv")
+    best_sales_pipe, sales_results = train_best_model(
+        X_sales, y_sales, sales_cat_cols, sales_num_cols, sales_models,
+        "Sales (Revenue)", args.workers
+    )
+    joblib.dump(best_sales_pipe, "best_sales_model.pkl")
+    sales_results.to_csv("sales_model_comparison.csv", index=False)
+
+    # =============================
+    # 6) Final message
+    # =============================
+    print("Training complete!")
+    print("Saved files:")
+    print(" - best_quantity_model.pkl")
+    print(" - best_sales_model.pkl")
+    print(" - quantity_model_comparison.csv")
+    print(" - sales_model_comparison.csv")
+    if args.tune:
+        print(" - quantity_model_tuning.csv")
+        print(" - sales_model_tuning.csv")
+
+
+if __name__ == "__main__":
+    main()
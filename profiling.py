@@ -0,0 +1,320 @@
+"""
+Opt-in profiling for production debugging (admin endpoints in main.py).
+
+Profiler: armed with a session ("the next N requests [on route R] [for category C]"),
+it runs the CPU-bound part of each matching request (model predict, forecast_sales)
+under one of two profilers:
+  - "cprofile": deterministic, writes a .pstats file (python -m pstats, snakeviz)
+  - "sampling": samples the stack every interval_ms, writes .folded stacks
+    (flamegraph.pl, speedscope, inferno)
+Matching requests skip the prediction/forecast cache so the work is really done.
+
+SlowRequestLog + SlowRequestMiddleware: requests slower than a threshold are written
+as JSON lines with their payload and the stage timings recorded during the request.
+
+Both cost nothing when off: an unarmed profiler is one attribute check per request,
+and the middleware is only installed when a threshold is configured.
+"""
+import contextvars
+import cProfile
+import json
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+
+PROFILE_MODES = ("cprofile", "sampling")
+PROFILE_SUFFIXES = {"cprofile": ".pstats", "sampling": ".folded"}
+MAX_PROFILE_COUNT = 1000
+
+# Stage timings of the request being handled (a list), set by SlowRequestMiddleware
+_request_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+# =============================
+# On-demand profiler
+# =============================
+class ProfileSession:
+    def __init__(self, mode: str, count: int, route=None, category=None,
+                 interval_ms: float = 5.0, ttl_seconds: float = 600.0):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        self.mode = mode
+        self.count = count
+        self.route = route
+        self.category = category
+        self.interval = interval_ms / 1000.0
+        self.expires_at = time.monotonic() + ttl_seconds
+        self.claimed = 0
+        self.files = []
+
+    def matches(self, route: str, categories) -> bool:
+        if self.route is not None and self.route != route:
+            return False
+        return self.category is None or self.category in categories
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "count": self.count,
+            "claimed": self.claimed,
+            "route": self.route,
+            "category": self.category,
+            "interval_ms": self.interval * 1000.0,
+            "expires_in_seconds": max(0.0, round(self.expires_at - time.monotonic(), 1)),
+            "files": list(self.files),
+        }
+
+
+class Profiler:
+    """
+    At most one armed session. claim() hands out the next profiling slot to a
+    matching request; run() executes the work under the session's profiler.
+    """
+
+    def __init__(self, out_dir: Path):
+        self.out_dir = Path(out_dir)
+        self.session = None
+        self.last_session = None
+        self._lock = threading.Lock()
+
+    def arm(self, mode: str, count: int, route=None, category=None,
+            interval_ms: float = 5.0, ttl_seconds: float = 600.0) -> ProfileSession:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {list(PROFILE_MODES)}")
+        if not 1 <= count <= MAX_PROFILE_COUNT:
+            raise ValueError(f"count must be between 1 and {MAX_PROFILE_COUNT}")
+        if interval_ms <= 0 or ttl_seconds <= 0:
+            raise ValueError("interval_ms and ttl_seconds must be positive")
+        session = ProfileSession(mode, count, route, category, interval_ms, ttl_seconds)
+        with self._lock:
+            self.session = self.last_session = session
+        return session
+
+    def disarm(self):
+        with self._lock:
+            self.session = None
+
+    def claim(self, route: str, categories=()):
+        """
+        Returns (session, sequence number) if this request should be profiled, else None.
+        """
+        with self._lock:
+            session = self.session
+            if session is None:
+                return None
+            if time.monotonic() > session.expires_at:
+                self.session = None
+                return None
+            if not session.matches(route, categories):
+                return None
+            session.claimed += 1
+            if session.claimed >= session.count:
+                self.session = None
+            return session, session.claimed
+
+    def run(self, session: ProfileSession, seq: int, label: str, fn, *args):
+        """
+        fn(*args) under the session's profiler (in the calling thread); the profile
+        is written to out_dir before the result is returned.
+        """
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label)[:60]
+        path = self.out_dir / f"{session.id}-{seq:03d}-{safe_label}{PROFILE_SUFFIXES[session.mode]}"
+        start = time.perf_counter()
+        if session.mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(fn, *args)
+            finally:
+                profile.dump_stats(str(path))
+                self._record(session, path, start)
+        stacks = Counter()
+        try:
+            return _sampled(fn, args, session.interval, stacks)
+        finally:
+            path.write_text("".join(f"{stack} {n}\n" for stack, n in stacks.most_common()))
+            self._record(session, path, start, samples=sum(stacks.values()))
+
+    def _record(self, session: ProfileSession, path: Path, start: float, samples=None):
+        entry = {"file": path.name, "seconds": round(time.perf_counter() - start, 4)}
+        if samples is not None:
+            entry["samples"] = samples
+        with self._lock:
+            session.files.append(entry)
+        print(f"[profile] wrote {path.name} ({entry['seconds']}s)")
+
+    def list_files(self):
+        if not self.out_dir.is_dir():
+            return []
+        files = [p for p in self.out_dir.iterdir() if p.suffix in PROFILE_SUFFIXES.values() and p.is_file()]
+        files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        return [{"name": p.name, "bytes": p.stat().st_size} for p in files]
+
+    def file_path(self, name: str):
+        """
+        Path of a profile file in out_dir, or None (no path components allowed).
+        """
+        if Path(name).name != name or Path(name).suffix not in PROFILE_SUFFIXES.values():
+            return None
+        path = self.out_dir / name
+        return path if path.is_file() else None
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _sampled(fn, args, interval: float, stacks: Counter):
+    """
+    Runs fn(*args) while a helper thread samples this thread's stack every interval
+    seconds into stacks (folded format: root;...;leaf -> count).
+    """
+    target = threading.get_ident()
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            frame = sys._current_frames().get(target)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                stacks[";".join(reversed(names))] += 1
+
+    sampler = threading.Thread(target=sample, name="profile-sampler", daemon=True)
+    sampler.start()
+    try:
+        return fn(*args)
+    finally:
+        done.set()
+        sampler.join()
+
+
+# =============================
+# Slow-request log
+# =============================
+def record_stage(labels, seconds: float):
+    """
+    Histogram listener: adds a stage timing to the current request's trace, if any.
+    """
+    trace = _request_trace.get()
+    if trace is not None:
+        trace.append({"stage": "/".join(labels), "ms": round(seconds * 1000.0, 3)})
+
+
+def start_trace() -> list:
+    """
+    Starts an empty stage trace in the current context (work shared by several
+    requests, e.g. a micro-batch task) and returns it.
+    """
+    trace = []
+    _request_trace.set(trace)
+    return trace
+
+
+def add_to_trace(entries):
+    """
+    Adds stage timings recorded in another context (see start_trace) to the current
+    request's trace, if any.
+    """
+    trace = _request_trace.get()
+    if trace is not None:
+        trace.extend(entries)
+
+
+class SlowRequestLog:
+    def __init__(self, threshold_ms: float, path=None, keep: int = 100, max_body: int = 65536):
+        self.threshold = threshold_ms / 1000.0
+        self.path = Path(path) if path else None
+        self.max_body = max_body
+        self.recent = deque(maxlen=keep)
+        self.logged = 0
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            self.recent.append(entry)
+            self.logged += 1
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        print(f"[slow] {entry['method']} {entry['path']} {entry['duration_ms']:.1f} ms (status {entry['status']})")
+
+    def entries(self):
+        with self._lock:
+            return list(self.recent)
+
+
+def _payload(body: bytes, truncated: bool):
+    text = body.decode("utf-8", errors="replace")
+    if truncated:
+        return text + "...(truncated)"
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return text
+
+
+class SlowRequestMiddleware:
+    """
+    ASGI middleware for paths under prefixes: keeps the request body and the stage
+    timings, and hands requests slower than the log's threshold to log.add().
+    """
+
+    def __init__(self, app, log: SlowRequestLog, prefixes=("/",)):
+        self.app = app
+        self.log = log
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        truncated = False
+        status = 500
+
+        async def receive_wrapper():
+            nonlocal truncated
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                room = self.log.max_body - len(body)
+                body.extend(chunk[:max(0, room)])
+                truncated = truncated or len(chunk) > room
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        trace = []
+        token = _request_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            _request_trace.reset(token)
+            if duration >= self.log.threshold:
+                self.log.add({
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status,
+                    "duration_ms": round(duration * 1000.0, 3),
+                    "payload": _payload(bytes(body), truncated),
+                    "stages": trace,
+                })
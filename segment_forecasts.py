@@ -0,0 +1,334 @@
+"""
+Sales forecasts for every Category x Sub-Category x Region series, computed by a
+background job and kept in a SQLite file for fast reads.
+
+    python segment_forecasts.py --workers 4 --horizon 12 --time-limit 60
+
+The job takes every segment with orders (the segments of qty_agg), builds each
+one's monthly series (same layout as the per-category forecast frames) and runs
+forecast_sales on them in a process pool. Each task gets a time limit (SIGALRM in
+the pool process; no limit where setitimer is missing). Results are written as they arrive, so a job that is
+stopped halfway keeps what it finished.
+
+Each result is stored with a fingerprint of its input series, horizon and the
+forecasting code. A later run skips a segment whose fingerprint has not changed
+and whose stored result is final ("ok", or "error" from forecast_sales itself).
+Only new or changed segments are recomputed, plus those that failed or timed out.
+main.py starts the same job via POST /api/forecast/segments/run and serves the
+stored results on GET /api/forecast/segments.
+"""
+import argparse
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+import forecasting
+from forecasting import forecast_sales
+from data_loader import load_serving_data, format_timings
+
+
+APP_DIR = Path(__file__).parent
+DEFAULT_DB_PATH = Path(os.environ.get("BA_SEGMENT_FORECAST_DB", str(APP_DIR / "segment_forecasts.sqlite")))
+SEGMENT_COLS = ["Category", "Sub-Category", "Region"]
+MEASURES = ["Sales", "Quantity", "Profit"]
+# Statuses that are not recomputed while the fingerprint holds
+FINAL_STATUSES = ("ok", "error")
+
+
+def _forecaster_version() -> str:
+    try:
+        return hashlib.sha1(inspect.getsource(forecasting).encode()).hexdigest()[:12]
+    except (OSError, TypeError):
+        return "unknown"
+
+
+# Part of every fingerprint: editing the forecasting code invalidates all stored results
+FORECASTER_VERSION = _forecaster_version()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segment_forecasts (
+    category     TEXT NOT NULL,
+    sub_category TEXT NOT NULL,
+    region       TEXT NOT NULL,
+    horizon      INTEGER NOT NULL,
+    fingerprint  TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    result       TEXT NOT NULL,
+    seconds      REAL NOT NULL,
+    updated_at   TEXT NOT NULL,
+    PRIMARY KEY (category, sub_category, region, horizon)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    horizon     INTEGER NOT NULL,
+    started_at  TEXT NOT NULL,
+    finished_at TEXT,
+    summary     TEXT
+);
+"""
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+# =============================
+# Store
+# =============================
+class SegmentForecastStore:
+    """
+    SQLite file with one row per (segment, horizon): status, fingerprint and the
+    forecast_sales result as compact JSON text. Opens a connection per call, so
+    it can be used from any thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def fingerprints(self, horizon: int) -> dict:
+        """
+        (category, sub_category, region) -> (fingerprint, status) stored for horizon.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT category, sub_category, region, fingerprint, status FROM segment_forecasts WHERE horizon = ?",
+                (horizon,),
+            ).fetchall()
+        return {(cat, sub, reg): (fp, status) for cat, sub, reg, fp, status in rows}
+
+    def put_many(self, horizon: int, entries):
+        """
+        entries: [(segment, fingerprint, status, result JSON text, seconds), ...]
+        """
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO segment_forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*segment, horizon, fp, status, result, seconds, _now())
+                 for segment, fp, status, result, seconds in entries],
+            )
+
+    def query(self, horizon: int, category=None, sub_category=None, region=None):
+        """
+        Stored rows for horizon (optionally filtered), ordered by segment:
+        (category, sub_category, region, status, result JSON text, updated_at).
+        """
+        sql = "SELECT category, sub_category, region, status, result, updated_at FROM segment_forecasts WHERE horizon = ?"
+        args = [horizon]
+        for col, value in (("category", category), ("sub_category", sub_category), ("region", region)):
+            if value is not None:
+                sql += f" AND {col} = ?"
+                args.append(str(value))
+        with self._connect() as conn:
+            return conn.execute(sql + " ORDER BY category, sub_category, region", args).fetchall()
+
+    def start_run(self, horizon: int) -> int:
+        with self._connect() as conn:
+            return conn.execute("INSERT INTO runs (horizon, started_at) VALUES (?, ?)", (horizon, _now())).lastrowid
+
+    def finish_run(self, run_id: int, summary: dict):
+        with self._connect() as conn:
+            conn.execute("UPDATE runs SET finished_at = ?, summary = ? WHERE id = ?",
+                         (_now(), json.dumps(summary), run_id))
+
+    def last_run(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, horizon, started_at, finished_at, summary FROM runs ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        run_id, horizon, started_at, finished_at, summary = row
+        return {"id": run_id, "horizon": horizon, "started_at": started_at, "finished_at": finished_at,
+                "summary": json.loads(summary) if summary else None}
+
+
+# =============================
+# Segment series
+# =============================
+def build_segment_frames(orders: pd.DataFrame) -> dict:
+    """
+    (category, sub_category, region) -> monthly series in the layout of the
+    per-category forecast frames (Category, Order Date, measures), one row per month.
+    """
+    measures = [c for c in MEASURES if c in orders.columns]
+    month = orders["Order Date"].dt.to_period("M").dt.to_timestamp().rename("Order Date")
+    monthly = orders.groupby([*(orders[c] for c in SEGMENT_COLS), month], observed=True, sort=True)[measures].sum()
+    monthly = monthly.reset_index()
+    for col in SEGMENT_COLS:
+        monthly[col] = monthly[col].astype(str)
+
+    frames = {}
+    for key, series in monthly.groupby(SEGMENT_COLS, sort=True):
+        frames[tuple(key)] = series[["Category", "Order Date", *measures]].reset_index(drop=True)
+    return frames
+
+
+def segment_fingerprint(frame: pd.DataFrame, horizon: int) -> str:
+    digest = hashlib.sha1(f"{FORECASTER_VERSION}|{horizon}|".encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:20]
+
+
+# =============================
+# Pool task
+# =============================
+class ForecastTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise ForecastTimeout()
+
+
+def _jsonable(value):
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+def forecast_segment(category: str, frame: pd.DataFrame, horizon: int, time_limit: float):
+    """
+    forecast_sales for one segment series, stopped after time_limit seconds (0 = no limit).
+    Returns (status, result JSON text, seconds); status is "ok", "error" (forecast_sales
+    returned an error), "timeout" or "failed" (raised).
+    """
+    start = time.perf_counter()
+    use_alarm = time_limit > 0 and hasattr(signal, "setitimer")
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        result = forecast_sales(frame, horizon=horizon, category=category)
+        status = "error" if "error" in result else "ok"
+    except ForecastTimeout:
+        result, status = {"error": f"Timed out after {time_limit:g}s"}, "timeout"
+    except Exception as e:
+        result, status = {"error": str(e)}, "failed"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    text = json.dumps(result, separators=(",", ":"), default=_jsonable)
+    return status, text, round(time.perf_counter() - start, 4)
+
+
+# =============================
+# Job
+# =============================
+class JobProgress:
+    """
+    Counters of the running (or last) job, safe to read from other threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = {"running": False}
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields)
+
+    def bump(self, field: str):
+        with self._lock:
+            self.state[field] = self.state.get(field, 0) + 1
+            self.state["done"] = self.state.get("done", 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.state)
+
+
+def run_job(orders: pd.DataFrame, store: SegmentForecastStore, horizon: int = 12, workers: int = 1,
+            time_limit: float = 60.0, force: bool = False, start_method: str = "spawn",
+            progress: JobProgress = None, log=print):
+    """
+    Forecasts every segment of orders whose stored result is missing, stale or not
+    final, in a pool of workers processes. Returns the run summary.
+    """
+    progress = progress or JobProgress()
+    start = time.perf_counter()
+    frames = build_segment_frames(orders)
+    stored = {} if force else store.fingerprints(horizon)
+
+    todo, skipped = [], 0
+    for segment, frame in frames.items():
+        fp = segment_fingerprint(frame, horizon)
+        previous = stored.get(segment)
+        if previous is not None and previous[0] == fp and previous[1] in FINAL_STATUSES:
+            skipped += 1
+        else:
+            todo.append((segment, frame, fp))
+
+    run_id = store.start_run(horizon)
+    progress.update(running=True, run_id=run_id, horizon=horizon, segments=len(frames), skipped=skipped,
+                    to_compute=len(todo), done=0, ok=0, error=0, timeout=0, failed=0)
+    log(f"[segments] run {run_id}: {len(frames)} segments, {len(todo)} to forecast, {skipped} unchanged")
+
+    counts = {"ok": 0, "error": 0, "timeout": 0, "failed": 0}
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo))),
+                                 mp_context=multiprocessing.get_context(start_method)) as pool:
+            futures = {
+                pool.submit(forecast_segment, segment[0], frame, horizon, time_limit): (segment, fp)
+                for segment, frame, fp in todo
+            }
+            batch = []
+            for future in as_completed(futures):
+                segment, fp = futures[future]
+                try:
+                    status, result, seconds = future.result()
+                except Exception as e:
+                    # The pool process died (e.g. killed): record it, retry next run
+                    status, result, seconds = "failed", json.dumps({"error": repr(e)}), 0.0
+                counts[status] += 1
+                progress.bump(status)
+                batch.append((segment, fp, status, result, seconds))
+                if len(batch) >= 50:
+                    store.put_many(horizon, batch)
+                    batch = []
+            store.put_many(horizon, batch)
+
+    summary = {"run_id": run_id, "horizon": horizon, "segments": len(frames), "skipped": skipped,
+               **counts, "seconds": round(time.perf_counter() - start, 2)}
+    store.finish_run(run_id, summary)
+    progress.update(running=False, finished=summary)
+    log(f"[segments] run {run_id} done: " + ", ".join(f"{k}={v}" for k, v in summary.items() if k != "run_id"))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast every Category x Sub-Category x Region series into a SQLite store.")
+    parser.add_argument("--horizon", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--time-limit", type=float, default=60.0, help="seconds per segment (0 = no limit)")
+    parser.add_argument("--force", action="store_true", help="recompute every segment")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH)
+    parser.add_argument("--data", type=Path, default=Path(os.environ.get("BA_DATA_PATH", str(APP_DIR / "Ecommerce_Sales_Data_Expanded.csv"))))
+    parser.add_argument("--snapshot-dir", type=Path, default=Path(os.environ.get("BA_SNAPSHOT_DIR", str(APP_DIR / "data_snapshot"))))
+    parser.add_argument("--no-snapshot", action="store_true", help="always parse the dataset CSV")
+    args = parser.parse_args()
+
+    timings = {}
+    orders, _ = load_serving_data(args.data, None if args.no_snapshot else args.snapshot_dir, timings)
+    print(f"[segments] {len(orders)} orders loaded: {format_timings(timings)}")
+    run_job(orders, SegmentForecastStore(args.db), args.horizon, args.workers, args.time_limit, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Multi-worker server that loads the dataset and the models once.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+`uvicorn main:app --workers N` starts N interpreters that each joblib.load both
+models and load the dataset. Here the parent runs main's startup phases once (models,
+serving state, compiled fast paths, warm-up) and then forks the workers, which
+inherit all of it:
+  - the model arrays are shared copy-on-write pages. sklearn copies tree nodes
+    into its own buffers on unpickling, so joblib mmap_mode cannot share them.
+  - the dataset columns are memory-mapped from the snapshot (BA_SNAPSHOT_MMAP=1),
+    so they sit in the page cache once for all workers.
+Workers listen on the socket the parent bound. A worker that dies is forked again
+from the parent, which takes milliseconds instead of a full startup. With
+BA_STARTUP=lazy the parent only reads the options cache and each worker loads
+the rest on its first request that needs it.
+
+Needs os.fork (Linux/macOS). Reloaded models and caches are per worker, as with
+`uvicorn --workers`. Live ingestion (API and BA_INGEST_DIR) is turned off with
+more than one worker: each worker would only see the orders it ingested itself.
+"""
+import argparse
+import gc
+import os
+import signal
+import sys
+import time
+import traceback
+
+import uvicorn
+
+
+# A worker that exits sooner than this after its fork is not restarted (crash loop)
+MIN_WORKER_UPTIME = 5.0
+
+
+def _run_worker(config: uvicorn.Config, sock):
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def _fork_worker(config: uvicorn.Config, sock) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 1
+        try:
+            _run_worker(config, sock)
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host: str, port: int, workers: int, log_level: str):
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py needs os.fork; use `uvicorn main:app` on this platform.")
+
+    os.environ.setdefault("BA_SNAPSHOT_MMAP", "1")
+    import main
+    if workers > 1:
+        main.INGEST_ENABLED = False
+        if main.INGEST_DIR:
+            print(f"[serve] BA_INGEST_DIR is not watched with {workers} workers (run 1 worker to ingest)")
+    main.startup()   # loads models + dataset once, in the parent
+
+    config = uvicorn.Config(main.app, host=host, port=port, log_level=log_level)
+    sock = config.bind_socket()
+
+    # Objects created so far are never collected: keeps the GC from writing to
+    # (and so un-sharing) every page that holds them in the workers
+    gc.collect()
+    gc.freeze()
+
+    started = {}
+    for _ in range(workers):
+        started[_fork_worker(config, sock)] = time.monotonic()
+    print(f"[serve] {workers} workers on http://{host}:{port} (parent pid {os.getpid()})")
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in started:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    while started:
+        pid, status = os.wait()
+        uptime = time.monotonic() - started.pop(pid, time.monotonic())
+        if stopping:
+            continue
+        if uptime < MIN_WORKER_UPTIME:
+            print(f"[serve] worker {pid} exited after {uptime:.1f}s (status {status}); shutting down")
+            _stop(signal.SIGTERM, None)
+            continue
+        new_pid = _fork_worker(config, sock)
+        started[new_pid] = time.monotonic()
+        print(f"[serve] worker {pid} exited (status {status}); started {new_pid}")
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve main:app with workers forked from one preloaded process.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("BA_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, max(1, args.workers), args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Everything main.py derives from the orders dataset: the demand segment-stats
+index, dropdown options, sales time defaults, the monthly forecast series and the
+sales cube for analytics rollups.
+
+A ServingState is never modified after it is built. Live ingestion
+(apply_orders) returns a new state that shares the untouched parts and updates
+the touched segments incrementally from running sums; main.py then swaps a single
+reference, so a request that picked up a state sees all of an update or none of it.
+
+Cost of an ingest: the batch itself, plus the touched segments' months and touched
+categories' forecast series. The lookup dicts are copy-on-write overlays (a ChainMap
+of the touched keys on top of the parent's dicts) flattened every MAX_OVERLAY_DEPTH
+ingests, which costs one pass over the cells. New orders are kept as separate chunks
+and their cube cells in a delta cube; the full orders frame, qty_agg table and sales
+cube are only rebuilt when something reads them.
+"""
+import copy
+from collections import ChainMap
+
+import numpy as np
+import pandas as pd
+
+from analytics import build_sales_cube, merge_sales_cube
+from data_loader import QTY_GROUP_COLS, compact_orders, concat_orders
+from options_cache import json_etag
+
+
+SEGMENT_KEY_COLS = ["Category", "Sub-Category", "Region"]
+MONTHS = list(range(1, 13))
+# Ingested batches beyond this many are merged into one chunk (cost: the ingested rows only)
+MAX_ORDER_CHUNKS = 64
+# Copy-on-write layers over the lookup dicts before they are flattened into one dict
+MAX_OVERLAY_DEPTH = 16
+
+
+def grouped_options(orders: pd.DataFrame, key_col: str, value_col: str):
+    if key_col not in orders.columns or value_col not in orders.columns:
+        return {}
+    return {
+        str(key): sorted(values.dropna().unique().tolist())
+        for key, values in orders.groupby(key_col, observed=True)[value_col]
+    }
+
+
+def build_forecast_frames(orders: pd.DataFrame):
+    """
+    Precomputed monthly series per category (plus "All"), in the same column layout
+    as df, one row per month. forecast_sales aggregates these few rows instead of
+    re-scanning every order on each request.
+    """
+    if "Sales" not in orders.columns:
+        return {}
+    measures = [c for c in ("Sales", "Quantity", "Profit") if c in orders.columns]
+    month = orders["Order Date"].dt.to_period("M").dt.to_timestamp().rename("Order Date")
+
+    monthly = orders.groupby([orders["Category"], month], observed=True)[measures].sum().reset_index()
+    monthly["Category"] = monthly["Category"].astype(str)
+    frames = {
+        str(cat): series.reset_index(drop=True)
+        for cat, series in monthly.groupby("Category", sort=False)
+    }
+    total = monthly.groupby("Order Date")[measures].sum().reset_index()
+    total.insert(0, "Category", "All")
+    frames["All"] = total
+    return frames
+
+
+def _merge_forecast_frame(frame: pd.DataFrame, extra: pd.DataFrame) -> pd.DataFrame:
+    measures = [c for c in frame.columns if c not in ("Category", "Order Date")]
+    merged = pd.concat([frame, extra], ignore_index=True)
+    return merged.groupby(["Category", "Order Date"], as_index=False, sort=True)[measures].sum()
+
+
+def _month_sums(orders: pd.DataFrame):
+    """
+    (category, sub_category, region, year, month) -> (sum price, sum discount, count)
+    """
+    sums = orders.groupby(QTY_GROUP_COLS, observed=True).agg(
+        sum_price=("Unit Price", "sum"),
+        sum_disc=("Discount", "sum"),
+        count=("Discount", "count"),
+    )
+    return {
+        (cat, sub, reg, int(year), int(month)): (float(sp), float(sd), int(n))
+        for (year, month, cat, sub, reg), sp, sd, n in zip(
+            sums.index, sums["sum_price"], sums["sum_disc"], sums["count"]
+        )
+    }
+
+
+def _overlay(mapping):
+    """
+    Writable view of mapping for a new state: writes go to a new front dict and the
+    parent's dicts are shared, not copied. Past MAX_OVERLAY_DEPTH layers the view is
+    flattened into one dict, so lookups never walk more than that many.
+    """
+    if not isinstance(mapping, ChainMap):
+        return ChainMap({}, mapping)
+    if len(mapping.maps) >= MAX_OVERLAY_DEPTH:
+        return ChainMap({}, _flat(mapping))
+    return mapping.new_child()
+
+
+def _flat(mapping) -> dict:
+    if not isinstance(mapping, ChainMap):
+        return mapping
+    flat = {}
+    for layer in reversed(mapping.maps):
+        flat.update(layer)
+    return flat
+
+
+def _segment_mean(month_stats: dict, segment: tuple, months):
+    stats = [month_stats[segment + ym] for ym in sorted(months)]
+    return (
+        float(np.mean([s[0] for s in stats])),
+        float(np.mean([s[1] for s in stats])),
+        int(np.mean([s[2] for s in stats])),
+    )
+
+
+class FeatureContext:
+    """
+    What features.py needs to build model rows: the demand segment stats and the
+    sales time defaults. ServingState is one; feature_context() returns just these
+    (e.g. for worker processes that only build rows).
+    """
+
+    def __init__(self, month_stats: dict, segment_stats: dict, global_stats: tuple, sales_time_defaults: dict):
+        self.month_stats = month_stats
+        self.segment_stats = segment_stats
+        self.global_stats = global_stats
+        self.sales_time_defaults = sales_time_defaults
+
+    def segment_stats_for(self, category: str, sub_category: str, region: str, year: int, month: int):
+        """
+        Returns the aggregated numeric features used by the demand model:
+          Avg_UnitPrice, Avg_Discount, Orders_Count
+        Also returns stats_mode so you can verify if fallback is happening.
+        """
+
+        # 1) Exact match for that month/year/segment
+        stats = self.month_stats.get((category, sub_category, region, year, month))
+        if stats is not None:
+            return (*stats, "exact_month")
+
+        # 2) Segment fallback (same segment, any month/year)
+        stats = self.segment_stats.get((category, sub_category, region))
+        if stats is not None:
+            return (*stats, "segment_fallback")
+
+        # 3) Global fallback
+        return (*self.global_stats, "global_fallback")
+
+
+class ServingState(FeatureContext):
+    """
+    Read-only snapshot of the serving data. Build with ServingState.build().
+    """
+
+    @classmethod
+    def build(cls, orders: pd.DataFrame, qty_agg: pd.DataFrame, version: int = 0):
+        state = cls.__new__(cls)   # every attribute is set below
+        state.version = version
+        state.order_chunks = (orders,)
+        state.order_count = int(len(orders))
+        state._orders = orders
+        state._qty_agg = qty_agg
+        state._build_segment_index()
+        state._build_options()
+        state._set_latest_date(orders["Order Date"].dropna().max())
+        state.forecast_frames = build_forecast_frames(orders)
+        state.forecast_versions = {category: version for category in state.forecast_frames}
+        state._sales_cube = build_sales_cube(orders)
+        return state
+
+    # -----------------------------
+    # Orders + monthly segment stats table
+    # -----------------------------
+    @property
+    def orders(self) -> pd.DataFrame:
+        """
+        Every order: the loaded dataset plus the ingested batches, concatenated on
+        first use (segment forecast job, fast-path samples, forecast fallback).
+        """
+        if self._orders is None:
+            self._orders = concat_orders(self.order_chunks)
+        return self._orders
+
+    @property
+    def order_template(self) -> pd.DataFrame:
+        """
+        No rows, the columns and dtypes of orders (without building it).
+        """
+        return self.order_chunks[0].iloc[:0]
+
+    @property
+    def qty_agg(self) -> pd.DataFrame:
+        """
+        Monthly segment stats in build_qty_agg's layout, rebuilt from month_stats on
+        first use after an ingest.
+        """
+        if self._qty_agg is None:
+            # Same row order as build_qty_agg (sorted by QTY_GROUP_COLS)
+            self._qty_agg = compact_orders(pd.DataFrame(
+                sorted((year, month, cat, sub, reg, price, disc, count)
+                       for (cat, sub, reg, year, month), (price, disc, count) in self.month_stats.items()),
+                columns=QTY_GROUP_COLS + ["Avg_UnitPrice", "Avg_Discount", "Orders_Count"],
+            ))
+        return self._qty_agg
+
+    @property
+    def sales_cube(self) -> pd.DataFrame:
+        """
+        Sales cube of every order: the cube as of the last read plus the delta cube of
+        the cells touched since, merged on first use after an ingest.
+        """
+        if self._sales_cube is None:
+            self._sales_cube = merge_sales_cube(*self._cube_parts)
+        return self._sales_cube
+
+    # -----------------------------
+    # Demand segment stats
+    # -----------------------------
+    def _build_segment_index(self):
+        """
+        Precomputes everything segment_stats needs so a lookup is a dict access:
+          month_stats:   (category, sub_category, region, year, month) -> (price, discount, count)
+          segment_stats: (category, sub_category, region) -> mean of the monthly stats
+          global_stats:  order-level fallback (computed once instead of per request)
+        Running sums are kept next to them so ingestion can update single cells.
+        """
+        qty_agg, orders = self.qty_agg, self.orders
+
+        self.month_stats = {}
+        self.segment_months = {}
+        for cat, sub, reg, year, month, price, disc, count in zip(
+            qty_agg["Category"], qty_agg["Sub-Category"], qty_agg["Region"],
+            qty_agg["Order_Year"], qty_agg["Order_Month"],
+            qty_agg["Avg_UnitPrice"], qty_agg["Avg_Discount"], qty_agg["Orders_Count"],
+        ):
+            self.month_stats[(cat, sub, reg, int(year), int(month))] = (float(price), float(disc), int(count))
+            self.segment_months.setdefault((cat, sub, reg), set()).add((int(year), int(month)))
+        self.segment_months = {seg: frozenset(months) for seg, months in self.segment_months.items()}
+        self.month_sums = _month_sums(orders)
+
+        self.segment_stats = {}
+        for key, seg in qty_agg.groupby(SEGMENT_KEY_COLS, sort=False, observed=True):
+            self.segment_stats[key] = (
+                float(seg["Avg_UnitPrice"].mean()),
+                float(seg["Avg_Discount"].mean()),
+                int(seg["Orders_Count"].mean()),
+            )
+
+        self.global_sums = (float(orders["Unit Price"].sum()), float(orders["Discount"].sum()), int(len(orders)))
+        self.global_stats = (float(orders["Unit Price"].mean()), float(orders["Discount"].mean()), int(len(orders)))
+
+    def feature_context(self) -> FeatureContext:
+        """
+        This state's segment stats and sales time defaults only, as plain dicts
+        (no orders, cube or forecast series): small to pickle.
+        """
+        return FeatureContext(_flat(self.month_stats), _flat(self.segment_stats), self.global_stats,
+                              self.sales_time_defaults)
+
+    # -----------------------------
+    # Dropdown options + sales defaults
+    # -----------------------------
+    def _build_options(self):
+        orders = self.orders
+        self.categories = sorted(orders["Category"].dropna().unique().tolist())
+        self.subcategories = sorted(orders["Sub-Category"].dropna().unique().tolist())
+        self.regions = sorted(orders["Region"].dropna().unique().tolist())
+        self.cities = sorted(orders["City"].dropna().unique().tolist()) if "City" in orders.columns else []
+        self.years = sorted(orders["Order_Year"].unique().tolist())
+        self.months = MONTHS
+
+        # Options catalog: every dropdown list + dependent maps
+        self.options = {
+            "categories": self.categories,
+            "subcategories_by_category": grouped_options(orders, "Category", "Sub-Category"),
+            "regions": self.regions,
+            "cities": self.cities,
+            "cities_by_region": grouped_options(orders, "Region", "City"),
+            "years": self.years,
+            "months": self.months,
+        }
+        self.options_etag = json_etag(self.options)
+
+    def _merge_options(self, new_orders: pd.DataFrame):
+        """
+        _build_options for orders + new_orders, from the current lists and new_orders only.
+        """
+        def merged(values, extra):
+            return sorted(set(values) | set(extra.dropna().unique().tolist()))
+
+        def merged_groups(groups, key_col, value_col):
+            groups = dict(groups)
+            for key, values in grouped_options(new_orders, key_col, value_col).items():
+                groups[key] = sorted(set(groups.get(key, ())) | set(values))
+            return groups
+
+        self.categories = merged(self.categories, new_orders["Category"])
+        self.subcategories = merged(self.subcategories, new_orders["Sub-Category"])
+        self.regions = merged(self.regions, new_orders["Region"])
+        if "City" in new_orders.columns:
+            self.cities = merged(self.cities, new_orders["City"])
+        self.years = merged(self.years, new_orders["Order_Year"])
+        self.options = {
+            "categories": self.categories,
+            "subcategories_by_category": merged_groups(self.options["subcategories_by_category"],
+                                                       "Category", "Sub-Category"),
+            "regions": self.regions,
+            "cities": self.cities,
+            "cities_by_region": merged_groups(self.options["cities_by_region"], "Region", "City"),
+            "years": self.years,
+            "months": self.months,
+        }
+        self.options_etag = json_etag(self.options)
+
+    def _set_latest_date(self, latest_dt):
+        # Sales UI has no date inputs: Year/Month/Quarter come from the most recent order
+        self.latest_date = latest_dt
+        self.sales_time_defaults = {
+            "Order_Year": int(latest_dt.year),
+            "Order_Month": int(latest_dt.month),
+            "Order_Quarter": int(((latest_dt.month - 1) // 3) + 1),
+        }
+
+    # -----------------------------
+    # Live ingestion
+    # -----------------------------
+    def apply_orders(self, new_orders: pd.DataFrame):
+        """
+        Returns (new state, touched) with new_orders (already cleaned) appended.
+        Only the segment-months, segments, option lists and forecast series that the
+        new orders fall into are recomputed. touched has the affected "segments"
+        and "categories" and whether the options catalog changed.
+        """
+        state = copy.copy(self)
+        state.version = self.version + 1
+        chunks = self.order_chunks + (new_orders,)
+        if len(chunks) > MAX_ORDER_CHUNKS:
+            chunks = (chunks[0], concat_orders(chunks[1:]))
+        state.order_chunks = chunks
+        state.order_count = self.order_count + int(len(new_orders))
+        state._orders = None
+        state._qty_agg = None
+
+        # Running sums -> monthly segment stats for the touched cells
+        state.month_sums = _overlay(self.month_sums)
+        state.month_stats = _overlay(self.month_stats)
+        state.segment_months = _overlay(self.segment_months)
+        touched_segments = set()
+        for key, (sp, sd, n) in _month_sums(new_orders).items():
+            old_sp, old_sd, old_n = state.month_sums.get(key, (0.0, 0.0, 0))
+            sp, sd, n = old_sp + sp, old_sd + sd, old_n + n
+            state.month_sums[key] = (sp, sd, n)
+            state.month_stats[key] = (sp / n, sd / n, n)
+            segment = key[:3]
+            state.segment_months[segment] = state.segment_months.get(segment, frozenset()) | {key[3:]}
+            touched_segments.add(segment)
+
+        state.segment_stats = _overlay(self.segment_stats)
+        for segment in touched_segments:
+            state.segment_stats[segment] = _segment_mean(state.month_stats, segment, state.segment_months[segment])
+
+        sp, sd, n = self.global_sums
+        sp += float(new_orders["Unit Price"].sum())
+        sd += float(new_orders["Discount"].sum())
+        n += int(len(new_orders))
+        state.global_sums = (sp, sd, n)
+        state.global_stats = (sp / n, sd / n, n) if n else self.global_stats
+
+        # Options only change when a new category/sub-category/region/city/year shows up
+        options_changed = self._options_changed(new_orders)
+        if options_changed:
+            state._merge_options(new_orders)
+
+        latest = new_orders["Order Date"].dropna().max()
+        if pd.notna(latest) and latest > self.latest_date:
+            state._set_latest_date(latest)
+
+        # Forecast series: merge the new months into the touched categories + "All"
+        state.forecast_frames = _overlay(self.forecast_frames)
+        state.forecast_versions = _overlay(self.forecast_versions)
+        for category, extra in build_forecast_frames(new_orders).items():
+            frame = state.forecast_frames.get(category)
+            state.forecast_frames[category] = extra if frame is None else _merge_forecast_frame(frame, extra)
+            state.forecast_versions[category] = state.version
+
+        # Sales cube: only the touched cells go into the delta cube (the base is shared)
+        extra = build_sales_cube(new_orders)
+        if self._sales_cube is not None:
+            state._cube_parts = (self._sales_cube, extra)
+        else:
+            base, delta = self._cube_parts
+            state._cube_parts = (base, merge_sales_cube(delta, extra))
+        state._sales_cube = None
+
+        touched = {
+            "segments": touched_segments,
+            "categories": {segment[0] for segment in touched_segments},
+            "options_changed": options_changed,
+        }
+        return state, touched
+
+    def _options_changed(self, new_orders: pd.DataFrame) -> bool:
+        subs = self.options["subcategories_by_category"]
+        cities = self.options["cities_by_region"]
+        for cat, sub in zip(new_orders["Category"], new_orders["Sub-Category"]):
+            if sub not in subs.get(str(cat), ()):
+                return True
+        if "City" in new_orders.columns:
+            for reg, city in zip(new_orders["Region"], new_orders["City"]):
+                if city not in cities.get(str(reg), ()):
+                    return True
+        return not set(new_orders["Order_Year"].unique().tolist()) <= set(self.years)
@@ -18,18 +18,50 @@ document.addEventListener("DOMContentLoaded", () => {
   const dCategory = document.getElementById("d_category");
   const dSubcategory = document.getElementById("d_subcategory");
 
-  async function loadSubcategoriesForCategory(category, targetSelect) {
-    try {
-      const res = await fetch(
-        `/api/options/subcategories?category=${encodeURIComponent(category)}`
-      );
+  // Options catalog: fetched once, then sub-category changes are resolved locally
+  // (the browser revalidates it with ETag, so repeat visits get a 304)
+  let catalogPromise = null;
+
+  function loadOptionsCatalog() {
+    if (!catalogPromise) {
+      catalogPromise = fetch("/api/options")
+        .then((res) => {
+          if (!res.ok) {
+            throw new Error("Failed to fetch options catalog");
+          }
+          return res.json();
+        })
+        .catch((err) => {
+          console.error("Failed to load options catalog:", err);
+          catalogPromise = null;
+          return null;
+        });
+    }
+    return catalogPromise;
+  }
 
-      if (!res.ok) {
-        throw new Error("Failed to fetch subcategories");
-      }
+  async function fetchSubcategories(category) {
+    const catalog = await loadOptionsCatalog();
+    if (catalog && catalog.subcategories_by_category) {
+      return catalog.subcategories_by_category[category] || [];
+    }
 
-      const data = await res.json();
-      const subs = Array.isArray(data.subcategories) ? data.subcategories : [];
+    // Fallback: per-category endpoint
+    const res = await fetch(
+      `/api/options/subcategories?category=${encodeURIComponent(category)}`
+    );
+
+    if (!res.ok) {
+      throw new Error("Failed to fetch subcategories");
+    }
+
+    const data = await res.json();
+    return Array.isArray(data.subcategories) ? data.subcategories : [];
+  }
+
+  async function loadSubcategoriesForCategory(category, targetSelect) {
+    try {
+      const subs = await fetchSubcategories(category);
 
       // Replace options
       targetSelect.innerHTML = "";